@@ -20,7 +20,7 @@ import sys
 import os
 import signal
 import getopt
-import json
+import itertools
 import pprint
 import logging
 
@@ -74,6 +74,10 @@ def main():
         print('config_multi_vsys:', conf.config_multi_vsys(),
               file=sys.stderr)
 
+    if options['diff'] is not None:
+        conf_diff(conf, options)
+        sys.exit(0)
+
     if options['print_xml']:
         try:
             s = conf.xml(xpath=options['xpath'])
@@ -88,44 +92,28 @@ def main():
         xpaths = conf.config_xpaths()
         path = './'
         if options['xpath']:
-            o = conf_flat(conf, path, xpath=options['xpath'])
-            if o:
-                print('\n'.join(o))
+            conf_flat(conf, path, xpath=options['xpath'])
         elif conf.config_version() is None:
-            o = conf_flat(conf, path)
-            if o:
-                print('\n'.join(o))
+            conf_flat(conf, path)
         else:
             for xpath in xpaths:
-                o = conf_flat(conf, path, xpath=xpath)
-                if o:
-                    print('\n'.join(o))
+                conf_flat(conf, path, xpath=xpath)
 
     if options['print_set']:
         xpaths = conf.config_xpaths()
         path = 'set '
-        member_list = options['mlist']
-        if conf.config_version() is not None:
-            version = conf.config_version().split('.')
-            if int(version[0]) >= 5:  # XXX ValueError
-                member_list = True
+        member_list = set_member_list(conf, options)
         if options['xpath']:
-            o = conf_set(conf, path, xpath=options['xpath'],
-                         member_list=member_list)
-            if o:
-                print('\n'.join(o))
+            conf_set(conf, path, xpath=options['xpath'],
+                     member_list=member_list)
         elif conf.config_version() is None:
-            o = conf_set(conf, path)
-            if o:
-                print('\n'.join(o))
+            conf_set(conf, path)
         else:
             for xpath in xpaths:
-                o = conf_set(conf, path, xpath=xpath,
-                             member_list=member_list)
-                if o:
-                    print('\n'.join(o))
+                conf_set(conf, path, xpath=xpath,
+                         member_list=member_list)
 
-    if options['print_python'] or options['print_json']:
+    if options['print_python']:
         try:
             d = conf.python(xpath=options['xpath'])
         except pan.config.PanConfigError as msg:
@@ -133,35 +121,82 @@ def main():
             sys.exit(1)
 
         if d:
-            if options['print_python']:
-                print('var1 =', pprint.pformat(d))
-            if options['print_json']:
-                if options['compact']:
-                    print(json.dumps(d, separators=(',', ':')))
-                else:
-                    print(json.dumps(d, sort_keys=True, indent=2))
+            print('var1 =', pprint.pformat(d))
+
+    if options['print_json']:
+        if options['compact']:
+            kwargs = {'separators': (',', ':')}
+        else:
+            kwargs = {'sort_keys': True, 'indent': 2}
+        try:
+            if conf.dump_json(sys.stdout, xpath=options['xpath'],
+                              fast=options['fast_json'], **kwargs):
+                print()
+        except pan.config.PanConfigError as msg:
+            print('pan.config.PanConfigError:', msg, file=sys.stderr)
+            sys.exit(1)
+
+    if options['where'] is not None:
+        index = conf.index()
+        print_lines(x.xpath for x in index.lookup(options['where']))
+
+    if options['refs'] is not None:
+        index = conf.index()
+        print_lines(x.xpath for x in index.references(options['refs']))
 
     sys.exit(0)
 
 
-def conf_flat(conf, path, xpath=None):
+def set_member_list(conf, options):
+    member_list = options['mlist']
+    if conf.config_version() is not None:
+        version = conf.config_version().split('.')
+        if int(version[0]) >= 5:  # XXX ValueError
+            member_list = True
+
+    return member_list
+
+
+def conf_diff(conf, options):
+    xml = read_file(options['diff'])
+
     try:
-        o = conf.flat(path, xpath)
+        other = pan.config.PanConfig(config=xml)
     except pan.config.PanConfigError as msg:
         print('pan.config.PanConfigError:', msg, file=sys.stderr)
         sys.exit(1)
 
-    return o
+    if options['print_set']:
+        print_lines(conf.diff_set_cli(other,
+                                      set_member_list(conf, options)))
+    else:
+        print_lines(str(x) for x in conf.diff(other))
 
 
-def conf_set(conf, path, xpath=None, member_list=None):
+def print_lines(lines, n=1000):
+    # write lines as produced, n at a time
+    lines = iter(lines)
+    while True:
+        x = list(itertools.islice(lines, n))
+        if not x:
+            break
+        sys.stdout.write('\n'.join(x) + '\n')
+
+
+def conf_flat(conf, path, xpath=None):
     try:
-        o = conf.set_cli(path, xpath, member_list)
+        print_lines(conf.iter_flat(path, xpath))
     except pan.config.PanConfigError as msg:
         print('pan.config.PanConfigError:', msg, file=sys.stderr)
         sys.exit(1)
 
-    return o
+
+def conf_set(conf, path, xpath=None, member_list=None):
+    try:
+        print_lines(conf.iter_set_cli(path, xpath, member_list))
+    except pan.config.PanConfigError as msg:
+        print('pan.config.PanConfigError:', msg, file=sys.stderr)
+        sys.exit(1)
 
 
 def parse_opts():
@@ -174,6 +209,10 @@ def parse_opts():
         'print_set': False,
         'mlist': False,
         'compact': False,
+        'fast_json': False,
+        'diff': None,
+        'where': None,
+        'refs': None,
         'xpath': None,
         'debug': 0,
     }
@@ -181,7 +220,8 @@ def parse_opts():
     short_options = ''
     long_options = ['version', 'help', 'debug=',
                     'config=', 'xml', 'py', 'json', 'flat', 'set',
-                    'mlist', 'compact',
+                    'mlist', 'compact', 'fast-json',
+                    'where=', 'refs=', 'diff=',
                     ]
 
     try:
@@ -209,6 +249,14 @@ def parse_opts():
             options['mlist'] = True
         elif opt == '--compact':
             options['compact'] = True
+        elif opt == '--fast-json':
+            options['fast_json'] = True
+        elif opt == '--diff':
+            options['diff'] = arg
+        elif opt == '--where':
+            options['where'] = arg
+        elif opt == '--refs':
+            options['refs'] = arg
         elif opt == '--debug':
             try:
                 options['debug'] = int(arg)
@@ -260,6 +308,10 @@ def usage():
     --set                 print XML as set CLI
     --mlist               print set CLI members as a list
     --compact             print compactly
+    --fast-json           use orjson for JSON if available
+    --where name          print XPath of objects and rules named name
+    --refs name           print XPath of objects and rules using name
+    --diff path           print changes from config to XML config path
     --debug level         enable debug level up to 3
     --version             display version
     --help                display usage
@@ -17,21 +17,31 @@
 #
 
 from datetime import datetime
+import atexit
 import sys
 import os
 import getopt
+import functools
 import re
-import json
 import pprint
 import logging
 import ssl
 import signal
+import shlex
+import time
+import threading
+import queue
+import concurrent.futures
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
 import pan.xapi
 import pan.commit
 import pan.config
+import pan.fleet
+import pan.metrics
+import pan.ratelimit
+import pan.retry
 
 debug = 0
 
@@ -68,6 +78,35 @@ def main():
     else:
         ssl_context = None
 
+    hooks = []
+    if options['stats']:
+        metrics = pan.metrics.PanMetrics()
+        hooks.append(metrics)
+        atexit.register(print_stats, metrics)
+
+    retry = None
+    if options['retry'] is not None:
+        retry = pan.retry.PanRetry(retries=options['retry'],
+                                   breaker=pan.retry.PanCircuitBreaker())
+
+    rate_limit = None
+    if options['rate_file'] is not None and options['rate'] is None:
+        print('--rate-file requires --rate', file=sys.stderr)
+        sys.exit(1)
+    if options['rate'] is not None:
+        try:
+            rate_limit = pan.ratelimit.PanRateLimiter(
+                rate=options['rate'], path=options['rate_file'])
+        except pan.ratelimit.PanRateLimitError as msg:
+            print('pan.ratelimit.PanRateLimiter:', msg, file=sys.stderr)
+            sys.exit(1)
+
+    if options['batch'] is not None:
+        batch(options, ssl_context, hooks, retry, rate_limit)
+
+    if len(options['tags']) > 1 or len(options['serials']) > 1:
+        fleet(options, ssl_context, hooks, retry, rate_limit)
+
     try:
         xapi = pan.xapi.PanXapi(timeout=options['timeout'],
                                 tag=None if not options['tag']
@@ -80,7 +119,10 @@ def main():
                                 hostname=options['hostname'],
                                 port=options['port'],
                                 serial=options['serial'],
-                                ssl_context=ssl_context)
+                                ssl_context=ssl_context,
+                                hooks=hooks,
+                                retry=retry,
+                                rate_limit=rate_limit)
 
     except pan.xapi.PanXapiError as msg:
         print('pan.xapi.PanXapi:', msg, file=sys.stderr)
@@ -231,16 +273,20 @@ def main():
             action = 'export'
             if options['ad_hoc'] is not None:
                 extra_qs_used = True
+            # write attachment to file as it is received
+            file = functools.partial(attachment_path, options=options)
             if options['pcapid'] is not None:
                 xapi.export(category=options['export'],
                             pcapid=options['pcapid'],
                             search_time=options['stime'],
                             serialno=options['serial'],
-                            extra_qs=options['ad_hoc'])
+                            extra_qs=options['ad_hoc'],
+                            file=file)
             else:
                 xapi.export(category=options['export'],
                             from_name=options['src'],
-                            extra_qs=options['ad_hoc'])
+                            extra_qs=options['ad_hoc'],
+                            file=file)
             print_status(xapi, action)
             print_response(xapi, options)
             if options['pcap_listing']:
@@ -309,32 +355,7 @@ def main():
                 if options['cmd_xml']:
                     cmd = xapi.cmd_xml(cmd)
             else:
-                c = pan.commit.PanCommit(validate=options['validate'],
-                                         force=options['force'],
-                                         commit_all=options['commit_all'],
-                                         merge_with_candidate=
-                                         options['merge'])
-
-                for part in options['partial']:
-                    if part == 'device-and-network-excluded':
-                        c.device_and_network_excluded()
-                    elif part == 'policy-and-objects-excluded':
-                        c.policy_and_objects_excluded()
-                    elif part == 'shared-object-excluded':
-                        c.shared_object_excluded()
-                    elif part == 'no-vsys':
-                        c.no_vsys()
-                    elif part == 'vsys':
-                        c.vsys(options['vsys'])
-
-                if options['serial'] is not None:
-                    c.device(options['serial'])
-                if options['group'] is not None:
-                    c.device_group(options['group'])
-                if options['commit_all'] and options['vsys']:
-                    c.vsys(options['vsys'][0])
-
-                cmd = c.cmd()
+                cmd = commit_cmd(options)
 
             kwargs = {
                 'cmd': cmd,
@@ -369,6 +390,309 @@ def main():
     sys.exit(0)
 
 
+def fleet(options, ssl_context, hooks, retry, rate_limit):
+    if len(options['tags']) > 1 and len(options['serials']) > 1:
+        print('multiple -t and --serial not supported', file=sys.stderr)
+        sys.exit(1)
+
+    kwargs = {}
+    if options['ad_hoc'] is not None:
+        kwargs['extra_qs'] = options['ad_hoc']
+    if options['parallel'] is None:
+        options['parallel'] = pan.fleet._parallel
+
+    if options['show']:
+        action = 'show'
+        kwargs['xpath'] = options['xpath']
+    elif options['get']:
+        action = 'get'
+        kwargs['xpath'] = options['xpath']
+    elif options['op'] is not None:
+        action = 'op'
+        kwargs['cmd'] = options['op']
+        kwargs['cmd_xml'] = options['cmd_xml']
+        if len(options['vsys']):
+            kwargs['vsys'] = options['vsys'][0]
+    else:
+        print('multiple devices supported for -s, -g and -o',
+              file=sys.stderr)
+        sys.exit(1)
+
+    xapi_kwargs = {
+        'use_http': options['use_http'],
+        'use_get': options['use_get'],
+        'api_username': options['api_username'],
+        'api_password': options['api_password'],
+        'api_key': options['api_key'],
+        'hostname': options['hostname'],
+        'port': options['port'],
+        'ssl_context': ssl_context,
+        'keepalive': True,
+        'hooks': hooks,
+        'retry': retry,
+        'rate_limit': rate_limit,
+    }
+    if len(options['tags']) > 1:
+        tags = options['tags']
+        serials = None
+    else:
+        # Panorama to device redirection
+        tags = None
+        serials = options['serials']
+        if options['tag']:
+            xapi_kwargs['tag'] = options['tag']
+
+    try:
+        fleet = pan.fleet.PanFleet(tags=tags,
+                                   serials=serials,
+                                   parallel=options['parallel'],
+                                   timeout=options['timeout'],
+                                   **xapi_kwargs)
+    except pan.fleet.PanFleetError as msg:
+        print('pan.fleet.PanFleet:', msg, file=sys.stderr)
+        sys.exit(1)
+
+    status = 0
+    for result in fleet.run(action, **kwargs):
+        x = '%s: %s [%.3fs]' % (result.name, action, result.latency)
+        if result.xapi is None:
+            print('%s: pan.xapi.PanXapi: %s' % (x, result.error),
+                  file=sys.stderr)
+        else:
+            print_status(result.xapi, x, result.error)
+            print_response(result.xapi, options)
+            result.xapi.close()
+        if not result.ok:
+            status = 1
+
+    sys.exit(status)
+
+
+def commit_cmd(options):
+    c = pan.commit.PanCommit(validate=options['validate'],
+                             force=options['force'],
+                             commit_all=options['commit_all'],
+                             merge_with_candidate=options['merge'])
+
+    for part in options['partial']:
+        if part == 'device-and-network-excluded':
+            c.device_and_network_excluded()
+        elif part == 'policy-and-objects-excluded':
+            c.policy_and_objects_excluded()
+        elif part == 'shared-object-excluded':
+            c.shared_object_excluded()
+        elif part == 'no-vsys':
+            c.no_vsys()
+        elif part == 'vsys':
+            c.vsys(options['vsys'])
+
+    if options['serial'] is not None:
+        c.device(options['serial'])
+    if options['group'] is not None:
+        c.device_group(options['group'])
+    if options['commit_all'] and options['vsys']:
+        c.vsys(options['vsys'][0])
+
+    return c.cmd()
+
+
+def batch_lines(path):
+    # (lineno, action, args) for each line
+    batch_args = {
+        'op': (1, 1),
+        'show': (0, 1),
+        'get': (0, 1),
+        'set': (2, 2),
+        'edit': (2, 2),
+        'delete': (1, 1),
+        'commit': (0, 1),
+    }
+
+    if path == '-':
+        name = 'stdin'
+        lines = sys.stdin.readlines()
+    else:
+        name = path
+        try:
+            with open(path) as f:
+                lines = f.readlines()
+        except OSError as msg:
+            print('open %s: %s' % (path, msg), file=sys.stderr)
+            sys.exit(1)
+
+    actions = []
+    continued = ''
+    for lineno, line in enumerate(lines, 1):
+        # backslash at end of line continues the line
+        if line.rstrip('\r\n').endswith('\\'):
+            if not continued:
+                start = lineno
+            continued += line.rstrip('\r\n')[:-1]
+            continue
+        if continued:
+            line = continued + line
+            lineno = start
+            continued = ''
+
+        try:
+            args = shlex.split(line, comments=True)
+        except ValueError as msg:
+            print('%s:%d: %s' % (name, lineno, msg), file=sys.stderr)
+            sys.exit(1)
+        if not args:
+            continue
+
+        action = args.pop(0)
+        if action not in batch_args:
+            print('%s:%d: invalid action: %s' % (name, lineno, action),
+                  file=sys.stderr)
+            sys.exit(1)
+        min_args, max_args = batch_args[action]
+        if not min_args <= len(args) <= max_args:
+            print('%s:%d: %s: invalid number of arguments' %
+                  (name, lineno, action), file=sys.stderr)
+            sys.exit(1)
+        if action in ['set', 'edit']:
+            args[1] = get_element(args[1])
+
+        actions.append((lineno, action, args))
+
+    if continued:
+        print('%s:%d: unexpected end of file' % (name, start),
+              file=sys.stderr)
+        sys.exit(1)
+
+    return actions
+
+
+def batch_request(xapis, lock, line, options):
+    lineno, action, args = line
+    xapi = xapis.get()
+    error = None
+    start = time.monotonic()
+    try:
+        if action == 'op':
+            kwargs = {
+                'cmd': args[0],
+                'cmd_xml': options['cmd_xml'],
+            }
+            if len(options['vsys']):
+                kwargs['vsys'] = options['vsys'][0]
+            xapi.op(**kwargs)
+        elif action in ['show', 'get']:
+            getattr(xapi, action)(xpath=args[0] if args else None)
+        elif action in ['set', 'edit']:
+            getattr(xapi, action)(xpath=args[0], element=args[1])
+        elif action == 'delete':
+            xapi.delete(xpath=args[0])
+        elif action == 'commit':
+            if args:
+                cmd = args[0]
+                if options['cmd_xml']:
+                    cmd = xapi.cmd_xml(cmd)
+            else:
+                cmd = commit_cmd(options)
+            xapi.commit(cmd=cmd,
+                        sync=options['sync'],
+                        interval=options['interval'],
+                        timeout=options['job_timeout'])
+    except pan.xapi.PanXapiError as msg:
+        error = str(msg)
+
+    # print before the object is used for another request
+    with lock:
+        x = '%d: %s [%.3fs]' % (lineno, action, time.monotonic() - start)
+        print_status(xapi, x, error)
+        print_response(xapi, options)
+        sys.stdout.flush()
+    xapis.put(xapi)
+
+    return error is None
+
+
+def batch(options, ssl_context, hooks, retry, rate_limit):
+    if len(options['tags']) > 1 or len(options['serials']) > 1:
+        print('multiple -t and --serial not supported with --batch',
+              file=sys.stderr)
+        sys.exit(1)
+
+    lines = batch_lines(options['batch'])
+    parallel = options['parallel'] or 1
+
+    xapi_kwargs = {
+        'timeout': options['timeout'],
+        'tag': None if not options['tag'] else options['tag'],
+        'use_http': options['use_http'],
+        'use_get': options['use_get'],
+        'api_username': options['api_username'],
+        'api_password': options['api_password'],
+        'api_key': options['api_key'],
+        'hostname': options['hostname'],
+        'port': options['port'],
+        'serial': options['serial'],
+        'ssl_context': ssl_context,
+        'hooks': hooks,
+        'retry': retry,
+        'rate_limit': rate_limit,
+    }
+
+    try:
+        xapi = pan.xapi.PanXapi(keepalive=True, **xapi_kwargs)
+        xapis = queue.SimpleQueue()
+        xapis.put(xapi)
+        if parallel > 1:
+            # one API key and connection pool for all requests
+            if xapi.api_key is None:
+                xapi.keygen()
+            xapi_kwargs['api_key'] = xapi.api_key
+            for _ in range(parallel - 1):
+                xapis.put(pan.xapi.PanXapi(
+                    connection_pool=xapi.connection_pool, **xapi_kwargs))
+    except pan.xapi.PanXapiError as msg:
+        print('pan.xapi.PanXapi:', msg, file=sys.stderr)
+        sys.exit(1)
+
+    # op, show and get requests are performed concurrently until a
+    # configuration change or commit, which is performed after the
+    # previous requests complete
+    segments = []
+    for line in lines:
+        if (parallel > 1 and segments and
+                line[1] in ['op', 'show', 'get'] and
+                segments[-1][-1][1] in ['op', 'show', 'get']):
+            segments[-1].append(line)
+        else:
+            segments.append([line])
+
+    lock = threading.Lock()
+    done = 0
+    errors = 0
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=parallel) as executor:
+        for segment in segments:
+            futures = [executor.submit(batch_request, xapis, lock, x, options)
+                       for x in segment]
+            for future in futures:
+                done += 1
+                if not future.result():
+                    errors += 1
+            if errors:
+                break
+
+    print('batch: %d of %d requests %d errors [%.3fs]' %
+          (done, len(lines), errors, time.monotonic() - start),
+          file=sys.stderr)
+    xapi.close()
+
+    sys.exit(1 if errors else 0)
+
+
+def print_stats(metrics):
+    for x in metrics.summary():
+        print('stats: %s' % x, file=sys.stderr)
+
+
 def passwd_prompt():
     import getpass
 
@@ -430,6 +754,12 @@ def parse_opts():
         'stime': None,
         'pcapid': None,
         'api_key': None,
+        'parallel': None,
+        'batch': None,
+        'stats': False,
+        'retry': None,
+        'rate': None,
+        'rate_file': None,
         'cafile': None,
         'capath': None,
         'print_xml': False,
@@ -444,6 +774,8 @@ def parse_opts():
         'use_get': False,
         'debug': 0,
         'tag': None,
+        'tags': [],
+        'serials': [],
         'xpath': None,
         'element': None,
         'cmd': None,
@@ -462,7 +794,8 @@ def parse_opts():
                     'group=', 'merge', 'nlogs=', 'skip=', 'filter=',
                     'interval=', 'timeout=',
                     'stime=', 'pcapid=', 'text',
-                    'report=', 'name=',
+                    'report=', 'name=', 'parallel=', 'batch=',
+                    'stats', 'retry=', 'rate=', 'rate-file=',
                     ]
 
     try:
@@ -565,6 +898,7 @@ def parse_opts():
             options['port'] = arg
         elif opt == '--serial':
             options['serial'] = arg
+            options['serials'].append(arg)
         elif opt == '--group':
             options['group'] = arg
         elif opt == '--merge':
@@ -621,6 +955,31 @@ def parse_opts():
         elif opt == '-t':
             # allow '' to create tagname-less .panrc
             options['tag'] = arg
+            options['tags'].append(arg)
+        elif opt == '--parallel':
+            try:
+                options['parallel'] = int(arg)
+                if options['parallel'] < 1:
+                    raise ValueError
+            except ValueError:
+                print('Invalid parallel: %s' % arg, file=sys.stderr)
+                sys.exit(1)
+        elif opt == '--batch':
+            options['batch'] = arg
+        elif opt == '--stats':
+            options['stats'] = True
+        elif opt == '--retry':
+            try:
+                options['retry'] = int(arg)
+                if options['retry'] < 0:
+                    raise ValueError
+            except ValueError:
+                print('Invalid retry: %s' % arg, file=sys.stderr)
+                sys.exit(1)
+        elif opt == '--rate':
+            options['rate'] = arg
+        elif opt == '--rate-file':
+            options['rate_file'] = arg
         elif opt == '-T':
             options['timeout'] = arg
         elif opt == '--version':
@@ -727,7 +1086,7 @@ def print_status(xapi, action, exception_msg=None):
     print(file=sys.stderr)
 
 
-def xml_python(xapi, result=False):
+def xml_config(xapi, result=False):
     xpath = None
     if result:
         if (xapi.element_result is None or
@@ -747,8 +1106,7 @@ def xml_python(xapi, result=False):
         print('pan.config.PanConfigError:', msg, file=sys.stderr)
         sys.exit(1)
 
-    d = conf.python(xpath)
-    return d
+    return conf, xpath
 
 
 def print_response(xapi, options):
@@ -761,22 +1119,23 @@ def print_response(xapi, options):
             print(s.lstrip('\r\n').rstrip())
 
     if options['print_python'] or options['print_json']:
-        d = xml_python(xapi, options['print_result'])
-        if d:
+        x = xml_config(xapi, options['print_result'])
+        if x is not None:
+            conf, xpath = x
             if options['print_python']:
-                print('var1 =', pprint.pformat(d))
+                d = conf.python(xpath)
+                if d:
+                    print('var1 =', pprint.pformat(d))
             if options['print_json']:
-                print(json.dumps(d, sort_keys=True,
-                                 separators=(',', ': '), indent=2))
+                if conf.dump_json(sys.stdout, xpath, sort_keys=True,
+                                  separators=(',', ': '), indent=2):
+                    print()
 
     if options['print_text'] and xapi.text_document is not None:
         print(xapi.text_document, end='')
 
 
-def save_attachment(xapi, options):
-    if xapi.export_result is None:
-        return
-
+def attachment_path(filename, options):
     if options['src'] is not None:
         # pcap
         src_dir, src_file = os.path.split(options['src'])
@@ -784,7 +1143,7 @@ def save_attachment(xapi, options):
         # 6.0 threat-pcap
         # device-state
         src_dir = None
-        src_file = xapi.export_result['file']
+        src_file = filename
 
     path = ''
     path_done = False
@@ -807,26 +1166,30 @@ def save_attachment(xapi, options):
                     # fallthrough, return on open fail
         path = os.path.join(path, src_file)
 
-    try:
-        f = open(path, 'wb')
-    except OSError as msg:
-        print('open %s: %s' % (path, msg), file=sys.stderr)
-        return
+    return path
 
-    try:
-        f.write(xapi.export_result['content'])
-    except OSError as msg:
-        print('write %s: %s' % (path, msg), file=sys.stderr)
-        f.close()
+
+def save_attachment(xapi, options):
+    if xapi.export_result is None:
         return
 
-    f.close()
-    print('exported %s: %s' % (xapi.export_result['category'], path),
+    print('exported %s: %s' % (xapi.export_result['category'],
+                               xapi.export_result['path']),
           file=sys.stderr)
+    if options['debug'] > 0:
+        print('%d bytes %.3fs %.0f bytes/s' %
+              (xapi.export_result['bytes'],
+               xapi.export_result['elapsed'],
+               xapi.export_result['throughput']),
+              file=sys.stderr)
 
 
 def pcap_listing(xapi, category):
-    d = xml_python(xapi, result=True)
+    d = None
+    x = xml_config(xapi, result=True)
+    if x is not None:
+        conf, xpath = x
+        d = conf.python(xpath)
 
     if d and 'dir-listing' in d:
         pcap_listing = d['dir-listing']
@@ -910,7 +1273,7 @@ def usage():
     -h hostname
     -P port               URL port number
     --serial number       serial number for Panorama redirection/
-                          commit-all/threat-pcap
+                          commit-all/threat-pcap (multiple for fleet)
     --group name          device group for commit-all
     --merge               merge with candidate for commit-all
     --nlogs num           retrieve num logs
@@ -932,14 +1295,22 @@ def usage():
     -H                    use http URL scheme (default https)
     -G                    use HTTP GET method (default POST)
     -D                    enable debug (multiple up to -DDD)
-    -t tag                .panrc tagname
+    -t tag                .panrc tagname (multiple for fleet)
     -T seconds            urlopen() timeout
+    --parallel num        fleet requests in parallel (default %d)
+                          batch requests in parallel (default 1)
+    --batch path          perform requests in file (- for stdin)
+    --stats               print request statistics at exit
+    --retry num           retry failed requests num times
+    --rate num            limit requests per second per host
+    --rate-file path      share --rate limit with other processes
     --cafile path         file containing CA certificates
     --capath path         directory of hashed certificate files
     --version             display version
     --help                display usage
 '''
-    print(usage % os.path.basename(sys.argv[0]), end='')
+    print(usage % (os.path.basename(sys.argv[0]), pan.fleet._parallel),
+          end='')
 
 
 if __name__ == '__main__':
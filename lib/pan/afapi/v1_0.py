@@ -63,7 +63,9 @@ class PanAFapi:
                  api_key=None,
                  timeout=None,
                  verify_cert=True,
-                 sleeper=None):
+                 sleeper=None,
+                 retry=None,
+                 rate_limit=None):
         self._log = logging.getLogger(__name__).log
         self.api_version = api_version
         self.panrc_tag = panrc_tag
@@ -72,6 +74,8 @@ class PanAFapi:
         self.timeout = timeout
         self.verify_cert = verify_cert
         self.sleeper = _Sleeper if sleeper is None else sleeper
+        self.retry = retry
+        self.rate_limit = rate_limit
 
         self._log(DEBUG3, 'Python version: %s', sys.version)
         self._log(DEBUG3, 'ssl: %s', ssl.OPENSSL_VERSION)
@@ -105,7 +109,10 @@ class PanAFapi:
 
         try:
             self.http = pan.http.PanHttp(timeout=self.timeout,
-                                         verify_cert=self.verify_cert)
+                                         verify_cert=self.verify_cert,
+                                         retry=self.retry,
+                                         rate_limit=self.rate_limit,
+                                         api_key=self.api_key)
         except pan.http.PanHttpError as e:
             raise PanAFapiError(e)
 
@@ -14,14 +14,35 @@
 # OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
 #
 
+import hashlib
+import heapq
+import json
 import sys
 import logging
-import xml.etree.ElementTree as etree
 
 from . import __version__, DEBUG1, DEBUG2, DEBUG3
+import pan.etree
+
+try:
+    import orjson
+    _have_orjson = True
+except ImportError:
+    _have_orjson = False
 
 _encoding = 'utf-8'
 _tags_forcelist = set(['entry', 'member'])
+_json_chunk = 1000
+_json_end = object()
+_index_types = [
+    'address',
+    'address-group',
+    'service',
+    'service-group',
+    'application-group',
+    'tag',
+]
+_index_rulebases = ['rulebase', 'pre-rulebase', 'post-rulebase']
+_shared = 'shared'
 
 
 class PanConfigError(Exception):
@@ -31,40 +52,55 @@ class PanConfigError(Exception):
 class PanConfig:
     def __init__(self,
                  config=None,
-                 tags_forcelist=_tags_forcelist):
-        self._log = logging.getLogger(__name__).log
+                 tags_forcelist=_tags_forcelist,
+                 xml_backend=None):
+        self._logger = logging.getLogger(__name__)
+        self._log = self._logger.log
         self._config_version = 0  # 0 indicates not yet set
         self._config_panorama = None
         self._config_multi_vsys = None
-
-        self._log(DEBUG3, 'Python version: %s', sys.version)
-        self._log(DEBUG3, 'xml.etree.ElementTree version: %s', etree.VERSION)
-        self._log(DEBUG3, 'pan-python version: %s', __version__)
+        self._index = None
+        self._digests = None
 
         if config is None:
             raise PanConfigError('no config')
 
+        element = config if hasattr(config, 'tag') else None
+        try:
+            self._etree = pan.etree.backend(xml_backend, element)
+        except pan.etree.PanEtreeError as msg:
+            raise PanConfigError(msg)
+        self.xml_backend = self._etree.name
+
+        self._log(DEBUG3, 'Python version: %s', sys.version)
+        self._log(DEBUG3, 'XML backend: %s', self._etree)
+        self._log(DEBUG3, 'pan-python version: %s', __version__)
+
         self._log(DEBUG2, '%s', type(config))
 
-        if hasattr(config, 'tag'):
-            self.config_root = config
+        if element is not None:
+            self.config_root = element
         else:
             try:
-                self.config_root = etree.fromstring(config)
-            except etree.ParseError as msg:
-                raise PanConfigError('ElementTree.fromstring ParseError: %s'
-                                     % msg)
+                self.config_root = self._etree.fromstring(config)
+            except self._etree.ParseError as msg:
+                raise PanConfigError('%s.fromstring ParseError: %s' %
+                                     (self._etree.module, msg))
         self._log(DEBUG1, 'config_root: %s', self.config_root)
 
     def __find_xpath(self, xpath=None):
-# Not a true Xpath
+# XPath 1.0 using lxml, otherwise the ElementTree subset:
 # http://docs.python.org/dev/library/xml.etree.elementtree.html#xpath-support
         self._log(DEBUG1, 'xpath: %s', xpath)
         if xpath:
             try:
-                nodes = self.config_root.findall(xpath)
-            except SyntaxError as msg:
-                raise PanConfigError('ElementTree.find SyntaxError: %s' % msg)
+                nodes = self._etree.findall(self.config_root, xpath)
+            except pan.etree.PanEtreeError as msg:
+                raise PanConfigError(msg)
+            except self._etree.XPathError as msg:
+                raise PanConfigError('%s XPath %s: %s' %
+                                     (self._etree.module,
+                                      type(msg).__name__, msg))
         else:
             nodes = [self.config_root]
 
@@ -72,6 +108,40 @@ class PanConfig:
 
         return nodes
 
+    def xpath(self, xpath, **variables):
+        """Evaluate XPath expression xpath using the config root as
+        the context node.
+
+        The result is a list of elements or strings, or a string,
+        number or boolean.  variables are XPath variable values,
+        which allows a compiled expression to be reused with
+        different values.  Full XPath 1.0 requires the lxml backend;
+        otherwise the ElementTree XPath subset is supported.
+        """
+
+        try:
+            x = self._etree.xpath(self.config_root, xpath, **variables)
+        except pan.etree.PanEtreeError as msg:
+            raise PanConfigError(msg)
+        except self._etree.XPathError as msg:
+            raise PanConfigError('%s XPath %s: %s' %
+                                 (self._etree.module,
+                                  type(msg).__name__, msg))
+
+        return x
+
+    def index(self):
+        """Return the PanConfigIndex object for the configuration.
+
+        The index is built on first use and cached; changes to
+        config_root after it is built are not reflected.
+        """
+
+        if self._index is None:
+            self._index = PanConfigIndex(self)
+
+        return self._index
+
     def config_version(self):
         if self._config_version != 0:
             return self._config_version
@@ -121,16 +191,12 @@ class PanConfig:
         if not nodes:
             return None
 
-        s = ''.encode()
-        for elem in nodes:
-            s += etree.tostring(elem, encoding=_encoding)
+        s = ''.join(self._etree.tostring(elem) for elem in nodes)
 
         if not s:
             return None
 
-        self._log(DEBUG3, 'xml: %s', type(s))
-        self._log(DEBUG3, 'xml.decode(): %s', type(s.decode(_encoding)))
-        return s.decode(_encoding)
+        return s
 
     def python(self, xpath=None):
         nodes = self.__find_xpath(xpath)
@@ -147,45 +213,70 @@ class PanConfig:
         return d
 
     def __serialize_py(self, elem, obj, forcelist=False):
+        # Iterative, using a stack of child iterators, with one pass
+        # over the children of each element.  A tag is a list when it
+        # is in _tags_forcelist or occurs more than once; the value
+        # for the first occurrence is moved to a list when the tag is
+        # seen again.
+        debug = self._logger.isEnabledFor(DEBUG3)
+        stack = []
+
+        if forcelist:
+            obj.setdefault(elem.tag, []).append(
+                self.__serialize_py_value(elem, True, stack, debug))
+        else:
+            obj[elem.tag] = self.__serialize_py_value(elem, False, stack,
+                                                      debug)
+
+        while stack:
+            children, obj, first = stack[-1]
+            e = next(children, None)
+            if e is None:
+                stack.pop()
+                continue
+
+            tag = e.tag
+            if tag in _tags_forcelist:
+                obj.setdefault(tag, []).append(
+                    self.__serialize_py_value(e, True, stack, debug))
+            elif tag not in first:
+                first[tag] = e
+                obj[tag] = self.__serialize_py_value(e, False, stack, debug)
+            else:
+                if first[tag] is not None:
+                    x = obj[tag]
+                    if not isinstance(x, dict):
+                        # leaf value differs for forcelist
+                        x = self.__serialize_py_value(first[tag], True,
+                                                      stack, debug)
+                    obj[tag] = [x]
+                    first[tag] = None
+                obj[tag].append(
+                    self.__serialize_py_value(e, True, stack, debug))
+
+    def __serialize_py_value(self, elem, forcelist, stack, debug):
         tag = elem.tag
         text = elem.text
-        tail = elem.tail  # unused
         text_strip = None
         if text:
             text_strip = text.strip()
         attrs = elem.items()
 
-        self._log(DEBUG3, 'TAG(forcelist=%s): "%s"', forcelist, tag)
-
-        if forcelist:
-            if tag not in obj:
-                obj[tag] = []
-            if not len(elem) and not text_strip and not attrs:
-                obj[tag].append(None)
-                return
-            if not len(elem) and text_strip and not attrs:
-                obj[tag].append(text)
-                return
-
-            obj[tag].append({})
-            o = obj[tag][-1]
-
-        else:
-            if not len(elem) and not text_strip and not attrs:
-                obj[tag] = None
-                return
-            if not len(elem) and text_strip and not attrs:
-                if text_strip == 'yes':
-                    obj[tag] = True
-                elif text_strip == 'no':
-                    obj[tag] = False
-                else:
-                    obj[tag] = text
-                return
-
-            obj[tag] = {}
-            o = obj[tag]
-
+        if debug:
+            self._log(DEBUG3, 'TAG(forcelist=%s): "%s"', forcelist, tag)
+
+        if not len(elem) and not attrs:
+            if not text_strip:
+                return None
+            if forcelist:
+                return text
+            if text_strip == 'yes':
+                return True
+            if text_strip == 'no':
+                return False
+            return text
+
+        o = {}
         for k, v in attrs:
 #            o['@' + k] = v
             o[k] = v
@@ -194,65 +285,241 @@ class PanConfig:
             o[tag] = text
 
         if len(elem):
+            stack.append((iter(elem), o, {}))
+
+        return o
+
+    def iter_json(self, xpath=None, sort_keys=False, indent=None,
+                  separators=None, fast=False):
+        """Return a generator which yields the JSON encoding of the
+        python() object as it is produced, or None when xpath does
+        not match.
+
+        The output is the same as json.dumps() of the python()
+        object with the same sort_keys, indent and separators
+        arguments, but it is encoded directly from the element tree
+        without creating the object.  When fast is True and the
+        orjson package is installed, python() is encoded using
+        orjson, which is faster but not incremental; non-ASCII
+        characters are not escaped, and indent must be None or 2
+        with the default separators.
+        """
+
+        nodes = self.__find_xpath(xpath)
+        if not nodes:
+            return None
+
+        if fast and _have_orjson:
+            option = self.__orjson_option(sort_keys, indent, separators)
+            if option is not None:
+                return self.__iter_orjson(xpath, option)
+
+        return self.__iter_json(nodes, sort_keys, indent, separators)
+
+    def dump_json(self, file, xpath=None, **kwargs):
+        """Write iter_json() output to file object file.  Return
+        False when xpath does not match."""
+
+        chunks = self.iter_json(xpath, **kwargs)
+        if chunks is None:
+            return False
+        for x in chunks:
+            file.write(x)
+        return True
+
+    @staticmethod
+    def __orjson_option(sort_keys, indent, separators):
+        # orjson supports compact and 2 space indent output
+        option = orjson.OPT_SORT_KEYS if sort_keys else 0
+        if indent is None:
+            if separators is not None and tuple(separators) == (',', ':'):
+                return option
+        elif indent in [2, '  ']:
+            if separators is None or tuple(separators) == (',', ': '):
+                return option | orjson.OPT_INDENT_2
+        return None
+
+    def __iter_orjson(self, xpath, option):
+        yield orjson.dumps(self.python(xpath), option=option).decode()
+
+    def __iter_json(self, nodes, sort_keys, indent, separators):
+        # Iterative encoder using a stack of (iterator, is_dict)
+        # containers with the same output as json.dumps().  An
+        # element value is encoded from the element using the
+        # python() rules, and child elements are grouped by tag.
+        encode = json.encoder.encode_basestring_ascii
+        if indent is not None and not isinstance(indent, str):
+            indent = ' ' * indent
+        if separators is not None:
+            item_separator, key_separator = separators
+        elif indent is not None:
+            item_separator, key_separator = ',', ': '
+        else:
+            item_separator, key_separator = ', ', ': '
+
+        def value(elem, forcelist):
+            # encoded leaf value, or items of object
+            attrs = elem.items()
+            if not len(elem) and not attrs:
+                text = elem.text
+                text_strip = None
+                if text:
+                    text_strip = text.strip()
+                if not text_strip:
+                    return 'null'
+                if not forcelist:
+                    if text_strip == 'yes':
+                        return 'true'
+                    if text_strip == 'no':
+                        return 'false'
+                return encode(text)
+
+            # later values replace earlier values for the same key
+            d = {}
+            for k, v in attrs:
+                d[k] = encode(v)
+            text = elem.text
+            if text and text.strip():
+                d[elem.tag] = encode(text)
             tags = {}
             for e in elem:
-                if e.tag in tags:
-                    tags[e.tag] += 1
+                x = tags.get(e.tag)
+                if x is None:
+                    tags[e.tag] = [e]
                 else:
-                    tags[e.tag] = 1
-            for e in elem:
-                forcelist = False
-                if e.tag in _tags_forcelist or tags[e.tag] > 1:
-                    forcelist = True
-                self.__serialize_py(e, o, forcelist)
+                    x.append(e)
+            for tag, x in tags.items():
+                if tag in _tags_forcelist or len(x) > 1:
+                    d[tag] = x
+                else:
+                    d[tag] = (x[0], False)
+            return items(d)
+
+        def items(d):
+            if sort_keys:
+                return iter(sorted(d.items(), key=lambda x: x[0]))
+            return iter(d.items())
+
+        d = {}
+        for elem in nodes:
+            d[elem.tag] = (elem, False)
+        stack = [(items(d), True)]
+        out = ['{']
+        first = True
+
+        while stack:
+            it, is_dict = stack[-1]
+            x = next(it, _json_end)
+            if x is _json_end:
+                stack.pop()
+                if not first and indent is not None:
+                    out.append('\n' + indent * len(stack))
+                out.append('}' if is_dict else ']')
+                first = False
+                if len(out) > _json_chunk:
+                    yield ''.join(out)
+                    out = []
+                continue
+
+            if first:
+                first = False
+            else:
+                out.append(item_separator)
+            if indent is not None:
+                out.append('\n' + indent * len(stack))
+
+            if is_dict:
+                k, v = x
+                out.append(encode(k))
+                out.append(key_separator)
+            else:
+                v = x
+
+            if isinstance(v, tuple):
+                v = value(*v)
+            elif isinstance(v, list):
+                # forcelist elements
+                out.append('[')
+                stack.append((iter([(e, True) for e in v]), False))
+                first = True
+                continue
+
+            if isinstance(v, str):
+                out.append(v)
+            else:
+                out.append('{')
+                stack.append((v, True))
+                first = True
+
+        yield ''.join(out)
 
     def flat(self, path, xpath=None):
         nodes = self.__find_xpath(xpath)
         if not nodes:
             return None
 
-        obj = []
-        for elem in nodes:
-            self.__serialize_flat(elem, path + elem.tag, obj)
+        return list(self.__iter_flat(nodes, path))
 
-        return obj
+    def iter_flat(self, path, xpath=None):
+        """Like flat(), but return a generator which yields each
+        line as it is produced."""
 
-    def __serialize_flat(self, elem, path, obj):
-        tag = elem.tag
-        text = elem.text
-        tail = elem.tail  # unused
-        text_strip = None
-        if text:
-            text_strip = text.strip()
-        attrs = elem.items()
+        nodes = self.__find_xpath(xpath)
+        return self.__iter_flat(nodes, path)
 
-        self._log(DEBUG3, 'TAG(elem=%d): "%s"', len(elem), tag)
-        self._log(DEBUG3, 'text_strip: "%s"', text_strip)
-        self._log(DEBUG3, 'attrs: %s', attrs)
-        self._log(DEBUG3, 'path: "%s"', path)
-        self._log(DEBUG3, 'obj: %s', obj)
-        self._log(DEBUG3, '')
-
-        if not text_strip:
-            obj.append(path)
-        elif text_strip:
-            lines = text.splitlines()
-            if len(lines) > 1:
-                n = 1
-                for line in lines:
-                    s = path + '[%d]="%s"' % (n, line)
-                    obj.append(s)
-                    n += 1
+    def __iter_flat(self, nodes, path):
+        for elem in nodes:
+            yield from self.__serialize_flat(elem, path + elem.tag)
+
+    def __serialize_flat(self, elem, path):
+        # Iterative pre-order traversal using a stack of child
+        # iterators; the path of an element, including its attribute
+        # predicates, is the prefix for the path of each child.
+        debug = self._logger.isEnabledFor(DEBUG3)
+        stack = []
+
+        while True:
+            text = elem.text
+            text_strip = None
+            if text:
+                text_strip = text.strip()
+            attrs = elem.items()
+
+            if debug:
+                self._log(DEBUG3, 'TAG(elem=%d): "%s"', len(elem), elem.tag)
+                self._log(DEBUG3, 'text_strip: "%s"', text_strip)
+                self._log(DEBUG3, 'attrs: %s', attrs)
+                self._log(DEBUG3, 'path: "%s"', path)
+                self._log(DEBUG3, '')
+
+            if not text_strip:
+                yield path
             else:
-                s = path + '="%s"' % text
-                obj.append(s)
+                lines = text.splitlines()
+                if len(lines) > 1:
+                    n = 1
+                    for line in lines:
+                        yield path + '[%d]="%s"' % (n, line)
+                        n += 1
+                else:
+                    yield path + '="%s"' % text
 
-        for k, v in attrs:
-            path += "[@%s='%s']" % (k, v)
-            obj.append(path)
+            for k, v in attrs:
+                path += "[@%s='%s']" % (k, v)
+                yield path
 
-        for e in elem:
-            self.__serialize_flat(e, path + '/' + e.tag, obj)
+            if len(elem):
+                stack.append((iter(elem), path + '/'))
+
+            while stack:
+                children, path = stack[-1]
+                elem = next(children, None)
+                if elem is not None:
+                    path += elem.tag
+                    break
+                stack.pop()
+            else:
+                break
 
     def __quote_arg(self, s):
         # XXX string with " etc.
@@ -267,55 +534,239 @@ class PanConfig:
         if not nodes:
             return None
 
-        obj = []
-        for elem in nodes:
-            self.__serialize_set_cli(elem, path + elem.tag, obj,
-                                     member_list)
+        return list(self.__iter_set_cli(nodes, path, member_list))
 
-        return obj
+    def iter_set_cli(self, path, xpath=None, member_list=False):
+        """Like set_cli(), but return a generator which yields each
+        line as it is produced."""
 
-    def __serialize_set_cli(self, elem, path, obj, member_list=False):
-        tag = elem.tag
-        text = elem.text
-        tail = elem.tail  # unused
-        text_strip = None
-        if text:
-            text_strip = text.strip()
-        attrs = elem.items()
-
-        self._log(DEBUG3, 'TAG(elem=%d member_list=%s): "%s"',
-                  len(elem), member_list, tag)
-        self._log(DEBUG3, 'text_strip: "%s"', text_strip)
-        self._log(DEBUG3, 'attrs: %s', attrs)
-        self._log(DEBUG3, 'path: "%s"', path)
-        self._log(DEBUG3, 'obj: %s', obj)
-        self._log(DEBUG3, '')
+        nodes = self.__find_xpath(xpath)
+        return self.__iter_set_cli(nodes, path, member_list)
 
-        for k, v in attrs:
-            if k == 'name':
-                path += ' ' + self.__quote_arg(v)
+    def __iter_set_cli(self, nodes, path, member_list):
+        for elem in nodes:
+            yield from self.__serialize_set_cli(elem, path + elem.tag,
+                                                member_list)
+
+    def __serialize_set_cli(self, elem, path, member_list=False):
+        # Iterative pre-order traversal using a stack of child
+        # iterators; the command of an element is the prefix for the
+        # command of each child.
+        debug = self._logger.isEnabledFor(DEBUG3)
+        stack = []
+
+        while True:
+            if debug:
+                text = elem.text
+                self._log(DEBUG3, 'TAG(elem=%d member_list=%s): "%s"',
+                          len(elem), member_list, elem.tag)
+                self._log(DEBUG3, 'text_strip: "%s"',
+                          text.strip() if text else None)
+                self._log(DEBUG3, 'attrs: %s', elem.items())
+                self._log(DEBUG3, 'path: "%s"', path)
+                self._log(DEBUG3, '')
+
+            name = elem.get('name')
+            if name is not None:
+                path += ' ' + self.__quote_arg(name)
+
+            members = None
+            if member_list:
+                nodes = [e for e in elem if e.tag == 'member']
+                if debug:
+                    self._log(DEBUG3, 'TAG(members=%d): "%s"',
+                              len(nodes), elem.tag)
+                if len(nodes) > 1:
+                    members = [self.__quote_arg(e.text) for e in nodes]
+
+            if members is not None:
+                yield path + ' [ ' + ' '.join(members) + ' ]'
+            elif not len(elem):
+                text = elem.text
+                if text and text.strip():
+                    yield path + ' ' + self.__quote_arg(text)
+                else:
+                    yield path
+            else:
+                stack.append((iter(elem), path))
 
-        if member_list:
-            nodes = elem.findall('./member')
-            self._log(DEBUG3, 'TAG(members=%d): "%s"', len(nodes), tag)
-            if len(nodes) > 1:
-                members = []
-                for e in nodes:
-                    members.append(self.__quote_arg(e.text))
-                path += ' [ ' + ' '.join(members) + ' ]'
-                obj.append(path)
-                return
-
-        if not len(elem):
-            if text_strip:
-                path += ' ' + self.__quote_arg(text)
-            obj.append(path)
-
-        for e in elem:
-            tpath = path
-            if e.tag not in ['entry', 'member']:
-                tpath += ' ' + e.tag
-            self.__serialize_set_cli(e, tpath, obj, member_list)
+            while stack:
+                children, path = stack[-1]
+                elem = next(children, None)
+                if elem is not None:
+                    if elem.tag not in ('entry', 'member'):
+                        path += ' ' + elem.tag
+                    break
+                stack.pop()
+            else:
+                break
+
+    def __digest_tree(self):
+        # Digest of each element with children, computed in one
+        # iterative post-order pass and cached.  Leaf elements are
+        # hashed into the digest of their parent.
+        if self._digests is not None:
+            return self._digests
+
+        digests = {}
+        stack = [(self.config_root, iter(self.config_root), [])]
+
+        while stack:
+            elem, children, parts = stack[-1]
+            for child in children:
+                if len(child):
+                    stack.append((child, iter(child), []))
+                    break
+                if isinstance(child.tag, str):
+                    parts.append(_diff_leaf(child))
+            else:
+                stack.pop()
+                parts.append(_diff_node(elem))
+                x = hashlib.blake2b(''.join(parts).encode(),
+                                    digest_size=16).digest()
+                digests[elem] = x
+                if stack:
+                    stack[-1][2].append(x.hex())
+
+        self._log(DEBUG1, 'digests: %d', len(digests))
+        self._digests = digests
+
+        return digests
+
+    def diff(self, other):
+        """Return a list of PanConfigChange objects which change the
+        configuration to the PanConfig object other.
+
+        entry elements are matched by name and member elements by
+        text.  A digest of each subtree is used to skip subtrees
+        which are the same; the digests are computed once for each
+        PanConfig object.  The order of rules is compared, and other
+        entry order is ignored.
+
+        The changes are ordered by order_changes(), so objects are
+        deleted after the changes which remove references to them.
+        """
+
+        a_digests = self.__digest_tree()
+        b_digests = other.__digest_tree()
+        changes = []
+
+        root = self.config_root
+        if a_digests[root] == b_digests[other.config_root]:
+            return changes
+
+        stack = [(root, other.config_root, '/' + root.tag, [])]
+        while stack:
+            a, b, xpath, cli = stack.pop()
+            a_children = _diff_children(a)
+            b_children = _diff_children(b)
+            changed = []
+            replaced = set()
+
+            for key, x in a_children.items():
+                if key not in b_children:
+                    changes.append(PanConfigChange(
+                        op='delete', xpath=xpath + '/' + _diff_xpath(key),
+                        elem=x, cli=cli + [self.__diff_cli(key)]))
+
+            for key, y in b_children.items():
+                x = a_children.get(key)
+                if x is not None:
+                    if len(x) and len(y):
+                        if a_digests[x] != b_digests[y]:
+                            changed.append((key, x, y))
+                        continue
+                    if len(x) and not (y.text and y.text.strip()):
+                        # all children deleted
+                        changed.append((key, x, y))
+                        continue
+                    if (not len(x) and not len(y) and
+                            _diff_leaf(x) == _diff_leaf(y)):
+                        continue
+                    if len(x):
+                        # children replaced by text
+                        replaced.add(key)
+                        changes.append(PanConfigChange(
+                            op='delete',
+                            xpath=xpath + '/' + _diff_xpath(key),
+                            cli=cli + [self.__diff_cli(key)]))
+
+                changes.append(PanConfigChange(
+                    op='set', xpath=xpath,
+                    element=other._etree.tostring(y).strip(),
+                    elem=y, cli=cli))
+
+            if a.tag == 'rules':
+                changes.extend(self.__diff_order(
+                    a_children, b_children, replaced, xpath, cli))
+
+            for key, x, y in reversed(changed):
+                stack.append((x, y, xpath + '/' + _diff_xpath(key),
+                              cli + [self.__diff_cli(key)]))
+
+        self._log(DEBUG1, 'diff: %d changes', len(changes))
+
+        return order_changes(changes)
+
+    def __diff_order(self, a_children, b_children, replaced, xpath, cli):
+        # rules added by set are last; move the rules which are not
+        # in the order of b
+        entries = [k for k in b_children if k[0] == 'entry']
+        order = [k for k in a_children
+                 if k[0] == 'entry' and k in b_children and
+                 k not in replaced]
+        order.extend(k for k in entries
+                     if k not in a_children or k in replaced)
+
+        for i, key in enumerate(entries):
+            if order[i] == key:
+                continue
+            order.remove(key)
+            order.insert(i, key)
+            if i == 0:
+                where, dst = 'top', None
+            else:
+                where, dst = 'after', entries[i - 1][1]
+            yield PanConfigChange(
+                op='move', xpath=xpath + '/' + _diff_xpath(key),
+                where=where, dst=dst,
+                cli=cli + [self.__diff_cli(key)])
+
+    def __diff_cli(self, key):
+        tag, x = key
+        if isinstance(x, str):
+            return self.__quote_arg(x)
+        return tag
+
+    def __diff_cli_prefix(self, cli):
+        # set CLI is relative to the device and single vsys
+        if cli[:2] == ['devices', 'localhost.localdomain']:
+            cli = cli[2:]
+            if cli[:1] == ['vsys'] and not self.config_multi_vsys():
+                cli = cli[2:]
+
+        return cli
+
+    def diff_set_cli(self, other, member_list=False):
+        """Return a generator which yields the set CLI commands for
+        diff(other).  set, delete and move commands are
+        produced."""
+
+        for x in self.diff(other):
+            cli = self.__diff_cli_prefix(x.cli)
+            if x.op == 'set':
+                path = ' '.join(['set'] + cli)
+                if x.elem.tag not in ('entry', 'member'):
+                    path += ' ' + x.elem.tag
+                yield from self.__serialize_set_cli(x.elem, path,
+                                                    member_list)
+            elif x.op == 'delete':
+                yield ' '.join(['delete'] + cli)
+            elif x.op == 'move':
+                line = ' '.join(['move'] + cli + [x.where])
+                if x.dst is not None:
+                    line += ' ' + self.__quote_arg(x.dst)
+                yield line
 
     def config_xpaths(self):
         xpaths_panos_4_1 = '''
@@ -768,3 +1219,334 @@ class PanConfig:
         self._log(DEBUG1, 'xpaths: %d', len(xpaths))
 
         return xpaths
+
+
+def _xpath_literal(s):
+    if "'" not in s:
+        return "'%s'" % s
+    if '"' not in s:
+        return '"%s"' % s
+
+    # XPath 1.0 string literals have no escapes
+    x = []
+    for i, part in enumerate(s.split("'")):
+        if i:
+            x.append('"\'"')
+        if part:
+            x.append("'%s'" % part)
+    return 'concat(%s)' % ', '.join(x)
+
+
+def _diff_leaf(elem):
+    text = elem.text
+    attrs = elem.items()
+    return '<%s %s>%s\0' % (elem.tag, sorted(attrs) if attrs else '',
+                            text.strip() if text else '')
+
+
+def _diff_node(elem):
+    attrs = elem.items()
+    return '</%s %s>\0' % (elem.tag, sorted(attrs) if attrs else '')
+
+
+def _diff_children(elem):
+    # entry is matched by name, member by text and other elements
+    # by tag and position
+    children = {}
+    for x in elem:
+        if not isinstance(x.tag, str):
+            continue
+        if x.tag == 'entry' and x.get('name') is not None:
+            key = ('entry', x.get('name'))
+        elif x.tag == 'member' and x.text:
+            key = ('member', x.text)
+        else:
+            key = (x.tag, 1)
+            while key in children:
+                key = (x.tag, key[1] + 1)
+        children[key] = x
+
+    return children
+
+
+def _diff_xpath(key):
+    tag, x = key
+    if isinstance(x, str):
+        if tag == 'entry':
+            return 'entry[@name=%s]' % _xpath_literal(x)
+        return 'member[text()=%s]' % _xpath_literal(x)
+    if x > 1:
+        return '%s[%d]' % (tag, x)
+    return tag
+
+
+def order_changes(changes):
+    """Return a list of the PanConfigChange objects in changes with
+    the deletes of elements moved after the other changes.
+
+    A delete with elem, the deleted element, is moved; other changes
+    keep their order.  The deletes are ordered so a delete which
+    removes member references to names is before the delete of the
+    entry elements with the names, for example an address group
+    before its addresses; otherwise the order is kept.
+    """
+
+    ordered = []
+    deletes = []
+    for x in changes:
+        if x.op == 'delete' and x.elem is not None:
+            deletes.append(x)
+        else:
+            ordered.append(x)
+
+    # names defined and referenced by each delete
+    defines = {}  # name: [delete index]
+    refs = []
+    for i, x in enumerate(deletes):
+        for elem in x.elem.iter('entry'):
+            name = elem.get('name')
+            if name is not None:
+                defines.setdefault(name, []).append(i)
+        refs.append(set(elem.text for elem in x.elem.iter('member')
+                        if elem.text))
+
+    # delete i before delete j when i references a name j defines
+    after = [set() for _ in deletes]
+    count = [0] * len(deletes)
+    for i, names in enumerate(refs):
+        for name in names:
+            for j in defines.get(name, []):
+                if j != i and j not in after[i]:
+                    after[i].add(j)
+                    count[j] += 1
+
+    ready = [i for i, n in enumerate(count) if n == 0]
+    heapq.heapify(ready)
+    done = set()
+    while ready:
+        i = heapq.heappop(ready)
+        done.add(i)
+        ordered.append(deletes[i])
+        for j in after[i]:
+            count[j] -= 1
+            if count[j] == 0:
+                heapq.heappush(ready, j)
+
+    # reference cycle
+    ordered.extend(x for i, x in enumerate(deletes) if i not in done)
+
+    return ordered
+
+
+class PanConfigChange:
+    def __init__(self, op=None, xpath=None, element=None, elem=None,
+                 where=None, dst=None, cli=None):
+        self.op = op
+        self.xpath = xpath
+        self.element = element
+        self.elem = elem
+        self.where = where
+        self.dst = dst
+        self.cli = cli
+
+    def __str__(self):
+        if self.op == 'set':
+            return 'set %s %s' % (self.xpath, self.element)
+        if self.op == 'move' and self.dst is not None:
+            return 'move %s %s %s' % (self.xpath, self.where, self.dst)
+        if self.op == 'move':
+            return 'move %s %s' % (self.xpath, self.where)
+        return '%s %s' % (self.op, self.xpath)
+
+
+class PanConfigObject:
+    def __init__(self, scope=None, type=None, name=None,
+                 elem=None, xpath=None):
+        self.scope = scope
+        self.type = type
+        self.name = name
+        self.elem = elem
+        self.xpath = xpath
+
+    def __str__(self):
+        return '%s %s %s' % (self.scope, self.type, self.name)
+
+
+class PanConfigIndex:
+    """Index of the objects and rules in a configuration.
+
+    Address, address group, service, service group, application
+    group and tag objects and rules in the shared, vsys and
+    device-group scopes are indexed by name, and by the names they
+    reference in member elements.  The index is built in one pass
+    over the configuration.  Rule types are the rulebase and rule
+    type, for example 'rulebase/security' or 'pre-rulebase/nat'.
+    """
+
+    def __init__(self, conf):
+        self._log = logging.getLogger(__name__).log
+        self.scopes = []
+        self._objects = {}  # (scope, type): {name: object}
+        self._names = {}  # name: [object]
+        self._refs = {}  # member name: [object]
+        self._parents = {}  # device-group: parent device-group
+
+        self.__build(conf.config_root)
+
+        self._log(DEBUG1, 'index: %d scopes %d names %d references',
+                  len(self.scopes), len(self._names), len(self._refs))
+
+    def __scopes(self, root):
+        localhost = "./devices/entry[@name='localhost.localdomain']"
+
+        elem = root.find('./shared')
+        if elem is not None:
+            yield _shared, './shared', elem
+
+        for path in [localhost + '/vsys/entry',
+                     localhost + '/device-group/entry']:
+            for elem in root.findall(path):
+                name = elem.get('name')
+                if name is not None:
+                    yield name, '%s[@name=%s]' % (
+                        path, _xpath_literal(name)), elem
+
+    def __build(self, root):
+        for scope, path, scope_elem in self.__scopes(root):
+            self.scopes.append(scope)
+            for type in _index_types:
+                for elem in scope_elem.findall(type + '/entry'):
+                    self.__add(scope, type, elem, path + '/' + type)
+
+            for rulebase in _index_rulebases:
+                elem = scope_elem.find(rulebase)
+                if elem is None:
+                    continue
+                for x in elem:
+                    if not isinstance(x.tag, str):
+                        continue
+                    type = rulebase + '/' + x.tag
+                    for elem in x.findall('rules/entry'):
+                        self.__add(scope, type, elem,
+                                   '%s/%s/rules' % (path, type))
+
+        # Panorama device-group hierarchy
+        for path in ["./readonly/devices/entry[@name='localhost.localdomain']"
+                     "/device-group/entry",
+                     './readonly/dg-meta-data/dg-info/entry']:
+            for elem in root.findall(path):
+                parent = elem.findtext('parent-dg')
+                if parent:
+                    self._parents[elem.get('name')] = parent
+
+    def __add(self, scope, type, elem, path):
+        name = elem.get('name')
+        if name is None:
+            return
+
+        obj = PanConfigObject(scope=scope, type=type, name=name,
+                              elem=elem,
+                              xpath='%s/entry[@name=%s]' % (
+                                  path, _xpath_literal(name)))
+        self._objects.setdefault((scope, type), {})[name] = obj
+        self._names.setdefault(name, []).append(obj)
+
+        for x in elem.iter('member'):
+            if not x.text:
+                continue
+            refs = self._refs.setdefault(x.text, [])
+            if not refs or refs[-1] is not obj:
+                refs.append(obj)
+
+    def lookup(self, name, type=None, scope=None):
+        """Return a list of PanConfigObject objects for the
+        definitions of name, optionally of type and in scope."""
+
+        if type is not None and scope is not None:
+            obj = self._objects.get((scope, type), {}).get(name)
+            return [] if obj is None else [obj]
+
+        return [x for x in self._names.get(name, [])
+                if (type is None or x.type == type) and
+                (scope is None or x.scope == scope)]
+
+    def resolve(self, type, name, scope=_shared):
+        """Return the PanConfigObject for the object of type named
+        name which is visible in scope, or None.
+
+        scope is searched first, followed by the parent device-groups
+        and shared.
+        """
+
+        seen = set()
+        while scope not in seen:
+            seen.add(scope)
+            obj = self._objects.get((scope, type), {}).get(name)
+            if obj is not None:
+                return obj
+            if scope == _shared:
+                break
+            scope = self._parents.get(scope, _shared)
+
+        return None
+
+    def references(self, name, scope=None):
+        """Return a list of PanConfigObject objects for the objects
+        and rules with a member element of name, optionally in
+        scope."""
+
+        return [x for x in self._refs.get(name, [])
+                if scope is None or x.scope == scope]
+
+    def objects(self, type, scope=_shared):
+        """Return a list of PanConfigObject objects of type in
+        scope."""
+
+        return list(self._objects.get((scope, type), {}).values())
+
+
+def _bench(n):
+    import time
+    import tracemalloc
+
+    conf = PanConfig(config=pan.etree._bench_config(n))
+    # last rule action changed
+    other = PanConfig(config=pan.etree._bench_config(n).replace(
+        b'<action>allow</action></entry></rules>',
+        b'<action>deny</action></entry></rules>'))
+    tests = [
+        ('python', lambda: conf.python()),
+        ('flat', lambda: conf.flat('./')),
+        ('set_cli', lambda: conf.set_cli('set ')),
+        ('set_cli member_list', lambda: conf.set_cli('set ',
+                                                     member_list=True)),
+        ('index', lambda: PanConfigIndex(conf)),
+        ('diff', lambda: conf.diff(other)),
+    ]
+
+    print('%d entries, %s' % (n, conf._etree))
+    for name, func in tests:
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+
+        # peak includes the result
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print('%-20s %.3fs peak %.1fMB' % (name, elapsed, peak / 1e6))
+
+
+if __name__ == '__main__':
+    # python -m pan.config [entries]
+    import pan.config
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    except ValueError:
+        print('usage: python -m pan.config [entries]', file=sys.stderr)
+        sys.exit(1)
+
+    pan.config._bench(n)
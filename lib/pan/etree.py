@@ -0,0 +1,264 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""XML parsing and serialization backend
+
+The pan.etree module implements the PanEtree class, which provides
+the ElementTree functions used by pan.xapi and pan.config.  The lxml
+package is used when it is installed, otherwise the
+xml.etree.ElementTree module is used.
+"""
+
+import functools
+import os
+import sys
+import time
+import xml.etree.ElementTree
+
+try:
+    import lxml.etree
+    _have_lxml = True
+except ImportError:
+    _have_lxml = False
+
+_backend_env = 'PAN_XML_BACKEND'
+_xpath_cache_size = 256
+_backends = {}
+
+
+class PanEtreeError(Exception):
+    pass
+
+
+class PanEtree:
+    """xml.etree.ElementTree backend."""
+
+    name = 'etree'
+    module = 'ElementTree'
+
+    def __init__(self):
+        self.etree = xml.etree.ElementTree
+        self.version = self.etree.VERSION
+        self.ParseError = self.etree.ParseError
+        # ElementPath raises KeyError for some invalid paths
+        self.XPathError = (SyntaxError, KeyError)
+
+    def __str__(self):
+        return '%s %s' % (self.name, self.version)
+
+    def fromstring(self, text):
+        return self.etree.fromstring(text)
+
+    def tostring(self, elem):
+        return self.etree.tostring(elem, encoding='unicode')
+
+    def pull_parser(self, events=None):
+        return self.etree.XMLPullParser(events=events)
+
+    def findall(self, elem, path):
+        return elem.findall(path)
+
+    def xpath(self, elem, path, **variables):
+        # ElementPath subset of XPath; compiled paths are cached by
+        # ElementTree
+        if variables:
+            raise PanEtreeError('XPath variables require lxml')
+        return elem.findall(path)
+
+
+class PanLxmlEtree(PanEtree):
+    """lxml backend.
+
+    Comments and processing instructions are not kept, entities are
+    not resolved, and huge_tree is enabled for large configurations.
+    """
+
+    name = 'lxml'
+    module = 'lxml.etree'
+    _parser_options = {
+        'huge_tree': True,
+        'resolve_entities': False,
+        'no_network': True,
+        'remove_comments': True,
+        'remove_pis': True,
+    }
+
+    def __init__(self):
+        if not _have_lxml:
+            raise PanEtreeError('lxml not available')
+        self.etree = lxml.etree
+        self.version = '.'.join(str(x) for x in self.etree.LXML_VERSION)
+        # _XmlStreamParser raises xml.etree.ElementTree.ParseError
+        self.ParseError = (self.etree.ParseError,
+                           xml.etree.ElementTree.ParseError)
+        self.XPathError = (self.etree.XPathError, SyntaxError, KeyError)
+        self.xpath_compile = functools.lru_cache(
+            maxsize=_xpath_cache_size)(self.__xpath_compile)
+
+    def __xpath_compile(self, path):
+        return self.etree.XPath(path, smart_strings=False)
+
+    def fromstring(self, text):
+        # lxml does not allow str with an encoding declaration
+        if isinstance(text, str):
+            text = text.encode('utf-8')
+        # parser objects should not be shared by threads
+        parser = self.etree.XMLParser(**self._parser_options)
+        return self.etree.fromstring(text, parser=parser)
+
+    def pull_parser(self, events=None):
+        return self.etree.XMLPullParser(events=events,
+                                        **self._parser_options)
+
+    def findall(self, elem, path):
+        try:
+            xpath = self.xpath_compile(path)
+        except self.etree.XPathSyntaxError:
+            # ElementPath syntax which is not XPath, such as {*}tag
+            return elem.findall(path)
+
+        nodes = xpath(elem)
+        if not isinstance(nodes, list) or \
+           not all(isinstance(x, self.etree._Element) for x in nodes):
+            raise PanEtreeError('XPath result is not elements: %s' % path)
+        return nodes
+
+    def xpath(self, elem, path, **variables):
+        return self.xpath_compile(path)(elem, **variables)
+
+
+def backend(name=None, element=None):
+    """Return the PanEtree object for XML backend name.
+
+    name is 'lxml' or 'etree'.  The default is the backend of
+    element when specified, otherwise the PAN_XML_BACKEND environment
+    variable, or lxml when it is installed.
+    """
+
+    if name is None and element is not None:
+        name = 'etree'
+        if _have_lxml and isinstance(element, lxml.etree._Element):
+            name = 'lxml'
+    if name is None:
+        name = os.environ.get(_backend_env) or None
+    if name is None:
+        name = 'lxml' if _have_lxml else 'etree'
+
+    if name not in _backends:
+        if name == 'etree':
+            _backends[name] = PanEtree()
+        elif name == 'lxml':
+            _backends[name] = PanLxmlEtree()
+        else:
+            raise PanEtreeError('Invalid XML backend: %s' % name)
+
+    return _backends[name]
+
+
+def _bench_config(n):
+    # synthetic PAN-OS configuration with n address objects,
+    # n / 4 security rules and n / 2 address-group members
+    vsys = ['<address>']
+    for i in range(n):
+        vsys.append('<entry name="addr-%d"><ip-netmask>10.%d.%d.%d/32'
+                    '</ip-netmask><description>address %d</description>'
+                    '<tag><member>tag-%d</member></tag></entry>' %
+                    (i, i >> 16 & 255, i >> 8 & 255, i & 255, i, i % 32))
+    vsys.append('</address><address-group><entry name="group-1"><static>')
+    for i in range(0, n, 2):
+        vsys.append('<member>addr-%d</member>' % i)
+    vsys.append('</static></entry></address-group>')
+    vsys.append('<rulebase><security><rules>')
+    for i in range(n // 4):
+        vsys.append('<entry name="rule-%d"><from><member>trust</member>'
+                    '</from><to><member>untrust</member></to><source>'
+                    '<member>addr-%d</member></source><destination>'
+                    '<member>any</member></destination><application>'
+                    '<member>web-browsing</member></application>'
+                    '<action>allow</action></entry>' % (i, i))
+    vsys.append('</rules></security></rulebase>')
+
+    doc = ('<?xml version="1.0"?>\n'
+           '<config version="11.1.0"><devices>'
+           '<entry name="localhost.localdomain"><vsys>'
+           '<entry name="vsys1">%s</entry></vsys></entry></devices>'
+           '</config>' % ''.join(vsys))
+
+    return doc.encode()
+
+
+def _bench(n):
+    doc = _bench_config(n)
+    vsys = "./devices/entry[@name='localhost.localdomain']/vsys/entry"
+    xpaths = [
+        vsys + '/address/entry',
+        vsys + "/address/entry[@name='addr-%d']" % (n - 1),
+        vsys + "/rulebase/security/rules/entry[action='allow']",
+        './/member',
+    ]
+    # entries with description containing text
+    xpath_filter = vsys + '/address/entry[contains(description, $text)]'
+    text = str(n - 1)[-4:]
+
+    print('%d entries, %d bytes' % (n, len(doc)))
+    for name in ['etree', 'lxml']:
+        try:
+            x = backend(name)
+        except PanEtreeError as msg:
+            print('%s: %s' % (name, msg))
+            continue
+
+        times = []
+        start = time.perf_counter()
+        root = x.fromstring(doc)
+        times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        nodes_all = 0
+        for xpath in xpaths:
+            nodes_all += len(x.findall(root, xpath))
+        times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        if x.name == 'lxml':
+            nodes = x.xpath(root, xpath_filter, text=text)
+        else:
+            nodes = [elem for elem in x.findall(root, xpaths[0])
+                     if text in (elem.findtext('description') or '')]
+        times.append(time.perf_counter() - start)
+        filtered = len(nodes)
+
+        start = time.perf_counter()
+        x.tostring(root)
+        times.append(time.perf_counter() - start)
+
+        print('%-13s fromstring %.3fs findall %.3fs filter %.3fs '
+              'tostring %.3fs' % (x, *times))
+
+    print('findall: %d nodes, filter: %d nodes' % (nodes_all, filtered))
+
+
+if __name__ == '__main__':
+    # python -m pan.etree [entries]
+    import pan.etree
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    except ValueError:
+        print('usage: python -m pan.etree [entries]', file=sys.stderr)
+        sys.exit(1)
+
+    pan.etree._bench(n)
@@ -0,0 +1,282 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Perform a PAN-OS XML API request on multiple devices
+
+The pan.fleet module implements the PanFleet class.  It performs the
+same PanXapi method on a list of devices specified by .panrc
+tagname, hostname or Panorama managed device serial number, using a
+bounded thread pool or asyncio, and returns results as each device
+completes.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import sys
+import time
+
+from . import DEBUG1, DEBUG2
+import pan.pool
+import pan.xapi
+
+_parallel = 8
+
+
+class PanFleetError(Exception):
+    pass
+
+
+class PanFleetResult:
+    def __init__(self, name=None, xapi=None):
+        self.name = name
+        self.xapi = xapi
+        self.value = None
+        self.error = None
+        self.latency = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        status = 'ok' if self.ok else 'error: %s' % self.error
+        return '%s: %s %.3fs' % (self.name, status, self.latency)
+
+
+class PanFleet:
+    def __init__(self,
+                 tags=None,
+                 hostnames=None,
+                 serials=None,
+                 parallel=_parallel,
+                 timeout=None,
+                 retry=None,
+                 **kwargs):
+        self._log = logging.getLogger(__name__).log
+        self.parallel = parallel
+        self.timeout = timeout
+        self.retry = retry
+        self.kwargs = kwargs
+        self.devices = []
+
+        try:
+            self.parallel = int(self.parallel)
+            if self.parallel < 1:
+                raise ValueError
+        except ValueError:
+            raise PanFleetError('Invalid parallel: %s' % self.parallel)
+
+        if self.timeout is not None:
+            try:
+                self.timeout = int(self.timeout)
+                if not self.timeout > 0:
+                    raise ValueError
+            except ValueError:
+                raise PanFleetError('Invalid timeout: %s' % self.timeout)
+            self.kwargs['timeout'] = self.timeout
+
+        # one retry policy and circuit breaker for all devices
+        if self.retry is not None:
+            self.kwargs['retry'] = self.retry
+
+        # name, PanXapi() arguments
+        for x in tags or []:
+            self.devices.append((x, {'tag': x}))
+        for x in hostnames or []:
+            self.devices.append((x, {'hostname': x}))
+        for x in serials or []:
+            # Panorama to device redirection
+            self.devices.append((x, {'serial': x}))
+
+        if not self.devices:
+            raise PanFleetError('tags, hostnames or serials required')
+
+        self._log(DEBUG1, 'devices: %d parallel: %d',
+                  len(self.devices), self.parallel)
+
+    def __len__(self):
+        return len(self.devices)
+
+    def _xapi_kwargs(self, kwargs):
+        x = self.kwargs.copy()
+        x.update(kwargs)
+        return x
+
+    @staticmethod
+    def _method(xapi, method):
+        if callable(method):
+            return lambda *args, **kwargs: method(xapi, *args, **kwargs)
+        try:
+            return getattr(xapi, method)
+        except AttributeError:
+            raise PanFleetError('Invalid method: %s' % method)
+
+    def _run_device(self, name, kwargs, method, args, method_kwargs,
+                    started):
+        result = PanFleetResult(name=name)
+        start = time.monotonic()
+        started.append(start)
+        try:
+            result.xapi = pan.xapi.PanXapi(**self._xapi_kwargs(kwargs))
+            result.value = self._method(result.xapi, method)(
+                *args, **method_kwargs)
+        except (pan.xapi.PanXapiError, PanFleetError) as e:
+            result.error = str(e)
+        finally:
+            result.latency = time.monotonic() - start
+
+        self._log(DEBUG2, '%s', result)
+        return result
+
+    def _timeout_result(self, name, start):
+        result = PanFleetResult(name=name)
+        result.error = 'timeout after %d seconds' % self.timeout
+        result.latency = time.monotonic() - start
+
+        self._log(DEBUG2, '%s', result)
+        return result
+
+    def _expired(self, futures, pending):
+        # return the devices past their deadline and the seconds to
+        # the next deadline
+        now = time.monotonic()
+        expired = []
+        wait = None
+        for future in pending:
+            name, started = futures[future]
+            if not started:
+                continue
+            x = started[0] + self.timeout - now
+            if x <= 0:
+                expired.append(future)
+            elif wait is None or x < wait:
+                wait = x
+
+        return expired, wait
+
+    def run(self, method, *args, **kwargs):
+        """Call method on each device using a thread pool.
+
+        method is a PanXapi method name or a function called with the
+        PanXapi object as the first argument.  A generator is
+        returned which yields a PanFleetResult object as each device
+        completes.  timeout limits the total time for each device.
+        """
+
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.parallel)
+        futures = {}  # future: (name, [start time])
+        for name, x in self.devices:
+            started = []
+            future = executor.submit(self._run_device, name, x,
+                                     method, args, kwargs, started)
+            futures[future] = (name, started)
+
+        pending = set(futures)
+        # threads cannot be interrupted; a device past its deadline
+        # is abandoned, and its worker is used again when it returns
+        abandoned = set()
+        wait = None
+        try:
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending | abandoned, timeout=wait,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                abandoned -= done
+                for future in done & pending:
+                    pending.remove(future)
+                    yield future.result()
+
+                if self.timeout is None:
+                    continue
+                expired, wait = self._expired(futures, pending)
+                for future in expired:
+                    pending.remove(future)
+                    abandoned.add(future)
+                    name, started = futures[future]
+                    self._log(DEBUG1, '%s: abandoned after %d seconds',
+                              name, self.timeout)
+                    yield self._timeout_result(name, started[0])
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    async def _run_device_async(self, sem, pool, name, kwargs,
+                                method, args, method_kwargs):
+        async with sem:
+            result = PanFleetResult(name=name)
+            start = time.monotonic()
+            try:
+                result.xapi = pan.xapi.AsyncPanXapi(
+                    connection_pool=pool,
+                    **self._xapi_kwargs(kwargs))
+                coro = self._method(result.xapi, method)(*args,
+                                                         **method_kwargs)
+                result.value = await asyncio.wait_for(coro, self.timeout)
+            except (pan.xapi.PanXapiError, PanFleetError) as e:
+                result.error = str(e)
+            except asyncio.TimeoutError:
+                result.error = 'timeout after %d seconds' % self.timeout
+            finally:
+                result.latency = time.monotonic() - start
+
+        self._log(DEBUG2, '%s', result)
+        return result
+
+    async def run_async(self, method, *args, **kwargs):
+        """Call method on each device using AsyncPanXapi.
+
+        Like run(), but method is an AsyncPanXapi coroutine method
+        name or a coroutine function, and an asynchronous generator
+        is returned.  timeout limits the total time for each device.
+        """
+
+        sem = asyncio.Semaphore(self.parallel)
+        pool = pan.pool.AsyncPanConnectionPool()
+        tasks = [asyncio.ensure_future(
+            self._run_device_async(sem, pool, name, x,
+                                   method, args, kwargs))
+                 for name, x in self.devices]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+            pool.close()
+
+
+if __name__ == '__main__':
+    # python -m pan.fleet cmd tag [tag ...]
+    import pan.fleet
+
+    if len(sys.argv) < 3:
+        print('usage: python -m pan.fleet cmd tag [tag ...]',
+              file=sys.stderr)
+        sys.exit(1)
+
+    try:
+        fleet = pan.fleet.PanFleet(tags=sys.argv[2:], timeout=10)
+    except pan.fleet.PanFleetError as msg:
+        print('pan.fleet.PanFleet:', msg, file=sys.stderr)
+        sys.exit(1)
+
+    for result in fleet.run('op', cmd=sys.argv[1], cmd_xml=True):
+        print(result, file=sys.stderr)
+        if result.ok:
+            print(result.xapi.xml_result())
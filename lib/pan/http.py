@@ -19,6 +19,8 @@ import email.errors
 import socket
 import ssl
 import sys
+import time
+from urllib.parse import urlsplit
 
 _using_requests = False
 
@@ -39,9 +41,15 @@ class PanHttpError(Exception):
 class PanHttp:
     def __init__(self,
                  timeout=None,
-                 verify_cert=True):
+                 verify_cert=True,
+                 retry=None,
+                 rate_limit=None,
+                 api_key=None):
         self.timeout = timeout
         self.verify_cert = verify_cert
+        self.retry = retry
+        self.rate_limit = rate_limit
+        self.api_key = api_key  # rate limit bucket
 
         if self.timeout is not None:
             try:
@@ -70,9 +78,44 @@ class PanHttp:
         self.text = None
         self.content = None
 
-    def http_request(self, url=None, headers=None, data=None, params=None):
-        self._init_attributes()
-        self._http_request(url, headers, data, params)
+    def http_request(self, url=None, headers=None, data=None, params=None,
+                     idempotent=True):
+        key = urlsplit(url).netloc
+        if self.retry is None:
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(key, self.api_key)
+            self._init_attributes()
+            self._http_request(url, headers, data, params)
+            return
+
+        # idempotent is False when the request can be retried only
+        # if it was not performed
+        attempt = 0
+        while True:
+            if not self.retry.allow(key):
+                raise PanHttpError('circuit open: %s' % key)
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(key, self.api_key)
+            self._init_attributes()
+            try:
+                self._http_request(url, headers, data, params)
+            except PanHttpError as e:
+                interval = self.retry.failed(
+                    key, attempt, idempotent=idempotent,
+                    error=e.__context__)
+                if interval is None:
+                    raise
+            else:
+                if self.code not in self.retry.codes:
+                    self.retry.success(key)
+                    return
+                interval = self.retry.failed(
+                    key, attempt, idempotent=idempotent, code=self.code,
+                    retry_after=self.headers.get('retry-after'))
+                if interval is None:
+                    return
+            attempt += 1
+            time.sleep(interval)
 
     def raise_for_status(self):
         if self.code is None:
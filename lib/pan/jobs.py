@@ -0,0 +1,247 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Wait for multiple PAN-OS jobs on a device
+
+The pan.jobs module implements the PanJobWatcher class.  It polls
+the status of many jobs on one device using a single job status
+request per interval, and resolves a future for each job when it
+finishes.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+from . import DEBUG1, DEBUG2
+import pan.xapi
+
+_CMD_ID = '<show><jobs><id>%s</id></jobs></show>'
+_CMD_ALL = '<show><jobs><all></all></jobs></show>'
+
+
+class PanJobWatcher:
+    def __init__(self, xapi, interval=None, timeout=None):
+        self._log = logging.getLogger(__name__).log
+        self.xapi = xapi
+        self.interval = pan.xapi.PanXapi._job_interval(interval)
+        self.timeout = pan.xapi.PanXapi._job_timeout(timeout)
+        self.job_poll = None
+        self.requests = 0
+        self._jobs = {}
+        self._progress = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def add(self, job, callback=None):
+        """Watch job ID job.
+
+        A concurrent.futures.Future object is returned whose result
+        is the job element of the finished job status.  callback is
+        called with the future when the job finishes.
+        """
+
+        job = str(job).strip()
+        if not job.isdigit():
+            raise pan.xapi.PanXapiError('Invalid job ID: %s' % job)
+
+        with self._lock:
+            future = self._jobs.get(job)
+            if future is None:
+                future = concurrent.futures.Future()
+                future.set_running_or_notify_cancel()
+                self._jobs[job] = future
+                self._progress[job] = 0
+
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        return future
+
+    def _pending(self):
+        with self._lock:
+            return [job for job, future in self._jobs.items()
+                    if not future.done()]
+
+    def _job_error(self, job, error):
+        # job ID not found is an error response for the job; other
+        # errors are raised
+        if self.xapi.status != 'error':
+            return False
+
+        self._log(DEBUG1, 'job %s: %s', job, error)
+        with self._lock:
+            future = self._jobs[job]
+        future.set_exception(error)
+        return True
+
+    def _update(self, pending):
+        # return pending jobs not in the response
+        elems = self.xapi.element_root.findall('./result/job')
+        status = dict((x.findtext('id'), x) for x in elems)
+
+        missing = []
+        for job in pending:
+            elem = status.get(job)
+            if elem is None:
+                missing.append(job)
+                continue
+
+            try:
+                self._progress[job] = int(elem.findtext('progress'))
+            except (TypeError, ValueError):
+                pass
+
+            x = elem.findtext('status')
+            if x == 'FIN':
+                self._log(DEBUG1, 'job %s: %s', job, elem.findtext('result'))
+                self._progress[job] = 100
+                with self._lock:
+                    future = self._jobs[job]
+                future.set_result(elem)
+            else:
+                self._log(DEBUG2, 'job %s status %s', job, x)
+
+        return missing
+
+    def _polled(self, poller):
+        # any job progress resets the poll interval
+        progress = sum(self._progress.values()) // len(self._progress)
+        poller.polled(progress)
+
+        if not poller.expired():
+            return False
+
+        for job in self._pending():
+            with self._lock:
+                future = self._jobs[job]
+            future.set_exception(
+                pan.xapi.PanXapiError('timeout waiting for ' +
+                                      'job %s completion' % job))
+        return True
+
+    def _fail(self, error):
+        for job in self._pending():
+            with self._lock:
+                future = self._jobs[job]
+            future.set_exception(error)
+
+    def _sleep_time(self, poller):
+        interval = poller.next_interval()
+        self._log(DEBUG2, 'sleep %.2f seconds', interval)
+        return interval
+
+    def _poll(self):
+        # Generator which yields the job status commands for one poll.
+        # The caller performs each request and sends None, or the
+        # PanXapiError raised, which is raised unless it is an error
+        # for the job.
+        pending = self._pending()
+        if len(pending) > 1:
+            error = yield _CMD_ALL
+            if error is not None:
+                raise error
+            pending = self._update(pending)
+
+        # single job or not in show jobs all response
+        for job in pending:
+            error = yield _CMD_ID % job
+            if error is not None:
+                if self._job_error(job, error):
+                    continue
+                raise error
+            self._update([job])
+
+    def _request(self, cmd):
+        self.requests += 1
+        try:
+            self.xapi.op(cmd=cmd)
+        except pan.xapi.PanXapiError as e:
+            return e
+
+    async def _request_async(self, cmd):
+        self.requests += 1
+        try:
+            await self.xapi.op(cmd=cmd)
+        except pan.xapi.PanXapiError as e:
+            return e
+
+    def run(self):
+        """Poll job status until all jobs have finished.
+
+        Jobs can be added while run() is polling, for example from a
+        callback.
+        """
+
+        poller = self.xapi.job_poller(interval=self.interval,
+                                      timeout=self.timeout)
+        self.job_poll = poller
+
+        try:
+            while self._pending():
+                time.sleep(self._sleep_time(poller))
+
+                poll = self._poll()
+                cmd = next(poll, None)
+                while cmd is not None:
+                    cmd = _send(poll, self._request(cmd))
+
+                if self._polled(poller):
+                    break
+        except pan.xapi.PanXapiError as e:
+            self._fail(e)
+            raise
+
+        self._log(DEBUG1, '%d jobs: %d requests %.2f seconds wait',
+                  len(self), self.requests, poller.wait)
+
+    async def run_async(self):
+        """Like run(), but xapi is an AsyncPanXapi object."""
+
+        poller = self.xapi.job_poller(interval=self.interval,
+                                      timeout=self.timeout)
+        self.job_poll = poller
+
+        try:
+            while self._pending():
+                await asyncio.sleep(self._sleep_time(poller))
+
+                poll = self._poll()
+                cmd = next(poll, None)
+                while cmd is not None:
+                    cmd = _send(poll, await self._request_async(cmd))
+
+                if self._polled(poller):
+                    break
+        except pan.xapi.PanXapiError as e:
+            self._fail(e)
+            raise
+
+        self._log(DEBUG1, '%d jobs: %d requests %.2f seconds wait',
+                  len(self), self.requests, poller.wait)
+
+
+def _send(gen, value):
+    # generator.send() returning None when it is exhausted
+    try:
+        return gen.send(value)
+    except StopIteration:
+        return None
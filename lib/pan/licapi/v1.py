@@ -89,7 +89,9 @@ class PanLicapi:
                  hostname=None,
                  api_key=None,
                  timeout=None,
-                 verify_cert=True):
+                 verify_cert=True,
+                 retry=None,
+                 rate_limit=None):
         self._log = logging.getLogger(__name__).log
         self.api_version = api_version
         self.panrc_tag = panrc_tag
@@ -97,6 +99,8 @@ class PanLicapi:
         self.api_key = api_key
         self.timeout = timeout
         self.verify_cert = verify_cert
+        self.retry = retry
+        self.rate_limit = rate_limit
 
         self._log(DEBUG3, 'Python version: %s', sys.version)
         self._log(DEBUG3, 'ssl: %s', ssl.OPENSSL_VERSION)
@@ -135,7 +139,10 @@ class PanLicapi:
 
         try:
             self.http = pan.http.PanHttp(timeout=self.timeout,
-                                         verify_cert=self.verify_cert)
+                                         verify_cert=self.verify_cert,
+                                         retry=self.retry,
+                                         rate_limit=self.rate_limit,
+                                         api_key=self.api_key)
         except pan.http.PanHttpError as e:
             raise PanLicapiError(e)
 
@@ -171,15 +178,18 @@ class PanLicapi:
             self._log(DEBUG1, params)
         self._log(DEBUG1, data)
 
+        name = inspect.stack()[1][3]
         try:
+            # activate and deactivate are not idempotent
             self.http.http_request(url=url,
                                    headers=headers,
                                    data=data,
-                                   params=params)
+                                   params=params,
+                                   idempotent=name == 'get')
         except pan.http.PanHttpError as e:
             raise PanLicapiError(str(e))
 
-        r = PanLicapiRequest(inspect.stack()[1][3])
+        r = PanLicapiRequest(name)
         self._set_attributes(r)
         return r
 
@@ -0,0 +1,293 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Request instrumentation for the PAN-OS XML API
+
+The pan.metrics module implements the PanHook class, the interface
+for objects passed to the PanXapi hooks argument, which are called
+before and after each API request with a PanRequestMetrics object,
+and the PanMetrics class, a hook which collects request counters and
+latency histograms which can be output as JSON or in the Prometheus
+text exposition format.
+"""
+
+import json
+import sys
+import threading
+import time
+
+_phases = ['dns', 'connect', 'tls', 'wait', 'download', 'parse']
+_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+            1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_prefix = 'pan_xapi'
+
+
+class PanRequestMetrics:
+    def __init__(self, api_type=None, action=None, hostname=None):
+        self.api_type = api_type
+        self.action = action
+        self.hostname = hostname
+        self.method = None
+        self.time = time.time()
+        self.http_code = None
+        self.status = None
+        self.status_code = None
+        self.bytes_sent = None
+        self.bytes_received = None
+        self.reused = None
+        self.error = None
+        self.timing = dict((x, None) for x in _phases)
+        self.total = None
+        self._start = time.monotonic()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        x = ' '.join('%s %.3fs' % (k, v) for k, v in self.timing.items()
+                     if v is not None)
+        return '%s%s: %s [%.3fs] %s' % (
+            self.api_type,
+            '' if self.action is None else ' ' + self.action,
+            self.status if self.ok else 'error',
+            self.total or 0, x)
+
+
+class PanHook:
+    def pre_request(self, metrics):
+        pass
+
+    def post_request(self, metrics):
+        pass
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, x in enumerate(self.buckets):
+            if value <= x:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def cumulative(self):
+        n = 0
+        for x, count in zip(self.buckets, self.counts):
+            n += count
+            yield x, n
+
+
+class PanMetrics(PanHook):
+    def __init__(self, buckets=_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}  # (type, action, status): count
+            self._latency = {}  # type: _Histogram
+            self._phases = dict((x, 0.0) for x in _phases)
+            self._connections = {True: 0, False: 0}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.errors = 0
+
+    def __len__(self):
+        with self._lock:
+            return sum(self._requests.values())
+
+    def post_request(self, metrics):
+        status = 'error' if not metrics.ok else metrics.status or ''
+        key = (metrics.api_type or '', metrics.action or '', status)
+
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if not metrics.ok:
+                self.errors += 1
+            x = self._latency.get(key[0])
+            if x is None:
+                x = self._latency[key[0]] = _Histogram(self.buckets)
+            x.observe(metrics.total or 0)
+            for k, v in metrics.timing.items():
+                if v is not None:
+                    self._phases[k] += v
+            if metrics.reused is not None:
+                self._connections[metrics.reused] += 1
+            self.bytes_sent += metrics.bytes_sent or 0
+            self.bytes_received += metrics.bytes_received or 0
+
+    def python(self):
+        """Return the metrics as a dictionary."""
+
+        with self._lock:
+            return {
+                'requests': [
+                    {'type': t, 'action': a, 'status': s, 'count': n}
+                    for (t, a, s), n in sorted(self._requests.items())],
+                'errors': self.errors,
+                'latency': dict(
+                    (t, {
+                        'count': x.count,
+                        'sum': x.sum,
+                        'max': x.max,
+                        'buckets': dict((str(le), n)
+                                        for le, n in x.cumulative()),
+                    }) for t, x in sorted(self._latency.items())),
+                'phases': dict(self._phases),
+                'connections': {
+                    'new': self._connections[False],
+                    'reused': self._connections[True],
+                },
+                'bytes_sent': self.bytes_sent,
+                'bytes_received': self.bytes_received,
+            }
+
+    def json(self, **kwargs):
+        """Return the metrics as a JSON string; kwargs are
+        json.dumps() arguments."""
+
+        return json.dumps(self.python(), **kwargs)
+
+    def prometheus(self, prefix=_prefix):
+        """Return the metrics in the Prometheus text exposition
+        format."""
+
+        d = self.python()
+        lines = []
+
+        def metric(name, kind, help):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+
+        def sample(name, labels, value):
+            x = ','.join('%s="%s"' % (k, _label_value(v))
+                         for k, v in labels)
+            lines.append('%s_%s%s %s' % (prefix, name,
+                                         '{%s}' % x if x else '',
+                                         _number(value)))
+
+        metric('requests_total', 'counter', 'API requests.')
+        for x in d['requests']:
+            sample('requests_total', [('type', x['type']),
+                                      ('action', x['action']),
+                                      ('status', x['status'])],
+                   x['count'])
+
+        metric('request_duration_seconds', 'histogram',
+               'API request latency.')
+        for t, x in d['latency'].items():
+            for le, n in x['buckets'].items():
+                sample('request_duration_seconds_bucket',
+                       [('type', t), ('le', le)], n)
+            sample('request_duration_seconds_bucket',
+                   [('type', t), ('le', '+Inf')], x['count'])
+            sample('request_duration_seconds_sum', [('type', t)], x['sum'])
+            sample('request_duration_seconds_count', [('type', t)],
+                   x['count'])
+
+        metric('phase_seconds_total', 'counter',
+               'Time spent in each request phase.')
+        for k, v in d['phases'].items():
+            sample('phase_seconds_total', [('phase', k)], v)
+
+        metric('connections_total', 'counter', 'HTTP connections used.')
+        for k, v in d['connections'].items():
+            sample('connections_total', [('state', k)], v)
+
+        metric('sent_bytes_total', 'counter', 'Request bytes sent.')
+        sample('sent_bytes_total', [], d['bytes_sent'])
+        metric('received_bytes_total', 'counter',
+               'Response bytes received.')
+        sample('received_bytes_total', [], d['bytes_received'])
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Return a list of lines summarizing the metrics."""
+
+        d = self.python()
+        count = sum(x['count'] for x in d['latency'].values())
+        lines = ['%d requests %d errors, %d connections %d reused, '
+                 '%d bytes sent %d bytes received' %
+                 (count, d['errors'], d['connections']['new'],
+                  d['connections']['reused'], d['bytes_sent'],
+                  d['bytes_received'])]
+        for t, x in d['latency'].items():
+            lines.append('%-10s %5d requests total %.3fs mean %.3fs '
+                         'max %.3fs' % (t, x['count'], x['sum'],
+                                        x['sum'] / x['count'], x['max']))
+        lines.append(' '.join('%s %.3fs' % (k, v)
+                              for k, v in d['phases'].items()))
+
+        return lines
+
+
+def _label_value(s):
+    return str(s).replace('\\', '\\\\').replace('"', '\\"').replace(
+        '\n', '\\n')
+
+
+def _number(x):
+    if isinstance(x, float):
+        return repr(x)
+    return str(x)
+
+
+if __name__ == '__main__':
+    # python -m pan.metrics [requests]
+    import random
+    import pan.metrics
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    except ValueError:
+        print('usage: python -m pan.metrics [requests]', file=sys.stderr)
+        sys.exit(1)
+
+    random.seed(1)
+    records = []
+    for i in range(n):
+        x = pan.metrics.PanRequestMetrics(
+            api_type=random.choice(['op', 'config', 'commit']),
+            action=random.choice([None, 'get', 'set']))
+        x.status = 'success'
+        x.reused = i % 10 != 0
+        x.timing['wait'] = random.expovariate(20)
+        x.timing['parse'] = random.expovariate(1000)
+        x.total = x.timing['wait'] + x.timing['parse']
+        x.bytes_sent = 100
+        x.bytes_received = 1000
+        records.append(x)
+
+    metrics = pan.metrics.PanMetrics()
+    start = time.perf_counter()
+    for x in records:
+        metrics.post_request(x)
+    elapsed = time.perf_counter() - start
+
+    print('%d requests: %.3fs, %.2fus per request' %
+          (n, elapsed, elapsed / n * 1e6))
+    print('\n'.join(metrics.summary()))
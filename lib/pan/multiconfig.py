@@ -0,0 +1,219 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Build PAN-OS multi-config requests
+
+The pan.multiconfig module implements the PanMultiConfig class.  It
+builds the element documents for the multi-config configuration API
+request from a list of configuration actions or a pan.config diff,
+split into documents of a maximum size, so many configuration changes
+are performed using a few requests.
+"""
+
+import logging
+import sys
+import time
+from xml.sax.saxutils import quoteattr
+
+from . import DEBUG1, DEBUG2
+import pan.config
+import pan.etree
+
+_max_size = 256 * 1024
+_header = '<multi-config>'
+_footer = '</multi-config>'
+_moves = ['top', 'bottom', 'before', 'after']
+
+
+class PanMultiConfigError(Exception):
+    pass
+
+
+class PanMultiConfig:
+    def __init__(self, max_size=_max_size, max_actions=None):
+        self._log = logging.getLogger(__name__).log
+        self.max_size = max_size
+        self.max_actions = max_actions
+        self.requests = 0
+        self.applied = 0
+        self._actions = []  # (size, action)
+
+        try:
+            self.max_size = int(self.max_size)
+            if self.max_size < 1:
+                raise ValueError
+        except ValueError:
+            raise PanMultiConfigError('Invalid max_size: %s' %
+                                      self.max_size)
+
+        if self.max_actions is not None:
+            try:
+                self.max_actions = int(self.max_actions)
+                if self.max_actions < 1:
+                    raise ValueError
+            except ValueError:
+                raise PanMultiConfigError('Invalid max_actions: %s' %
+                                          self.max_actions)
+
+    def __len__(self):
+        return len(self._actions)
+
+    def _add(self, action, attributes, element=None):
+        id = len(self._actions) + 1
+        x = ['<%s id="%d"' % (action, id)]
+        for k, v in attributes:
+            if v is not None:
+                x.append(' %s=%s' % (k, quoteattr(v)))
+
+        if element is None:
+            x.append('/>')
+        else:
+            if hasattr(element, 'tag'):
+                element = pan.etree.backend(element=element).tostring(
+                    element).strip()
+            x.append('>%s</%s>' % (element, action))
+
+        x = ''.join(x)
+        size = len(x.encode())
+        self._actions.append((size, x))
+        self._log(DEBUG2, 'action %d: %s %d bytes', id, action, size)
+
+        return id
+
+    def set(self, xpath, element):
+        return self._add('set', [('xpath', xpath)], element)
+
+    def edit(self, xpath, element):
+        return self._add('edit', [('xpath', xpath)], element)
+
+    def delete(self, xpath):
+        return self._add('delete', [('xpath', xpath)])
+
+    def move(self, xpath, where, dst=None):
+        if where not in _moves:
+            raise PanMultiConfigError('Invalid move where: %s' % where)
+        return self._add('move', [('xpath', xpath), ('where', where),
+                                  ('dst', dst)])
+
+    def rename(self, xpath, newname):
+        return self._add('rename', [('xpath', xpath),
+                                    ('newname', newname)])
+
+    def clone(self, xpath, xpath_from, newname):
+        return self._add('clone', [('xpath', xpath),
+                                   ('from', xpath_from),
+                                   ('newname', newname)])
+
+    def add_changes(self, changes):
+        """Add the pan.config.PanConfigChange objects returned by
+        pan.config.PanConfig.diff().
+
+        The changes are ordered by pan.config.order_changes(), so
+        references to an object are removed before it is deleted.
+        The documents are sent in order, so the order is kept when
+        the changes are split into multiple documents.
+        """
+
+        for x in pan.config.order_changes(changes):
+            if x.op == 'set':
+                self.set(x.xpath, x.element)
+            elif x.op == 'delete':
+                self.delete(x.xpath)
+            elif x.op == 'move':
+                self.move(x.xpath, x.where, x.dst)
+            else:
+                raise PanMultiConfigError('Invalid change: %s' % x.op)
+
+    def _chunks(self):
+        # actions in order, max_size bytes and max_actions per
+        # document; an action larger than max_size is a document
+        overhead = len(_header) + len(_footer)
+        chunk = []
+        size = overhead
+
+        for n, x in self._actions:
+            if chunk and (size + n > self.max_size or
+                          (self.max_actions is not None and
+                           len(chunk) >= self.max_actions)):
+                yield _header + ''.join(chunk) + _footer, len(chunk)
+                chunk = []
+                size = overhead
+            chunk.append(x)
+            size += n
+
+        if chunk:
+            yield _header + ''.join(chunk) + _footer, len(chunk)
+
+    def documents(self):
+        """Return a list of multi-config element documents."""
+
+        return [x for x, _ in self._chunks()]
+
+    def run(self, xapi, strict=True):
+        """Perform the actions using multi_config() requests.
+
+        The documents are sent in order; when a request fails
+        pan.xapi.PanXapiError is raised, and the actions in previous
+        requests remain applied.
+        """
+
+        for document, n in self._chunks():
+            start = time.monotonic()
+            self.requests += 1
+            xapi.multi_config(element=document, strict=strict)
+            self.applied += n
+            self._log(DEBUG1, 'multi-config %d: %d actions %d bytes '
+                      '%.3fs', self.requests, n, len(document),
+                      time.monotonic() - start)
+
+    async def run_async(self, xapi, strict=True):
+        """Like run(), but xapi is an AsyncPanXapi object."""
+
+        for document, n in self._chunks():
+            start = time.monotonic()
+            self.requests += 1
+            await xapi.multi_config(element=document, strict=strict)
+            self.applied += n
+            self._log(DEBUG1, 'multi-config %d: %d actions %d bytes '
+                      '%.3fs', self.requests, n, len(document),
+                      time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    # python -m pan.multiconfig [actions]
+    import pan.multiconfig
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    except ValueError:
+        print('usage: python -m pan.multiconfig [actions]',
+              file=sys.stderr)
+        sys.exit(1)
+
+    xpath = ("/config/devices/entry[@name='localhost.localdomain']"
+             "/vsys/entry[@name='vsys1']/address/entry[@name='addr-%d']")
+    element = '<ip-netmask>10.%d.%d.%d/32</ip-netmask>'
+
+    start = time.perf_counter()
+    mc = pan.multiconfig.PanMultiConfig()
+    for i in range(n):
+        mc.set(xpath % i, element % (i >> 16 & 255, i >> 8 & 255, i & 255))
+    documents = mc.documents()
+    elapsed = time.perf_counter() - start
+
+    print('%d actions: %d multi-config requests, %d bytes max, %.3fs' %
+          (len(mc), len(documents), max(len(x) for x in documents),
+           elapsed))
@@ -0,0 +1,689 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""HTTP/1.1 keep-alive connection pool
+
+The pan.pool module implements the PanConnectionPool class.  It
+keeps HTTP/1.1 connections open between requests so consecutive API
+requests to the same server can reuse an established TCP and TLS
+session.  PanConnectionPool.urlopen() accepts the same arguments as
+urllib.request.urlopen() and raises the same exceptions.
+
+AsyncPanConnectionPool provides the same interface for asyncio;
+its urlopen() method is a coroutine.
+
+The response has a timing attribute, a dictionary with the seconds
+spent resolving the hostname (dns), connecting (connect), in the TLS
+handshake (tls) and waiting for the response headers (wait), and a
+reused attribute which is True when an idle connection was used.
+"""
+
+import asyncio
+import functools
+import http.client
+from io import BytesIO
+import logging
+import socket
+import sys
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+
+from . import __version__, DEBUG1, DEBUG2, DEBUG3
+
+_maxsize = 4
+_idle_timeout = 60.0
+_user_agent = 'pan-python/%s' % __version__
+
+
+class PanConnectionPoolError(Exception):
+    pass
+
+
+def _timing():
+    return {
+        'dns': None,
+        'connect': None,
+        'tls': None,
+        'wait': None,
+    }
+
+
+def _create_connection(timing, address, *args, **kwargs):
+    # socket.create_connection() with name resolution and connect
+    # times
+    host, port = address
+    start = time.monotonic()
+    addrs = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+    timing['dns'] = time.monotonic() - start
+
+    start = time.monotonic()
+    for i, x in enumerate(addrs):
+        try:
+            sock = socket.create_connection(x[4][:2], *args, **kwargs)
+        except OSError:
+            if i == len(addrs) - 1:
+                raise
+            continue
+        timing['connect'] = time.monotonic() - start
+        return sock
+
+
+class PanConnectionPool:
+    def __init__(self,
+                 maxsize=_maxsize,
+                 idle_timeout=_idle_timeout):
+        self._log = logging.getLogger(__name__).log
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._idle = {}  # key: [(connection, last_used), ...]
+
+        try:
+            self.maxsize = int(self.maxsize)
+            if self.maxsize < 0:
+                raise ValueError
+        except ValueError:
+            raise PanConnectionPoolError('Invalid maxsize: %s' %
+                                         self.maxsize)
+
+        if self.idle_timeout is not None:
+            try:
+                self.idle_timeout = float(self.idle_timeout)
+                if self.idle_timeout < 0:
+                    raise ValueError
+            except ValueError:
+                raise PanConnectionPoolError('Invalid idle_timeout: %s' %
+                                             self.idle_timeout)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(x) for x in self._idle.values())
+
+    def close(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+
+        for key in idle:
+            for conn, _ in idle[key]:
+                conn.close()
+        self._log(DEBUG2, 'pool closed')
+
+    def _get(self, key):
+        now = time.monotonic()
+        stale = []
+        conn = None
+
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                x, last_used = idle.pop()
+                if (self.idle_timeout is not None and
+                        now - last_used > self.idle_timeout):
+                    stale.append(x)
+                    continue
+                conn = x
+                break
+
+        for x in stale:
+            self._log(DEBUG2, 'evict idle connection %s', key[:3])
+            x.close()
+
+        return conn
+
+    def _put(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.monotonic()))
+                return
+
+        self._log(DEBUG2, 'pool full, close connection %s', key[:3])
+        conn.close()
+
+    def _release(self, key, conn, response):
+        # A response is reusable when its body was read to the end
+        # and the server did not ask to close the connection.
+        if response.isclosed() and not response.will_close:
+            self._put(key, conn)
+        else:
+            conn.close()
+
+    @staticmethod
+    def _connection(scheme, host, port, timeout, context):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port,
+                                               timeout=timeout,
+                                               context=context)
+        return http.client.HTTPConnection(host, port,
+                                          timeout=timeout)
+
+    @staticmethod
+    def _prepare(url, data, context):
+        if isinstance(url, str):
+            from urllib.request import Request
+            url = Request(url, data)
+        request = url
+        if data is not None:
+            request.data = data
+
+        x = urlsplit(request.full_url)
+        scheme = x.scheme.lower()
+        if scheme not in ['http', 'https']:
+            raise URLError('unknown url type: %s' % scheme)
+        host = x.hostname
+        port = x.port
+        if port is None:
+            port = 443 if scheme == 'https' else 80
+        key = (scheme, host, port, context if scheme == 'https' else None)
+
+        headers = dict((k.title(), v) for k, v in request.header_items())
+        headers.setdefault('User-Agent', _user_agent)
+        headers['Connection'] = 'keep-alive'
+        if (request.data is not None and
+                'Content-Type' not in headers):
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        return request, key, headers
+
+    def urlopen(self, url, data=None,
+                timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                context=None):
+        request, key, headers = self._prepare(url, data, context)
+        scheme, host, port, _ = key
+        selector = request.selector
+        method = request.get_method()
+
+        conn = self._get(key)
+        reused = conn is not None
+
+        while True:
+            timing = _timing()
+            new = conn is None
+            if new:
+                conn = self._connection(scheme, host, port, timeout,
+                                        context)
+                conn._create_connection = functools.partial(
+                    _create_connection, timing)
+                self._log(DEBUG2, 'new connection %s', key[:3])
+            else:
+                self._log(DEBUG2, 'reuse connection %s', key[:3])
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout if timeout is not
+                                         socket._GLOBAL_DEFAULT_TIMEOUT
+                                         else None)
+
+            try:
+                if new:
+                    start = time.monotonic()
+                    conn.connect()
+                    if scheme == 'https':
+                        timing['tls'] = (time.monotonic() - start -
+                                         timing['dns'] - timing['connect'])
+                start = time.monotonic()
+                conn.request(method, selector, body=request.data,
+                             headers=headers)
+                response = conn.getresponse()
+                timing['wait'] = time.monotonic() - start
+            except (ConnectionError,
+                    http.client.BadStatusLine,
+                    http.client.ImproperConnectionState) as e:
+                conn.close()
+                if reused:
+                    # server closed the idle connection; reconnect once
+                    self._log(DEBUG1, 'stale connection %s: %s',
+                              key[:3], e)
+                    conn = None
+                    reused = False
+                    continue
+                raise URLError(e)
+            except OSError as e:
+                conn.close()
+                raise URLError(e)
+            break
+
+        self._log(DEBUG3, 'response %s %s will_close %s',
+                  response.status, response.reason, response.will_close)
+
+        response = _PooledResponse(self, key, conn, response,
+                                   request.full_url)
+        response.timing = timing
+        response.reused = not new
+
+        if not (200 <= response.status < 300):
+            # same as urllib.request.HTTPErrorProcessor; read the body
+            # so the connection is released before raising
+            try:
+                body = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                raise URLError(e)
+            finally:
+                response.close()
+            raise HTTPError(request.full_url, response.status,
+                            response.reason, response.headers,
+                            BytesIO(body))
+
+        return response
+
+
+class _PooledResponse:
+    # Thin wrapper over http.client.HTTPResponse which returns the
+    # connection to the pool when the response is closed.
+
+    def __init__(self, pool, key, conn, response, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._response)
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self._response.status
+
+    @property
+    def closed(self):
+        return self._response.closed
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn = self._conn
+        self._conn = None
+        self._pool._release(self._key, conn, self._response)
+        self._response.close()
+
+
+class AsyncPanConnectionPool(PanConnectionPool):
+    """asyncio connection pool.
+
+    AsyncPanConnectionPool.urlopen() is a coroutine; connections are
+    asyncio streams and must be used from a single event loop.
+    """
+
+    async def urlopen(self, url, data=None, timeout=None, context=None):
+        request, key, headers = self._prepare(url, data, context)
+        scheme, host, port, _ = key
+        body = request.data
+        if body is not None:
+            headers['Content-Length'] = str(len(body))
+        if self.maxsize == 0:
+            headers['Connection'] = 'close'
+        method = request.get_method()
+
+        conn = self._get(key)
+        reused = conn is not None
+
+        while True:
+            timing = _timing()
+            new = conn is None
+            try:
+                if new:
+                    conn = await asyncio.wait_for(
+                        _AsyncConnection.open(scheme, host, port,
+                                              context, timing),
+                        timeout)
+                    self._log(DEBUG2, 'new connection %s', key[:3])
+                else:
+                    self._log(DEBUG2, 'reuse connection %s', key[:3])
+
+                start = time.monotonic()
+                response = await asyncio.wait_for(
+                    conn.request(method, request.selector, body,
+                                 headers),
+                    timeout)
+                timing['wait'] = time.monotonic() - start
+            except (ConnectionError,
+                    asyncio.IncompleteReadError,
+                    http.client.BadStatusLine) as e:
+                if conn is not None:
+                    conn.close()
+                if reused:
+                    # server closed the idle connection; reconnect once
+                    self._log(DEBUG1, 'stale connection %s: %s',
+                              key[:3], e)
+                    conn = None
+                    reused = False
+                    continue
+                raise URLError(e)
+            except asyncio.TimeoutError:
+                if conn is not None:
+                    conn.close()
+                raise URLError(socket.timeout('timed out'))
+            except OSError as e:
+                if conn is not None:
+                    conn.close()
+                raise URLError(e)
+            break
+
+        self._log(DEBUG3, 'response %s %s will_close %s',
+                  response.status, response.reason, response.will_close)
+
+        response = _AsyncPooledResponse(self, key, conn, response,
+                                        request.full_url, timeout)
+        response.timing = timing
+        response.reused = not new
+
+        if not (200 <= response.status < 300):
+            body = await response.read()
+            response.close()
+            raise HTTPError(request.full_url, response.status,
+                            response.reason, response.headers,
+                            BytesIO(body))
+
+        return response
+
+
+class _AsyncConnection:
+    # Minimal HTTP/1.1 client connection using asyncio streams.
+
+    def __init__(self, scheme, host, port, reader, writer):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def open(cls, scheme, host, port, context, timing):
+        # connect time includes the TLS handshake
+        loop = asyncio.get_running_loop()
+        start = time.monotonic()
+        addrs = await loop.getaddrinfo(host, port,
+                                       type=socket.SOCK_STREAM)
+        timing['dns'] = time.monotonic() - start
+
+        kwargs = {}
+        if scheme == 'https':
+            kwargs['ssl'] = context
+            kwargs['server_hostname'] = host
+        start = time.monotonic()
+        for i, x in enumerate(addrs):
+            try:
+                reader, writer = await asyncio.open_connection(
+                    x[4][0], x[4][1], **kwargs)
+            except OSError:
+                if i == len(addrs) - 1:
+                    raise
+                continue
+            break
+        timing['connect'] = time.monotonic() - start
+
+        return cls(scheme, host, port, reader, writer)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def request(self, method, selector, body, headers):
+        host = self.host
+        if ':' in host:
+            host = '[%s]' % host  # IPv6
+        if self.port != (443 if self.scheme == 'https' else 80):
+            host += ':%d' % self.port
+
+        lines = ['%s %s HTTP/1.1' % (method, selector),
+                 'Host: %s' % host,
+                 'Accept-Encoding: identity']
+        lines.extend('%s: %s' % (k, v) for k, v in headers.items())
+        data = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+        self.writer.write(data)
+        if isinstance(body, (bytes, bytearray)):
+            self.writer.write(body)
+        elif body is not None:
+            # iterable body, e.g., streaming multipart upload
+            for chunk in body:
+                self.writer.write(chunk)
+                await self.writer.drain()
+        await self.writer.drain()
+
+        while True:
+            response = _AsyncResponse(self.reader, method)
+            await response.begin()
+            # skip 1xx informational responses
+            if not 100 <= response.status < 200:
+                return response
+
+
+class _AsyncResponse:
+    def __init__(self, reader, method):
+        self._reader = reader
+        self._method = method
+        self.status = None
+        self.reason = None
+        self.version = None
+        self.headers = None
+        self.will_close = True
+        self.length = None
+        self.chunked = False
+        self.chunk_left = 0
+        self._done = False
+
+    async def begin(self):
+        line = await self._reader.readline()
+        if not line:
+            raise http.client.RemoteDisconnected('Remote end closed '
+                                                 'connection without '
+                                                 'response')
+        try:
+            version, status, reason = \
+                (line.decode('iso-8859-1').rstrip('\r\n').split(None, 2) +
+                 [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(line)
+        if not version.startswith('HTTP/'):
+            raise http.client.BadStatusLine(line)
+        self.version = version
+        self.status = status
+        self.reason = reason.strip()
+
+        block = b''
+        while True:
+            line = await self._reader.readline()
+            if not line:
+                raise asyncio.IncompleteReadError(block, None)
+            if line in [b'\r\n', b'\n']:
+                break
+            block += line
+        self.headers = http.client.parse_headers(BytesIO(block + b'\r\n'))
+
+        connection = self.headers.get('connection', '').lower()
+        if version == 'HTTP/1.0':
+            self.will_close = 'keep-alive' not in connection
+        else:
+            self.will_close = 'close' in connection
+
+        encoding = self.headers.get('transfer-encoding', '').lower()
+        length = self.headers.get('content-length')
+        if encoding == 'chunked':
+            self.chunked = True
+        elif length is not None:
+            try:
+                self.length = int(length)
+            except ValueError:
+                raise http.client.BadStatusLine(line)
+        elif (self.status in [http.client.NO_CONTENT,
+                              http.client.NOT_MODIFIED] or
+              self._method == 'HEAD'):
+            self.length = 0
+        else:
+            # body is delimited by connection close
+            self.will_close = True
+
+        if self.length == 0:
+            self._done = True
+
+    def isclosed(self):
+        return self._done
+
+    async def read(self, amt=None):
+        if self._done:
+            return b''
+
+        if self.chunked:
+            return await self._read_chunked(amt)
+
+        if self.length is not None:
+            n = self.length if amt is None else min(amt, self.length)
+            data = await self._reader.readexactly(n)
+            self.length -= n
+            if self.length == 0:
+                self._done = True
+            return data
+
+        data = await self._reader.read(-1 if amt is None else amt)
+        if not data or amt is None:
+            self._done = True
+        return data
+
+    async def _read_chunked(self, amt):
+        buf = []
+        while amt is None or amt > 0:
+            if self.chunk_left == 0:
+                line = await self._reader.readline()
+                try:
+                    self.chunk_left = int(line.split(b';', 1)[0], 16)
+                except ValueError:
+                    raise http.client.IncompleteRead(b''.join(buf))
+                if self.chunk_left == 0:
+                    # trailer
+                    while True:
+                        line = await self._reader.readline()
+                        if line in [b'\r\n', b'\n', b'']:
+                            break
+                    self._done = True
+                    break
+            n = self.chunk_left if amt is None else min(amt,
+                                                        self.chunk_left)
+            buf.append(await self._reader.readexactly(n))
+            self.chunk_left -= n
+            if amt is not None:
+                amt -= n
+            if self.chunk_left == 0:
+                await self._reader.readexactly(2)  # CRLF
+
+        return b''.join(buf)
+
+
+class _AsyncPooledResponse:
+    # Response returned by AsyncPanConnectionPool.urlopen(); the
+    # connection is returned to the pool when the response is closed.
+
+    def __init__(self, pool, key, conn, response, url, timeout):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._timeout = timeout
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.will_close = response.will_close
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.status
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def info(self):
+        return self.headers
+
+    @property
+    def closed(self):
+        return self._conn is None
+
+    async def read(self, amt=None):
+        try:
+            return await asyncio.wait_for(self._response.read(amt),
+                                          self._timeout)
+        except asyncio.TimeoutError:
+            self._abort()
+            raise URLError(socket.timeout('timed out'))
+        except (ConnectionError, asyncio.IncompleteReadError,
+                http.client.HTTPException) as e:
+            self._abort()
+            raise URLError(e)
+
+    def _abort(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn = self._conn
+        self._conn = None
+        self._pool._release(self._key, conn, self._response)
+
+
+if __name__ == '__main__':
+    # python -m pan.pool url [count]
+    import pan.pool
+
+    if len(sys.argv) < 2:
+        print('usage: python -m pan.pool url [count]', file=sys.stderr)
+        sys.exit(1)
+    url = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    import ssl
+    context = ssl._create_unverified_context()
+    pool = pan.pool.PanConnectionPool()
+    for i in range(count):
+        start = time.monotonic()
+        try:
+            with pool.urlopen(url, context=context) as response:
+                body = response.read()
+        except URLError as e:
+            body = b''
+            print('%d: %s' % (i, e), file=sys.stderr)
+        print('%d: %d bytes %.3f seconds' %
+              (i, len(body), time.monotonic() - start))
+    pool.close()
@@ -0,0 +1,253 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Client-side API request rate limiter
+
+The pan.ratelimit module implements the PanRateLimiter class, a token
+bucket rate limiter for each host and API key which is passed to the
+PanXapi, PanWFapi, PanAFapi and PanLicapi rate_limit argument.  It
+can be shared by threads, and by processes using a lock file.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+try:
+    import fcntl
+    _have_fcntl = True
+except ImportError:
+    _have_fcntl = False
+
+from . import DEBUG1, DEBUG2
+
+
+class PanRateLimitError(Exception):
+    pass
+
+
+class PanRateLimiter:
+    """Token bucket rate limiter.
+
+    Each host and API key has a bucket of burst tokens which is
+    refilled at rate tokens per second; a request takes a token, and
+    waits for it when the bucket is empty.  Tokens are reserved in
+    request order, so waiting requests do not poll.
+
+    When path is specified the buckets are stored in the file, which
+    is locked while a token is reserved, so the limit is shared by
+    processes using the same path.
+    """
+
+    def __init__(self, rate=None, burst=None, path=None):
+        self._log = logging.getLogger(__name__).log
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        self.requests = 0
+        self.waits = 0
+        self.wait = 0.0
+        self._lock = threading.Lock()
+        self._buckets = {}  # key: [tokens, time]
+
+        try:
+            self.rate = float(self.rate)
+            if not self.rate > 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise PanRateLimitError('Invalid rate: %s' % self.rate)
+
+        if self.burst is None:
+            self.burst = max(1.0, self.rate)
+        try:
+            self.burst = float(self.burst)
+            if self.burst < 1:
+                raise ValueError
+        except ValueError:
+            raise PanRateLimitError('Invalid burst: %s' % self.burst)
+
+        if self.path is not None:
+            if not _have_fcntl:
+                raise PanRateLimitError('path requires fcntl')
+            self.path = os.path.expanduser(self.path)
+            # time.time() is the same clock for all processes
+            self._clock = time.time
+        else:
+            self._clock = time.monotonic
+
+    @staticmethod
+    def key(host, api_key=None):
+        # the API key is not stored in the state file
+        if not api_key:
+            return host
+        h = hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        return '%s %s' % (host, h)
+
+    def _take(self, buckets, key, now):
+        tokens, last = buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + max(0.0, now - last) * self.rate)
+        tokens -= 1
+        buckets[key] = [tokens, now]
+
+        # remove full buckets
+        for k, (tokens_, last_) in list(buckets.items()):
+            if k != key and \
+               tokens_ + (now - last_) * self.rate >= self.burst:
+                del buckets[k]
+
+        return 0.0 if tokens >= 0 else -tokens / self.rate
+
+    def _reserve_file(self, key):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            data = b''
+            while True:
+                x = os.read(fd, 64 * 1024)
+                if not x:
+                    break
+                data += x
+            try:
+                buckets = json.loads(data) if data else {}
+                if not isinstance(buckets, dict):
+                    raise ValueError
+            except ValueError:
+                self._log(DEBUG1, 'invalid rate limit file: %s', self.path)
+                buckets = {}
+
+            wait = self._take(buckets, key, self._clock())
+
+            data = json.dumps(buckets).encode()
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            os.write(fd, data)
+        except OSError as e:
+            raise PanRateLimitError('%s: %s' % (self.path, e))
+        finally:
+            os.close(fd)
+
+        return wait
+
+    def reserve(self, host, api_key=None):
+        """Take a token for host and api_key and return the seconds
+        to wait before the request is performed."""
+
+        key = self.key(host, api_key)
+        with self._lock:
+            if self.path is None:
+                wait = self._take(self._buckets, key, self._clock())
+            else:
+                wait = self._reserve_file(key)
+            self.requests += 1
+            if wait > 0:
+                self.waits += 1
+                self.wait += wait
+
+        if wait > 0:
+            self._log(DEBUG2, 'rate limit %s: wait %.3fs', host, wait)
+
+        return wait
+
+    def acquire(self, host, api_key=None):
+        wait = self.reserve(host, api_key)
+        if wait > 0:
+            time.sleep(wait)
+
+        return wait
+
+    async def acquire_async(self, host, api_key=None):
+        if self.path is not None:
+            # the shared state file is locked and read, which can
+            # block the event loop
+            loop = asyncio.get_running_loop()
+            wait = await loop.run_in_executor(None, self.reserve,
+                                              host, api_key)
+        else:
+            wait = self.reserve(host, api_key)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        return wait
+
+
+def _bench_worker(path, rate, burst, n):
+    x = PanRateLimiter(rate=rate, burst=burst, path=path)
+    for _ in range(n):
+        x.acquire('firewall', 'key')
+
+
+if __name__ == '__main__':
+    # python -m pan.ratelimit [rate]
+    import concurrent.futures
+    import multiprocessing
+    import tempfile
+    import pan.ratelimit
+
+    try:
+        rate = float(sys.argv[1]) if len(sys.argv) > 1 else 200.0
+    except ValueError:
+        print('usage: python -m pan.ratelimit [rate]', file=sys.stderr)
+        sys.exit(1)
+
+    n = int(rate * 2)
+    burst = rate / 10
+    workers = 4
+
+    x = pan.ratelimit.PanRateLimiter(rate=1e9)
+    start = time.perf_counter()
+    for _ in range(10000):
+        x.reserve('firewall', 'key')
+    memory = (time.perf_counter() - start) / 10000
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'ratelimit')
+        x = pan.ratelimit.PanRateLimiter(rate=1e9, path=path)
+        start = time.perf_counter()
+        for _ in range(1000):
+            x.reserve('firewall', 'key')
+        locked = (time.perf_counter() - start) / 1000
+
+        print('reserve: %.2fus, with lock file %.2fus' %
+              (memory * 1e6, locked * 1e6))
+        expected = (n - burst) / rate
+
+        x = pan.ratelimit.PanRateLimiter(rate=rate, burst=burst)
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            for _ in range(workers):
+                executor.submit(lambda: [x.acquire('firewall', 'key')
+                                         for _ in range(n // workers)])
+        elapsed = time.perf_counter() - start
+        print('%d threads: %d requests %.3fs, %.1f/s (%.3fs expected)' %
+              (workers, n, elapsed, n / elapsed, expected))
+
+        start = time.perf_counter()
+        procs = [multiprocessing.Process(
+            target=pan.ratelimit._bench_worker,
+            args=(path + '.procs', rate, burst, n // workers))
+                 for _ in range(workers)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        elapsed = time.perf_counter() - start
+        print('%d processes: %d requests %.3fs, %.1f/s (%.3fs expected)' %
+              (workers, n, elapsed, n / elapsed, expected))
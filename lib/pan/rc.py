@@ -31,6 +31,7 @@ _valid_varnames = set([
     'api_username',
     'api_password',
     'api_key',
+    'api_key_cache',
     'agent',
 ])
 _sanitize_varnames = set([
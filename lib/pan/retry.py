@@ -0,0 +1,318 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Retry policy and circuit breaker for API requests
+
+The pan.retry module implements the PanRetry class, a retry policy
+with jittered exponential backoff which is passed to the PanXapi,
+PanWFapi, PanAFapi and PanLicapi retry argument, and the
+PanCircuitBreaker class, which fails requests to a host immediately
+after consecutive connection failures.  The objects are thread-safe
+and can be shared by the API objects of a fleet.
+"""
+
+import datetime
+import email.utils
+import logging
+import random
+import re
+import socket
+import ssl
+import sys
+import threading
+import time
+
+from . import DEBUG1
+
+_codes = (429, 500, 502, 503, 504)
+_busy_re = re.compile(r'try again later|is busy|'
+                      r'another commit is in progress', re.IGNORECASE)
+
+
+class PanRetryError(Exception):
+    pass
+
+
+class PanCircuitBreaker:
+    """Per-host circuit breaker.
+
+    After threshold consecutive failures for a host the circuit is
+    open and allow() returns False.  After reset_timeout seconds one
+    request is allowed (half-open); when it succeeds the circuit is
+    closed, otherwise it is open for another reset_timeout seconds.
+    """
+
+    threshold = 3
+    reset_timeout = 30.0
+
+    def __init__(self, threshold=None, reset_timeout=None):
+        self._log = logging.getLogger(__name__).log
+        if threshold is not None:
+            self.threshold = threshold
+        if reset_timeout is not None:
+            self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._hosts = {}  # key: [failures, opened]
+
+        try:
+            self.threshold = int(self.threshold)
+            if self.threshold < 1:
+                raise ValueError
+        except ValueError:
+            raise PanRetryError('Invalid threshold: %s' % self.threshold)
+        try:
+            self.reset_timeout = float(self.reset_timeout)
+            if self.reset_timeout < 0:
+                raise ValueError
+        except ValueError:
+            raise PanRetryError('Invalid reset_timeout: %s' %
+                                self.reset_timeout)
+
+    def allow(self, key):
+        with self._lock:
+            x = self._hosts.get(key)
+            if x is None or x[1] is None:
+                return True
+            now = time.monotonic()
+            if now - x[1] < self.reset_timeout:
+                return False
+            # half-open: the next request is a trial, others fail
+            # until it completes or reset_timeout expires again
+            x[1] = now
+            self._log(DEBUG1, 'circuit half-open: %s', key)
+            return True
+
+    def success(self, key):
+        with self._lock:
+            x = self._hosts.pop(key, None)
+        if x is not None and x[1] is not None:
+            self._log(DEBUG1, 'circuit closed: %s', key)
+
+    def failure(self, key):
+        with self._lock:
+            x = self._hosts.setdefault(key, [0, None])
+            x[0] += 1
+            if x[0] < self.threshold:
+                return
+            x[1] = time.monotonic()
+            failures = x[0]
+        self._log(DEBUG1, 'circuit open: %s %d failures', key, failures)
+
+    def state(self, key):
+        """Return 'closed', 'open' or 'half-open'."""
+
+        with self._lock:
+            x = self._hosts.get(key)
+            if x is None or x[1] is None:
+                return 'closed'
+            if time.monotonic() - x[1] < self.reset_timeout:
+                return 'open'
+            return 'half-open'
+
+
+class PanRetry:
+    """Retry policy.
+
+    A failed request is retried up to retries times.  The first retry
+    is after interval seconds, which is increased by factor for each
+    retry up to max_interval, with random jitter; a Retry-After
+    response header is used instead when present, and a request is
+    not retried when it is greater than max_retry_after.
+
+    Connection errors, timeouts, the HTTP status codes in codes and
+    busy responses are retried; certificate verification errors are
+    not.  A request which is not idempotent is retried only when it
+    was not performed: the connection was refused, the host name did
+    not resolve, the status code is 429 or the response is busy.
+    Commits are never retried.
+    """
+
+    retries = 3
+    interval = 0.5
+    factor = 2.0
+    max_interval = 30.0
+    jitter = 0.2
+    max_retry_after = 120.0
+    codes = _codes
+
+    def __init__(self, retries=None, interval=None, max_interval=None,
+                 breaker=None):
+        self._log = logging.getLogger(__name__).log
+        if retries is not None:
+            self.retries = retries
+        if interval is not None:
+            self.interval = interval
+        if max_interval is not None:
+            self.max_interval = max_interval
+        self.breaker = breaker
+        self.retried = 0
+
+        try:
+            self.retries = int(self.retries)
+            if self.retries < 0:
+                raise ValueError
+        except ValueError:
+            raise PanRetryError('Invalid retries: %s' % self.retries)
+        for x in ['interval', 'max_interval']:
+            try:
+                setattr(self, x, float(getattr(self, x)))
+                if getattr(self, x) < 0:
+                    raise ValueError
+            except ValueError:
+                raise PanRetryError('Invalid %s: %s' % (x, getattr(self, x)))
+
+    def allow(self, key):
+        """Return False when the circuit for key is open."""
+
+        return self.breaker is None or self.breaker.allow(key)
+
+    def success(self, key):
+        if self.breaker is not None:
+            self.breaker.success(key)
+
+    def next_interval(self, attempt):
+        interval = min(self.interval * self.factor ** attempt,
+                       self.max_interval)
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        return interval
+
+    def failed(self, key, attempt, idempotent=True, error=None, code=None,
+               busy=False, retry_after=None):
+        """Record failed attempt number attempt (0 is the first) for
+        host key and return the seconds to wait before retrying, or
+        None when the request is not retried.
+
+        idempotent is True when the request can be repeated, False
+        when it can be retried only if it was not performed, and None
+        when it is never retried.  code is the HTTP status code and
+        retry_after is the Retry-After header value; when code is None
+        they are from error, the exception for the request.
+        """
+
+        if code is None and getattr(error, 'code', None) is not None:
+            # HTTPError
+            code = error.code
+            if retry_after is None and error.headers is not None:
+                retry_after = error.headers.get('Retry-After')
+
+        sent = True
+        if code is None:
+            # URLError reason or requests exception cause
+            reason = getattr(error, 'reason', None) or \
+                getattr(error, '__context__', None) or error
+            if isinstance(reason, ssl.CertificateError):
+                return None
+            sent = not isinstance(reason, (ConnectionRefusedError,
+                                           socket.gaierror))
+
+        if code is None or code >= 500:
+            if self.breaker is not None:
+                self.breaker.failure(key)
+        else:
+            self.success(key)
+
+        if idempotent is None or attempt >= self.retries:
+            return None
+        if not (busy or code is None or code in self.codes):
+            return None
+        if not idempotent and not (busy or not sent or code == 429):
+            return None
+        if not self.allow(key):
+            return None
+
+        interval = _retry_after(retry_after)
+        if interval is None:
+            interval = self.next_interval(attempt)
+        elif interval > self.max_retry_after:
+            self._log(DEBUG1, 'Retry-After %s exceeds %s', retry_after,
+                      self.max_retry_after)
+            return None
+
+        self.retried += 1
+        self._log(DEBUG1, 'retry %d for %s in %.3fs', attempt + 1, key,
+                  interval)
+
+        return interval
+
+
+def busy(status_detail):
+    """Return True when status_detail is a management plane busy
+    message."""
+
+    return status_detail is not None and \
+        _busy_re.search(str(status_detail)) is not None
+
+
+def _retry_after(value):
+    # delay-seconds or HTTP-date
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        x = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if x.tzinfo is None:
+        x = x.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    return max(0.0, (x - now).total_seconds())
+
+
+if __name__ == '__main__':
+    # python -m pan.retry [hosts]
+    import pan.retry
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    except ValueError:
+        print('usage: python -m pan.retry [hosts]', file=sys.stderr)
+        sys.exit(1)
+
+    # a fleet job with 1 dead host and 10 requests per host, each
+    # failed attempt costing a 5 second connect timeout
+    timeout = 5.0
+    for breaker in [None, pan.retry.PanCircuitBreaker()]:
+        retry = pan.retry.PanRetry(breaker=breaker)
+        requests = attempts = 0
+        wait = 0.0
+        start = time.perf_counter()
+        for i in range(10):
+            for host in range(n):
+                requests += 1
+                attempt = 0
+                while retry.allow(host):
+                    attempts += 1
+                    if host != 0:
+                        retry.success(host)
+                        break
+                    wait += timeout
+                    interval = retry.failed(
+                        host, attempt, error=ConnectionRefusedError())
+                    if interval is None:
+                        break
+                    wait += interval
+                    attempt += 1
+        elapsed = time.perf_counter() - start
+
+        print('%-14s %d requests %d attempts, dead host %.1fs, '
+              '%.2fus per request' %
+              ('breaker' if breaker else 'no breaker', requests, attempts,
+               wait, elapsed / requests * 1e6))
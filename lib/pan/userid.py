@@ -0,0 +1,575 @@
+#
+# Copyright (c) 2026 Kevin Steves <kevin.steves@pobox.com>
+#
+# Permission to use, copy, modify, and distribute this software for any
+# purpose with or without fee is hereby granted, provided that the above
+# copyright notice and this permission notice appear in all copies.
+#
+# THE SOFTWARE IS PROVIDED "AS IS" AND THE AUTHOR DISCLAIMS ALL WARRANTIES
+# WITH REGARD TO THIS SOFTWARE INCLUDING ALL IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS. IN NO EVENT SHALL THE AUTHOR BE LIABLE FOR
+# ANY SPECIAL, DIRECT, INDIRECT, OR CONSEQUENTIAL DAMAGES OR ANY DAMAGES
+# WHATSOEVER RESULTING FROM LOSS OF USE, DATA OR PROFITS, WHETHER IN AN
+# ACTION OF CONTRACT, NEGLIGENCE OR OTHER TORTIOUS ACTION, ARISING OUT OF
+# OR IN CONNECTION WITH THE USE OR PERFORMANCE OF THIS SOFTWARE.
+#
+
+"""Batch PAN-OS User-ID updates
+
+The pan.userid module implements the PanUserIdBatch class.  It
+coalesces User-ID login, logout and tag registration events, builds
+uid-message documents of a maximum size, and performs the user_id()
+requests concurrently with a bounded number of requests in progress.
+
+The PanDagSync class synchronizes the IP address tags used by dynamic
+address groups to a desired state by registering and unregistering
+only the tags which changed.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import sys
+import time
+from xml.sax.saxutils import escape, quoteattr
+
+from . import DEBUG1, DEBUG2
+import pan.pool
+import pan.xapi
+
+_max_size = 64 * 1024
+_parallel = 4
+_header = ('<uid-message><version>2.0</version><type>update</type>'
+           '<payload>')
+_footer = '</payload></uid-message>'
+_commands = ['login', 'logout', 'register', 'unregister',
+             'register-user', 'unregister-user']
+_CMD_REGISTERED_IP = ('<show><object><registered-ip><all></all>'
+                      '</registered-ip></object></show>')
+
+
+class PanUserIdError(Exception):
+    pass
+
+
+class PanUserIdResult:
+    def __init__(self, id=None, entries=0, size=0):
+        self.id = id
+        self.entries = entries
+        self.size = size
+        self.latency = None
+        self.error = None
+        self.errors = []
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        status = 'ok' if self.ok else 'error: %s' % self.error
+        return 'uid-message %d: %d entries %d bytes %s %.3fs' % (
+            self.id, self.entries, self.size, status, self.latency)
+
+
+class PanUserIdBatch:
+    def __init__(self, max_size=_max_size, max_entries=None,
+                 parallel=_parallel):
+        self._log = logging.getLogger(__name__).log
+        self.max_size = max_size
+        self.max_entries = max_entries
+        self.parallel = parallel
+        self.events = 0
+        self.requests = 0
+        self._mappings = {}  # ip: (command, user, timeout)
+        self._tags = {}  # (ip or user, value, tag): (command, timeout)
+
+        for x in ['max_size', 'max_entries', 'parallel']:
+            value = getattr(self, x)
+            if value is None and x == 'max_entries':
+                continue
+            try:
+                value = int(value)
+                if value < 1:
+                    raise ValueError
+            except ValueError:
+                raise PanUserIdError('Invalid %s: %s' % (x, value))
+            setattr(self, x, value)
+
+    def __len__(self):
+        return len(self._mappings) + len(self._tags)
+
+    def login(self, user, ip, timeout=None):
+        # a login replaces the previous event for the IP address
+        self.events += 1
+        self._mappings[ip] = ('login', user, timeout)
+
+    def logout(self, user, ip):
+        self.events += 1
+        x = self._mappings.get(ip)
+        if x is not None and x[0] == 'login' and x[1] != user:
+            # does not remove the mapping for another user
+            self._log(DEBUG2, 'logout %s %s: login %s', user, ip, x[1])
+            return
+        self._mappings[ip] = ('logout', user, None)
+
+    def register(self, ip, tags, timeout=None):
+        self.__tags('register', 'ip', ip, tags, timeout)
+
+    def unregister(self, ip, tags):
+        self.__tags('unregister', 'ip', ip, tags, None)
+
+    def register_user(self, user, tags, timeout=None):
+        self.__tags('register-user', 'user', user, tags, timeout)
+
+    def unregister_user(self, user, tags):
+        self.__tags('unregister-user', 'user', user, tags, None)
+
+    def __tags(self, command, key, value, tags, timeout):
+        # the last event for a tag replaces the previous events
+        self.events += 1
+        if isinstance(tags, str):
+            tags = [tags]
+        for tag in tags:
+            self._tags[(key, value, tag)] = (command, timeout)
+
+    def _entries(self):
+        # entry elements by command; tags are grouped by IP address
+        # or user
+        commands = dict((x, []) for x in _commands)
+
+        for ip, (command, user, timeout) in self._mappings.items():
+            x = '<entry name=%s ip=%s' % (quoteattr(user), quoteattr(ip))
+            if timeout is not None:
+                x += ' timeout="%d"' % int(timeout)
+            commands[command].append(x + '/>')
+
+        groups = {}
+        for (key, value, tag), (command, timeout) in self._tags.items():
+            if timeout is None:
+                x = '<member>%s</member>' % escape(tag)
+            else:
+                x = '<member timeout="%d">%s</member>' % (int(timeout),
+                                                          escape(tag))
+            groups.setdefault((command, key, value), []).append(x)
+
+        for (command, key, value), members in groups.items():
+            commands[command].append('<entry %s=%s><tag>%s</tag></entry>' %
+                                     (key, quoteattr(value),
+                                      ''.join(members)))
+
+        for command in _commands:
+            for x in commands[command]:
+                yield command, x
+
+    @staticmethod
+    def _message(chunk):
+        x = [_header]
+        command = None
+        for cmd, entry in chunk:
+            if cmd != command:
+                if command is not None:
+                    x.append('</%s>' % command)
+                command = cmd
+                x.append('<%s>' % command)
+            x.append(entry)
+        x.append('</%s>' % command)
+        x.append(_footer)
+
+        return ''.join(x)
+
+    def _chunks(self):
+        # uid-message documents of max_size bytes and max_entries
+        # entries; an entry larger than max_size is a document
+        overhead = len(_header) + len(_footer)
+        chunk = []
+        size = overhead
+
+        for command, x in self._entries():
+            n = len(x.encode())
+            if not chunk or chunk[-1][0] != command:
+                n += len(command) * 2 + 5
+            if chunk and (size + n > self.max_size or
+                          (self.max_entries is not None and
+                           len(chunk) >= self.max_entries)):
+                yield self._message(chunk), len(chunk)
+                chunk = []
+                size = overhead
+                n = len(x.encode()) + len(command) * 2 + 5
+            chunk.append((command, x))
+            size += n
+
+        if chunk:
+            yield self._message(chunk), len(chunk)
+
+    def messages(self):
+        """Return a list of uid-message documents."""
+
+        return [x for x, _ in self._chunks()]
+
+    @staticmethod
+    def _uid_errors(xapi):
+        # entries from the uid-response in the response message
+        if xapi.element_root is None:
+            return []
+
+        errors = []
+        path = pan.xapi._uid_response_payload + '/*'
+        for command in xapi.element_root.findall(path):
+            for x in command.findall('entry'):
+                errors.append((command.tag, dict(x.items())))
+
+        return errors
+
+    def _send(self, xapis, id, document, n, vsys):
+        result = PanUserIdResult(id=id, entries=n, size=len(document))
+        xapi = xapis.get()
+        start = time.monotonic()
+        try:
+            xapi.user_id(cmd=document, vsys=vsys)
+        except pan.xapi.PanXapiError as e:
+            result.error = str(e)
+        finally:
+            result.latency = time.monotonic() - start
+            result.errors = self._uid_errors(xapi)
+            xapis.put(xapi)
+
+        self._log(DEBUG2, '%s', result)
+        return result
+
+    def run(self, vsys=None, **kwargs):
+        """Perform the user_id() requests using a thread pool.
+
+        kwargs are PanXapi() arguments; a PanXapi object is created
+        for each of parallel requests in progress, and they share a
+        connection pool and API key.  A generator is returned which
+        yields a PanUserIdResult object as each request completes.
+        """
+
+        chunks = list(self._chunks())
+        self._log(DEBUG1, '%d events: %d entries %d uid-messages',
+                  self.events, len(self), len(chunks))
+        if not chunks:
+            return
+
+        pool = None
+        if kwargs.get('connection_pool') is None:
+            pool = pan.pool.PanConnectionPool()
+            kwargs['connection_pool'] = pool
+
+        try:
+            xapi = pan.xapi.PanXapi(**kwargs)
+            if xapi.api_key is None:
+                # one API key for all requests
+                xapi.keygen()
+            kwargs['api_key'] = xapi.api_key
+            xapis = queue.SimpleQueue()
+            xapis.put(xapi)
+            for _ in range(min(self.parallel, len(chunks)) - 1):
+                xapis.put(pan.xapi.PanXapi(**kwargs))
+
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.parallel) as executor:
+                futures = [executor.submit(self._send, xapis, i, x, n, vsys)
+                           for i, (x, n) in enumerate(chunks, 1)]
+                try:
+                    for future in concurrent.futures.as_completed(futures):
+                        self.requests += 1
+                        yield future.result()
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            if pool is not None:
+                pool.close()
+
+    async def _send_async(self, xapis, id, document, n, vsys):
+        result = PanUserIdResult(id=id, entries=n, size=len(document))
+        xapi = await xapis.get()
+        start = time.monotonic()
+        try:
+            await xapi.user_id(cmd=document, vsys=vsys)
+        except pan.xapi.PanXapiError as e:
+            result.error = str(e)
+        finally:
+            result.latency = time.monotonic() - start
+            result.errors = self._uid_errors(xapi)
+            xapis.put_nowait(xapi)
+
+        self._log(DEBUG2, '%s', result)
+        return result
+
+    async def run_async(self, vsys=None, **kwargs):
+        """Like run(), but AsyncPanXapi objects are used, and an
+        asynchronous generator is returned."""
+
+        chunks = list(self._chunks())
+        self._log(DEBUG1, '%d events: %d entries %d uid-messages',
+                  self.events, len(self), len(chunks))
+        if not chunks:
+            return
+
+        pool = None
+        if kwargs.get('connection_pool') is None:
+            pool = pan.pool.AsyncPanConnectionPool()
+            kwargs['connection_pool'] = pool
+
+        tasks = []
+        try:
+            xapi = pan.xapi.AsyncPanXapi(**kwargs)
+            if xapi.api_key is None:
+                # one API key for all requests
+                await xapi.keygen()
+            kwargs['api_key'] = xapi.api_key
+            xapis = asyncio.Queue()
+            xapis.put_nowait(xapi)
+            for _ in range(min(self.parallel, len(chunks)) - 1):
+                xapis.put_nowait(pan.xapi.AsyncPanXapi(**kwargs))
+
+            tasks = [asyncio.ensure_future(
+                self._send_async(xapis, i, x, n, vsys))
+                     for i, (x, n) in enumerate(chunks, 1)]
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                self.requests += 1
+                yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            if pool is not None:
+                pool.close()
+
+
+class PanDagSync:
+    def __init__(self, tags=None, timeout=None, max_size=_max_size,
+                 max_entries=None, parallel=_parallel):
+        self._log = logging.getLogger(__name__).log
+        self.tags = None if tags is None else set(tags)
+        self.timeout = timeout
+        self.current = None
+        self.batch = None
+        self._batch_kwargs = {
+            'max_size': max_size,
+            'max_entries': max_entries,
+            'parallel': parallel,
+        }
+        self._next = None
+
+        # validate arguments
+        PanUserIdBatch(**self._batch_kwargs)
+
+    def _fetched(self, entries):
+        current = {}
+        for x in entries:
+            ip = x.get('ip')
+            if ip is None:
+                continue
+            current[ip] = set(m.text for m in x.findall('tag/member')
+                              if m.text)
+
+        self._log(DEBUG1, 'registered-ip: %d addresses', len(current))
+        self.current = current
+
+        return current
+
+    def fetch(self, xapi, vsys=None):
+        """Set current to the registered IP addresses and tags on the
+        device, using the pan.xapi.PanXapi object xapi."""
+
+        entries = xapi.iter_result('op', cmd=_CMD_REGISTERED_IP, vsys=vsys,
+                                   path='result/entry')
+        return self._fetched(entries)
+
+    async def fetch_async(self, xapi, vsys=None):
+        """Like fetch(), but xapi is an AsyncPanXapi object."""
+
+        entries = [x async for x in xapi.iter_result(
+            'op', cmd=_CMD_REGISTERED_IP, vsys=vsys, path='result/entry')]
+        return self._fetched(entries)
+
+    def delta(self, desired):
+        """Return a PanUserIdBatch object with the register and
+        unregister events which change current to desired.
+
+        desired is a dictionary of IP address to an iterable of tags.
+        When tags was specified, only those tags are registered and
+        unregistered; otherwise all tags are.
+        """
+
+        if self.current is None:
+            raise PanUserIdError('no current registered-ip state')
+
+        batch = PanUserIdBatch(**self._batch_kwargs)
+        managed = self.tags
+        next = {}
+
+        for ip in self.current.keys() | desired.keys():
+            current = self.current.get(ip, set())
+            tags = set(desired.get(ip, ()))
+            if managed is not None:
+                tags &= managed
+                unmanaged = current - managed
+            else:
+                unmanaged = set()
+
+            x = sorted(tags - current)
+            if x:
+                batch.register(ip, x, self.timeout)
+            x = sorted(current - tags - unmanaged)
+            if x:
+                batch.unregister(ip, x)
+
+            x = tags | unmanaged
+            if x:
+                next[ip] = x
+
+        self._log(DEBUG1, 'delta: %d addresses %d updates',
+                  len(next), len(batch))
+        self.batch = batch
+        self._next = next
+
+        return batch
+
+    def _synced(self, results):
+        # when all requests succeed the state is known, otherwise it
+        # is fetched next time
+        if all(x.ok for x in results):
+            self.current = self._next
+        else:
+            self.current = None
+        self._next = None
+
+    def sync(self, desired, vsys=None, refresh=True, **kwargs):
+        """Register and unregister tags so the device state is
+        desired.
+
+        The current state is fetched when refresh is True or it is
+        not known.  kwargs are PanXapi() arguments.  A generator is
+        returned which yields a PanUserIdResult object as each
+        request completes.
+        """
+
+        pool = None
+        if kwargs.get('connection_pool') is None:
+            pool = pan.pool.PanConnectionPool()
+            kwargs['connection_pool'] = pool
+
+        synced = False
+        try:
+            if refresh or self.current is None:
+                xapi = pan.xapi.PanXapi(**kwargs)
+                self.fetch(xapi, vsys)
+                # the batch requests use the API key
+                kwargs['api_key'] = xapi.api_key
+
+            results = []
+            for x in self.delta(desired).run(vsys=vsys, **kwargs):
+                results.append(x)
+                yield x
+            self._synced(results)
+            synced = True
+        finally:
+            if not synced:
+                # an error or an unfinished generator leaves the
+                # state unknown
+                self.current = None
+                self._next = None
+            if pool is not None:
+                pool.close()
+
+    async def sync_async(self, desired, vsys=None, refresh=True,
+                         **kwargs):
+        """Like sync(), but AsyncPanXapi objects are used, and an
+        asynchronous generator is returned."""
+
+        pool = None
+        if kwargs.get('connection_pool') is None:
+            pool = pan.pool.AsyncPanConnectionPool()
+            kwargs['connection_pool'] = pool
+
+        synced = False
+        try:
+            if refresh or self.current is None:
+                xapi = pan.xapi.AsyncPanXapi(**kwargs)
+                await self.fetch_async(xapi, vsys)
+                # the batch requests use the API key
+                kwargs['api_key'] = xapi.api_key
+
+            results = []
+            async for x in self.delta(desired).run_async(vsys=vsys,
+                                                         **kwargs):
+                results.append(x)
+                yield x
+            self._synced(results)
+            synced = True
+        finally:
+            if not synced:
+                # an error or an unfinished generator leaves the
+                # state unknown
+                self.current = None
+                self._next = None
+            if pool is not None:
+                pool.close()
+
+
+if __name__ == '__main__':
+    # python -m pan.userid [events]
+    import random
+    import pan.userid
+
+    try:
+        n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    except ValueError:
+        print('usage: python -m pan.userid [events]', file=sys.stderr)
+        sys.exit(1)
+
+    # events for 5000 IP addresses and 10 tags
+    random.seed(1)
+    events = []
+    for i in range(n):
+        ip = '10.0.%d.%d' % divmod(random.randrange(5000), 256)
+        x = random.random()
+        if x < 0.4:
+            events.append(('login', 'user%d' % random.randrange(1000), ip))
+        elif x < 0.5:
+            events.append(('logout', 'user%d' % random.randrange(1000), ip))
+        else:
+            events.append(('register', ip,
+                           ['tag%d' % random.randrange(10)]))
+
+    start = time.perf_counter()
+    batch = pan.userid.PanUserIdBatch()
+    for x in events:
+        getattr(batch, x[0])(*x[1:])
+    messages = batch.messages()
+    elapsed = time.perf_counter() - start
+
+    size = sum(len(x) for x in messages)
+    print('%d events: %d entries, %d uid-messages %d bytes, %.3fs' %
+          (batch.events, len(batch), len(messages), size, elapsed))
+
+    # DAG tags for 20000 IP addresses, 1% changed
+    current = {}
+    for i in range(20000):
+        ip = '10.%d.%d.%d' % (i >> 16 & 255, i >> 8 & 255, i & 255)
+        current[ip] = set('tag%d' % random.randrange(50)
+                          for _ in range(3))
+    desired = dict((k, set(v)) for k, v in current.items())
+    for ip in random.sample(sorted(desired), len(desired) // 100):
+        desired[ip] = set(['tag%d' % random.randrange(50)])
+
+    full = pan.userid.PanUserIdBatch()
+    for ip, tags in desired.items():
+        full.register(ip, sorted(tags))
+    full = full.messages()
+
+    start = time.perf_counter()
+    dag = pan.userid.PanDagSync()
+    dag.current = current
+    messages = dag.delta(desired).messages()
+    elapsed = time.perf_counter() - start
+
+    print('%d addresses: full %d uid-messages %d bytes, '
+          'delta %d uid-messages %d bytes, %.3fs' %
+          (len(desired), len(full), sum(len(x) for x in full),
+           len(messages), sum(len(x) for x in messages), elapsed))
@@ -30,11 +30,11 @@ and WildFire appliance.
 import socket
 import sys
 import os
-from io import BytesIO
 import email
 import email.errors
 import email.utils
 import logging
+import time
 
 from urllib.request import Request, \
     build_opener, HTTPErrorProcessor, HTTPSHandler
@@ -59,6 +59,7 @@ except ImportError:
 
 _cloud_server = 'wildfire.paloaltonetworks.com'
 _encoding = 'utf-8'
+_upload_read_size = 64 * 1024
 _rfc2231_encode = False
 _wildfire_responses = {
     418: 'Unsupported File Type',
@@ -99,7 +100,9 @@ class PanWFapi:
                  timeout=None,
                  http=False,
                  ssl_context=None,
-                 agent=None):
+                 agent=None,
+                 retry=None,
+                 rate_limit=None):
         self._log = logging.getLogger(__name__).log
         self.tag = tag
         self.hostname = hostname
@@ -107,6 +110,9 @@ class PanWFapi:
         self.timeout = timeout
         self.ssl_context = ssl_context
         self.agent = agent
+        self.retry = retry
+        self.rate_limit = rate_limit
+        self._http_error = None
 
         self._log(DEBUG3, 'Python version: %s', sys.version)
         self._log(DEBUG3, 'xml.etree.ElementTree version: %s', etree.VERSION)
@@ -298,6 +304,49 @@ class PanWFapi:
         return s.decode(_encoding)
 
     def __api_request(self, request_uri, body, headers={}):
+        attempt = 0
+        while True:
+            if self.retry is not None and \
+               not self.retry.allow(self.hostname):
+                self._msg = 'circuit open: %s' % self.hostname
+                return False
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(self.hostname, self.api_key)
+            response = self.__api_request_attempt(request_uri, body,
+                                                  headers)
+            if response:
+                if self.retry is not None:
+                    self.retry.success(self.hostname)
+                return response
+            interval = self.__retry_interval(request_uri, attempt)
+            if interval is None:
+                return False
+            attempt += 1
+            time.sleep(interval)
+            self._msg = None
+
+    def __retry_interval(self, request_uri, attempt):
+        # seconds to wait before retrying the failed request, or None
+        if self.retry is None:
+            return None
+
+        if self.http_code is None:
+            if self._http_error is None:
+                return None
+            retry_after = None
+        else:
+            retry_after = self._message.get('Retry-After')
+
+        # submissions are not idempotent
+        return self.retry.failed(
+            self.hostname, attempt,
+            idempotent=request_uri.startswith('/publicapi/get/'),
+            error=self._http_error, code=self.http_code,
+            retry_after=retry_after)
+
+    def __api_request_attempt(self, request_uri, body, headers={}):
+        self.http_code = None
+        self._http_error = None
         url = self.uri
         url += request_uri
 
@@ -331,6 +380,7 @@ class PanWFapi:
             return False
         except (URLError, IOError) as e:
             self._log(DEBUG2, 'urlopen() exception: %s', sys.exc_info())
+            self._http_error = e
             self._msg = str(e)
             return False
 
@@ -361,30 +411,6 @@ class PanWFapi:
 
         return response
 
-    def _read_file(self, path):
-        try:
-            f = open(path, 'rb')
-        except IOError as e:
-            msg = 'open: %s: %s' % (path, e)
-            self._msg = msg
-            return None
-
-        buf = f.read()
-        f.close()
-
-        self._log(DEBUG2, 'path: %s %d', type(path), len(path))
-        self._log(DEBUG2, 'path: %s size: %d', path, len(buf))
-        if logging.getLogger(__name__).getEffectiveLevel() == DEBUG3:
-            import hashlib
-            md5 = hashlib.md5()
-            md5.update(buf)
-            sha256 = hashlib.sha256()
-            sha256.update(buf)
-            self._log(DEBUG3, 'MD5: %s', md5.hexdigest())
-            self._log(DEBUG3, 'SHA256: %s', sha256.hexdigest())
-
-        return buf
-
     def report(self,
                hash=None,
                format=None,
@@ -566,11 +592,12 @@ class PanWFapi:
             form.add_field('agent', self.agent)
 
         if file is not None:
-            buf = self._read_file(file)
-            if buf is None:
-                raise PanWFapiError(self._msg)
             filename = os.path.basename(file)
-            form.add_file(filename, buf)
+            # file is read in chunks as the request is sent
+            try:
+                form.add_file(filename, path=file)
+            except OSError as e:
+                raise PanWFapiError('open: %s: %s' % (file, e))
 
         if url is not None:
             form.add_field('url', url)
@@ -760,13 +787,16 @@ class _MultiPartFormData:
                              body=value)
         self.parts.append(part)
 
-    def add_file(self, filename=None, body=None):
+    def add_file(self, filename=None, body=None, path=None):
         part = _FormDataPart(name='file')
         if filename is not None:
             part.append_header('filename', filename)
         if body is not None:
             part.add_header(b'Content-Type: application/octet-stream')
             part.add_body(body)
+        elif path is not None:
+            part.add_header(b'Content-Type: application/octet-stream')
+            part.add_path(path)
         self.parts.append(part)
 
     def _boundary(self):
@@ -798,23 +828,44 @@ class _MultiPartFormData:
         headers = {
             'Content-Type':
                 'multipart/form-data; boundary=' + boundary,
+            'Content-Length': str(self.content_length()),
         }
 
         return headers
 
     def http_body(self):
-        bio = BytesIO()
+        if [part for part in self.parts if part.path is not None]:
+            # iterable body, files are read as the request is sent
+            return _MultiPartBody(self)
 
+        return b''.join(self.chunks())
+
+    def chunks(self):
         boundary = b'--' + self.boundary
         for part in self.parts:
-            bio.write(boundary)
-            bio.write(b'\r\n')
-            bio.write(part.serialize())
-            bio.write(b'\r\n')
-        bio.write(boundary)
-        bio.write(b'--')
+            yield boundary + b'\r\n'
+            yield from part.chunks()
+            yield b'\r\n'
+        yield boundary + b'--'
+
+    def content_length(self):
+        boundary = len(self.boundary) + 2
+        length = sum(boundary + 2 + len(part) + 2 for part in self.parts)
+        return length + boundary + 2
+
+
+class _MultiPartBody:
+    # Re-iterable so the request can be sent again on a new connection.
+
+    def __init__(self, form):
+        self.form = form
+        self.length = form.content_length()
 
-        return bio.getvalue()
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.form.chunks()
 
 
 class _FormDataPart:
@@ -824,6 +875,8 @@ class _FormDataPart:
         self.add_header(b'Content-Disposition: form-data')
         self.append_header('name', name)
         self.body = None
+        self.path = None
+        self.size = 0
         if body is not None:
             self.add_body(body)
 
@@ -862,17 +915,52 @@ class _FormDataPart:
         if isinstance(body, str):
             body = body.encode('latin-1')
         self.body = body
+        self.size = len(body)
         self._log(DEBUG1, '_FormDataPart.add_body: %s %d',
                   type(self.body), len(self.body))
 
-    def serialize(self):
-        bio = BytesIO()
-        bio.write(b'\r\n'.join(self.headers))
-        bio.write(b'\r\n\r\n')
+    def add_path(self, path):
+        self.size = os.path.getsize(path)
+        self.path = path
+        self._log(DEBUG1, '_FormDataPart.add_path: %s size: %d',
+                  self.path, self.size)
+
+    def __len__(self):
+        return len(self.__headers()) + self.size
+
+    def __headers(self):
+        return b'\r\n'.join(self.headers) + b'\r\n\r\n'
+
+    def chunks(self):
+        yield self.__headers()
         if self.body is not None:
-            bio.write(self.body)
+            yield self.body
+        elif self.path is not None:
+            md5 = sha256 = None
+            if logging.getLogger(__name__).getEffectiveLevel() == DEBUG3:
+                import hashlib
+                md5 = hashlib.md5()
+                sha256 = hashlib.sha256()
+            with open(self.path, 'rb') as f:
+                size = 0
+                while True:
+                    data = f.read(_upload_read_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    if md5 is not None:
+                        md5.update(data)
+                        sha256.update(data)
+                    yield data
+            if size != self.size:
+                raise OSError('%s: file size changed: %d != %d' %
+                              (self.path, self.size, size))
+            if md5 is not None:
+                self._log(DEBUG3, 'MD5: %s', md5.hexdigest())
+                self._log(DEBUG3, 'SHA256: %s', sha256.hexdigest())
 
-        return bio.getvalue()
+    def serialize(self):
+        return b''.join(self.chunks())
 
 
 if __name__ == '__main__':
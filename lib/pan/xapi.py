@@ -16,17 +16,21 @@
 
 """Interface to the PAN-OS XML API
 
-The pan.xapi module implements the PanXapi class.  It provides an
-interface to the XML API on Palo Alto Networks' Next-Generation
-Firewalls.
+The pan.xapi module implements the PanXapi and AsyncPanXapi
+classes.  They provide an interface to the XML API on Palo Alto
+Networks' Next-Generation Firewalls.
 """
 
-from io import BytesIO
+import asyncio
+import contextlib
 import email
 import email.errors
 import email.utils
+import http.client
+import json
 import logging
 import os
+import random
 import re
 import sys
 import time
@@ -42,11 +46,31 @@ from urllib.parse import urlencode
 import xml.etree.ElementTree as etree
 
 from . import __version__, DEBUG1, DEBUG2, DEBUG3
+import pan.etree
+import pan.metrics
+import pan.pool
 import pan.rc
+import pan.retry
 
 _encoding = 'utf-8'
 _rfc2231_encode = False
 _job_query_interval = 0.5
+_log_page_size = 5000
+_stream_read_size = 64 * 1024
+_upload_read_size = 64 * 1024
+_api_key_cache_path = '~/.panxapi_keys'
+_stream_methods = ['ad_hoc', 'show', 'get', 'op']
+_uid_response_payload = './msg/line/uid-response/payload'
+_ssl_unverified_context = None
+
+
+def _unverified_context():
+    # Shared by all instances so a connection pool used by multiple
+    # PanXapi objects can reuse connections.
+    global _ssl_unverified_context
+    if _ssl_unverified_context is None:
+        _ssl_unverified_context = ssl._create_unverified_context()
+    return _ssl_unverified_context
 
 
 class PanXapiError(Exception):
@@ -66,6 +90,14 @@ class PanXapi:
                  use_get=False,
                  timeout=None,
                  ssl_context=None,
+                 keepalive=False,
+                 connection_pool=None,
+                 job_poller=None,
+                 api_key_cache=None,
+                 xml_backend=None,
+                 hooks=None,
+                 retry=None,
+                 rate_limit=None,
                  **kwargs):
         self._log = logging.getLogger(__name__).log
         self.tag = tag
@@ -78,10 +110,38 @@ class PanXapi:
         self.use_get = use_get
         self.timeout = timeout
         self.ssl_context = ssl_context
+        self.connection_pool = connection_pool
+        self.job_poller = job_poller
+        self.job_poll = None
+        self.hooks = hooks
+        self.request_metrics = None
+        self.retry = retry
+        self.rate_limit = rate_limit
+        self._xml_cache = {}
+        self.api_key_cache = api_key_cache
+        self._api_key_cached = False
+        self._http_code = None
+        self._http_error = None
+        self._stream = False
+        self._stream_response = None
         self._legacy_api = kwargs.get('_legacy_api', False)
 
+        if self.job_poller is None:
+            self.job_poller = PanJobPoller
+
+        if self.hooks is None:
+            self.hooks = []
+        elif not isinstance(self.hooks, (list, tuple)):
+            self.hooks = [self.hooks]
+
+        try:
+            self._etree = pan.etree.backend(xml_backend)
+        except pan.etree.PanEtreeError as msg:
+            raise PanXapiError(str(msg))
+        self.xml_backend = self._etree.name
+
         self._log(DEBUG3, 'Python version: %s', sys.version)
-        self._log(DEBUG3, 'xml.etree.ElementTree version: %s', etree.VERSION)
+        self._log(DEBUG3, 'XML backend: %s', self._etree)
         self._log(DEBUG3, 'ssl: %s', ssl.OPENSSL_VERSION)
         self._log(DEBUG3, 'pan-python version: %s', __version__)
 
@@ -114,6 +174,8 @@ class PanXapi:
             init_panrc['port'] = port
         if serial is not None:
             init_panrc['serial'] = serial
+        if isinstance(api_key_cache, str):
+            init_panrc['api_key_cache'] = api_key_cache
 
         try:
             panrc = pan.rc.PanRc(tag=self.tag,
@@ -151,6 +213,10 @@ class PanXapi:
                 raise PanXapiError('Invalid port from .panrc: %s' % self.port)
         if 'serial' in panrc.panrc:
             self.serial = panrc.panrc['serial']
+        if ('api_key_cache' in panrc.panrc and
+                not isinstance(self.api_key_cache, PanApiKeyCache)):
+            self.api_key_cache = PanApiKeyCache(
+                panrc.panrc['api_key_cache'])
 
         if self.hostname is None:
             raise PanXapiError('hostname argument required')
@@ -170,6 +236,23 @@ class PanXapi:
         # _legacy_api is used for PAN-OS < 4.1.0
         self.uri += '/api/' if not self._legacy_api else '/esp/restapi.esp'
 
+        # see PEP 476; urlopen() has context.  Create the context once
+        # so TLS session state can be reused across requests.
+        if self.ssl_context is None:
+            # don't perform certificate verification
+            self._ssl_context = _unverified_context()
+        else:
+            self._ssl_context = self.ssl_context
+
+        # only close a pool we create
+        self._close_pool = self.connection_pool is None
+        if self.connection_pool is None and keepalive:
+            self.connection_pool = pan.pool.PanConnectionPool()
+
+    def close(self):
+        if self.connection_pool is not None and self._close_pool:
+            self.connection_pool.close()
+
     def __str__(self):
         x = self.__dict__.copy()
         for k in x:
@@ -178,7 +261,7 @@ class PanXapi:
         return '\n'.join((': '.join((k, str(x[k]))))
                          for k in sorted(x))
 
-    def __clear_response(self):
+    def _clear_response(self):
         # XXX naming
         self.status = None
         self.status_code = None
@@ -188,6 +271,7 @@ class PanXapi:
         self.element_root = None
         self.element_result = None
         self.export_result = None
+        self._xml_cache = {}
 
     def __get_header(self, response, name):
         s = None
@@ -206,7 +290,7 @@ class PanXapi:
 
         return types
 
-    def __set_response(self, response):
+    def _set_response(self, response):
         message_body = response.pan_body
 
         content_type = self.__get_header(response, 'content-type')
@@ -240,17 +324,41 @@ class PanXapi:
             return False
 
     def __set_stream_response(self, response, message_body):
+        export_result = self._attachment_result(response)
+        if export_result is None:
+            return False
+
+        export_result['content'] = message_body
+        export_result['bytes'] = len(message_body)
+        export_result['sha256'] = None
+        self.export_result = export_result
+        self.status = 'success'
+        return True
+
+    def _attachment(self, response):
+        content_type = self.__get_header(response, 'content-type')
+        if not content_type:
+            return False
+        if 'application/octet-stream' in content_type:
+            return True
+        # XXX bug in 5.0 and 6.0: content-type text/plain for export pcap
+        if ('text/plain' in content_type and
+                self.__get_header(response, 'content-disposition')):
+            return True
+        return False
+
+    def _attachment_result(self, response):
         content_disposition = self.__get_header(response,
                                                 'content-disposition')
         if not content_disposition:
             self.status_detail = 'no content-disposition response header'
-            return False
+            return
 
         if 'attachment' not in content_disposition:
             msg = 'no handler for content-disposition: %s' % \
                 content_disposition
             self.status_detail = msg
-            return False
+            return
 
         filename = None
         for type in content_disposition:
@@ -261,27 +369,33 @@ class PanXapi:
 
         export_result = {}
         export_result['file'] = filename
-        export_result['content'] = message_body
-        self.export_result = export_result
-        self.status = 'success'
-        return True
+        return export_result
 
     def __set_xml_response(self, message_body):
         self.xml_document = message_body.decode(_encoding)
 
         try:
-            element = etree.fromstring(message_body)
-        except etree.ParseError as msg:
-            self.status_detail = 'ElementTree.fromstring ParseError: %s' % msg
+            element = self._etree.fromstring(message_body)
+        except self._etree.ParseError as msg:
+            self.status_detail = '%s.fromstring ParseError: %s' % \
+                (self._etree.module, msg)
             return False
         # we probably won't see MemoryError when it happens but try to catch
         except MemoryError as msg:
-            self.status_detail = 'ElementTree.fromstring MemoryError: %s' % msg
+            self.status_detail = '%s.fromstring MemoryError: %s' % \
+                (self._etree.module, msg)
             return False
         except Exception as msg:
             self.status_detail = '%s: %s' % (sys.exc_info()[0].__name__, msg)
             return False
 
+        self._log(DEBUG3, 'message_body: %s', type(message_body))
+        self._log(DEBUG3, 'message_body.decode(): %s', type(self.xml_document))
+
+        return self._set_element_root(element)
+
+    def _set_element_root(self, element):
+        self._xml_cache = {}
         self.element_root = element
         self.element_result = self.element_root.find('result')  # can be None
         if self.element_result is None:
@@ -293,8 +407,6 @@ class PanXapi:
         else:
             self._log(DEBUG3, 'xml_document: %s',
                       '<type=keygen response not shown>')
-        self._log(DEBUG3, 'message_body: %s', type(message_body))
-        self._log(DEBUG3, 'message_body.decode(): %s', type(self.xml_document))
 
         response_attrib = self.element_root.attrib
         if not response_attrib:
@@ -335,7 +447,7 @@ class PanXapi:
         # XML API response message formats are not documented
 
         # type=user-id register and unregister
-        path = './msg/line/uid-response/payload/*/entry'
+        path = _uid_response_payload + '/*/entry'
         elem = self.element_root.findall(path)
         if len(elem) > 0:
             self._log(DEBUG2, 'path: %s %s', path, elem)
@@ -427,42 +539,45 @@ class PanXapi:
 
         return None
 
-    # XXX store tostring() results?
-    # XXX rework this
+    def __xml_cached(self, name, element):
+        # tostring() results are kept until the next response
+        x = self._xml_cache.get(name)
+        if x is not None and x[0] is element:
+            self._log(DEBUG3, '%s: cached', name)
+            return x[1]
+
+        return None
+
     def xml_root(self):
         if self.element_root is None:
             # May not be set due to ParseError, so return response
             return self.xml_document
 
-        s = etree.tostring(self.element_root, encoding=_encoding)
-
-        if not s:
-            return None
+        s = self.__xml_cached('xml_root', self.element_root)
+        if s is not None:
+            return s or None
 
-        self._log(DEBUG3, 'xml_root: %s', type(s))
-        self._log(DEBUG3, 'xml_root.decode(): %s', type(s.decode(_encoding)))
+        s = self._etree.tostring(self.element_root)
+        self._xml_cache['xml_root'] = (self.element_root, s)
 
-        return s.decode(_encoding)
+        return s or None
 
     def xml_result(self):
         if self.element_result is None:
             return None
 
-        s = ''.encode()
+        s = self.__xml_cached('xml_result', self.element_result)
+        if s is not None:
+            return s or None
 
+        x = [self._etree.tostring(elem)
+             for elem in self.element_result]
         if self.element_result.text:
-            s += self.element_result.text.encode(_encoding)
-
-        for elem in self.element_result:
-            s += etree.tostring(elem, encoding=_encoding)
-
-        if not s:
-            return None
+            x.insert(0, self.element_result.text)
+        s = ''.join(x)
+        self._xml_cache['xml_result'] = (self.element_result, s)
 
-        self._log(DEBUG3, 'xml_result: %s', type(s))
-        self._log(DEBUG3, 'xml_result.decode(): %s', type(s.decode(_encoding)))
-
-        return s.decode(_encoding)
+        return s or None
 
     def __debug_request(self, query):
         x = query.copy()
@@ -480,7 +595,7 @@ class PanXapi:
         self._log(DEBUG1, 'query: %s', x)
         self._log(DEBUG1, 'URI: %s', uri)
 
-    def __api_request(self, query, body=None, headers={}):
+    def _http_request(self, query, body=None, headers={}):
         self.__debug_request(query)
         # type=keygen request will urlencode key if needed so don't
         # double encode
@@ -510,37 +625,121 @@ class PanXapi:
 
         self._log(DEBUG1, 'method: %s', request.get_method())
 
+        return request
+
+    @staticmethod
+    def _url_error(error):
+        msg = 'URLError:'
+        if hasattr(error, 'code'):
+            msg += ' code: %s' % error.code
+        if hasattr(error, 'reason'):
+            msg += ' reason: %s' % error.reason
+        if not (hasattr(error, 'code') or hasattr(error, 'reason')):
+            msg += ' unknown error (Kevin heart Python)'
+        return msg
+
+    def _metrics_begin(self, query):
+        metrics = pan.metrics.PanRequestMetrics(
+            api_type=query.get('type'),
+            action=query.get('action'),
+            hostname=self.hostname)
+        for x in self.hooks:
+            x.pre_request(metrics)
+
+        return metrics
+
+    @staticmethod
+    def _metrics_request(metrics, request):
+        metrics.method = request.get_method()
+        metrics.bytes_sent = len(request.selector.encode())
+        if request.data is not None:
+            # bytes or a streamed _MultiPartBody
+            metrics.bytes_sent += len(request.data)
+
+    @staticmethod
+    def _metrics_response(metrics, response, start):
+        # connection pool responses have the connect times; otherwise
+        # wait includes them
+        metrics.http_code = response.status
+        timing = getattr(response, 'timing', None)
+        if timing is None:
+            metrics.timing['wait'] = time.monotonic() - start
+            metrics.reused = False
+        else:
+            metrics.timing.update(timing)
+            metrics.reused = response.reused
+
+    @staticmethod
+    def _metrics_body(metrics, response, start):
+        metrics.timing['download'] = time.monotonic() - start
+        metrics.bytes_received = len(response.pan_body)
+
+    def _metrics_end(self, metrics):
+        metrics.total = time.monotonic() - metrics._start
+        metrics.status = self.status
+        metrics.status_code = self.status_code
+        if metrics.http_code is None:
+            metrics.http_code = self._http_code
+        self.request_metrics = metrics
+        for x in self.hooks:
+            x.post_request(metrics)
+
+    @contextlib.contextmanager
+    def _metrics_stream(self, response):
+        # A streaming response is read by the caller, which counts
+        # bytes_received; the metrics are ended when it is done.
+        metrics = response.pan_metrics
+        metrics.bytes_received = 0
+        start = time.monotonic()
+        try:
+            yield metrics
+        except Exception as e:
+            metrics.error = str(e)
+            raise
+        finally:
+            metrics.timing['download'] = time.monotonic() - start
+            self._metrics_end(metrics)
+
+    def __api_request(self, query, metrics, body=None, headers={}):
+        request = self._http_request(query, body, headers)
+        self._http_code = None
+        self._http_error = None
+        self._metrics_request(metrics, request)
+
         kwargs = {
             'url': request,
+            'context': self._ssl_context,
         }
 
-        # see PEP 476; urlopen() has context
-        if self.ssl_context is None:
-            # don't perform certificate verification
-            kwargs['context'] = ssl._create_unverified_context()
-        else:
-            kwargs['context'] = self.ssl_context
-
         if self.timeout is not None:
             kwargs['timeout'] = self.timeout
 
+        if self.connection_pool is not None:
+            _urlopen = self.connection_pool.urlopen
+        else:
+            _urlopen = urlopen
+
         try:
-            with urlopen(**kwargs) as response:
-                response.pan_body = response.read()
+            start = time.monotonic()
+            if self._stream:
+                # message body is read by the caller
+                response = _urlopen(**kwargs)
+                self._metrics_response(metrics, response, start)
+            else:
+                with _urlopen(**kwargs) as response:
+                    self._metrics_response(metrics, response, start)
+                    start = time.monotonic()
+                    response.pan_body = response.read()
+                    self._metrics_body(metrics, response, start)
 
         # XXX handle httplib.BadStatusLine when http to port 443
         except ssl.CertificateError as e:
             self.status_detail = 'ssl.CertificateError: %s' % e
             return False
         except URLError as error:
-            msg = 'URLError:'
-            if hasattr(error, 'code'):
-                msg += ' code: %s' % error.code
-            if hasattr(error, 'reason'):
-                msg += ' reason: %s' % error.reason
-            if not (hasattr(error, 'code') or hasattr(error, 'reason')):
-                msg += ' unknown error (Kevin heart Python)'
-            self.status_detail = msg
+            self._http_code = getattr(error, 'code', None)
+            self._http_error = error
+            self.status_detail = self._url_error(error)
             return False
 
         self._log(DEBUG2, 'HTTP response headers:')
@@ -549,10 +748,267 @@ class PanXapi:
 
         return response
 
-    def __set_api_key(self):
+    def __request(self, query, body=None, headers={}):
+        metrics = self._metrics_begin(query)
+        try:
+            response = self.__api_request(query, metrics, body=body,
+                                          headers=headers)
+            if not response:
+                raise PanXapiError(self.status_detail)
+
+            if self._stream_set(response):
+                response.pan_metrics = metrics
+                metrics = None
+                return
+
+            start = time.monotonic()
+            ok = self._set_response(response)
+            metrics.timing['parse'] = time.monotonic() - start
+            if not ok:
+                raise PanXapiError(self.status_detail)
+        except PanXapiError as e:
+            metrics.error = str(e)
+            raise
+        finally:
+            if metrics is not None:
+                self._metrics_end(metrics)
+
+    def __retry_request(self, query, body=None, headers={}):
+        attempt = 0
+        while True:
+            self._retry_allow()
+            if self.rate_limit is not None:
+                self.rate_limit.acquire(self._host_key, self.api_key)
+            try:
+                self.__request(query, body=body, headers=headers)
+            except PanXapiError:
+                interval = self._retry_interval(query, attempt)
+                if interval is None:
+                    raise
+                attempt += 1
+                time.sleep(interval)
+                continue
+            if self.retry is not None:
+                self.retry.success(self._host_key)
+            return
+
+    def _request(self, query, body=None, headers={}):
+        try:
+            self.__retry_request(query, body=body, headers=headers)
+        except PanXapiError:
+            if not self._api_key_invalid(query):
+                raise
+            stream, self._stream = self._stream, False
+            try:
+                self._set_api_key()
+            finally:
+                self._stream = stream
+            query['key'] = self.api_key
+            self.__retry_request(query, body=body, headers=headers)
+
+    @property
+    def _host_key(self):
+        # circuit breaker and rate limit key
+        if self.port is None:
+            return self.hostname
+        return '%s:%s' % (self.hostname, self.port)
+
+    def _retry_allow(self):
+        if self.retry is not None and not self.retry.allow(self._host_key):
+            self.status_detail = 'circuit open: %s' % self._host_key
+            raise PanXapiError(self.status_detail)
+
+    def _retry_interval(self, query, attempt):
+        # seconds to wait before retrying the failed request, or None
+        if self.retry is None:
+            return None
+
+        error = self._http_error
+        if error is None:
+            # API error response
+            if self.status != 'error':
+                return None
+            code = 200
+            busy = pan.retry.busy(self.status_detail)
+        else:
+            code = None
+            busy = False
+
+        return self.retry.failed(
+            self._host_key, attempt,
+            idempotent=_retry_idempotent(query),
+            error=error, code=code, busy=busy)
+
+    def _stream_set(self, response):
+        if not self._stream:
+            return False
+
+        if self._stream_response is not None:
+            # only methods which perform a single request can be
+            # used with a streaming response
+            response.close()
+            raise PanXapiError('streaming response: multiple requests')
+
+        self._stream_response = response
+        return True
+
+    def _stream_begin(self, method, args, kwargs):
+        if method not in _stream_methods:
+            raise PanXapiError('Invalid streaming response method: %s' %
+                               method)
+
+        self._stream = True
+        self._stream_response = None
+        try:
+            f = getattr(self, method)
+            return f(*args, **kwargs)
+        finally:
+            self._stream = False
+
+    def _stream_xml(self, response):
+        content_type = self.__get_header(response, 'content-type')
+        return content_type is not None and 'application/xml' in content_type
+
+    def _stream_request(self, query):
+        self._stream = True
+        self._stream_response = None
+        try:
+            self._request(query)
+        finally:
+            self._stream = False
+
+        response = self._stream_response
+        self._stream_response = None
+        return response
+
+    def _export_writer(self, response, file, sha256):
+        if not self._attachment(response):
+            return
+
+        export_result = self._attachment_result(response)
+        if export_result is None:
+            raise PanXapiError(self.status_detail)
+
+        try:
+            return _ExportWriter(export_result, file, sha256)
+        except OSError as e:
+            self.status_detail = 'open: %s' % e
+            raise PanXapiError(self.status_detail)
+
+    def _export_done(self, writer, error=None):
+        try:
+            writer.close()
+        except OSError as e:
+            error = error or 'close: %s' % e
+        if error is not None:
+            self.status_detail = str(error)
+            raise PanXapiError(self.status_detail)
+
+        self.export_result = writer.export_result
+        self.status = 'success'
+        self._log(DEBUG1, 'export: %d bytes %.3fs %.0f bytes/s',
+                  writer.export_result['bytes'],
+                  writer.export_result['elapsed'],
+                  writer.export_result['throughput'])
+
+    def _stream_end(self, parser):
+        try:
+            root = parser.close()
+        except self._etree.ParseError as msg:
+            self.status_detail = '%s.XMLPullParser ParseError: %s' % \
+                (self._etree.module, msg)
+            raise PanXapiError(self.status_detail)
+
+        self.xml_document = parser.document
+        if not self._set_element_root(root):
+            raise PanXapiError(self.status_detail)
+
+    def iter_result(self, method, *args, path=None, keep_document=False,
+                    **kwargs):
+        """Generator which performs a request with a streaming response.
+
+        The response is parsed incrementally as it is read, and the
+        elements matching path (default 'result/*') are yielded as
+        they complete and removed from the document.
+        """
+
+        self._set_api_key()
+        self._stream_begin(method, args, kwargs)
+
+        response = self._stream_response
+        self._stream_response = None
+        with self._metrics_stream(response) as metrics:
+            with response:
+                if not self._stream_xml(response):
+                    response.pan_body = response.read()
+                    metrics.bytes_received = len(response.pan_body)
+                    if not self._set_response(response):
+                        raise PanXapiError(self.status_detail)
+                    return
+
+                parser = _XmlStreamParser(self._etree, path,
+                                          keep_document)
+                try:
+                    while True:
+                        data = response.read(_stream_read_size)
+                        if not data:
+                            break
+                        metrics.bytes_received += len(data)
+                        yield from parser.feed(data)
+                except self._etree.ParseError as msg:
+                    self.status_detail = \
+                        '%s.XMLPullParser ParseError: %s' % \
+                        (self._etree.module, msg)
+                    raise PanXapiError(self.status_detail)
+
+            self._stream_end(parser)
+
+    def _set_api_key(self):
         if self.api_key is None:
+            if self._api_key_from_cache():
+                return
             self.keygen()
             self._log(DEBUG1, 'autoset api_key')
+            self._api_key_to_cache()
+
+    def _api_key_cache_key(self):
+        return PanApiKeyCache.key(self.hostname, self.port,
+                                  self.api_username, self.serial)
+
+    def _api_key_from_cache(self):
+        if self.api_key_cache is None:
+            return False
+
+        api_key = self.api_key_cache.get(self._api_key_cache_key())
+        if api_key is None:
+            return False
+
+        self.api_key = api_key
+        self._api_key_cached = True
+        self._log(DEBUG1, 'api_key from cache %s', self.api_key_cache.path)
+        return True
+
+    def _api_key_to_cache(self):
+        if self.api_key_cache is None:
+            return
+
+        self.api_key_cache.set(self._api_key_cache_key(), self.api_key)
+
+    def _api_key_invalid(self, query):
+        # A cached API key which is no longer valid (e.g., password
+        # changed) is removed from the cache so keygen is performed.
+        if (not self._api_key_cached or 'key' not in query or
+                query.get('type') == 'keygen'):
+            return False
+
+        if not (self._http_code == 403 or self.status_code == '403'):
+            return False
+
+        self._log(DEBUG1, 'cached api_key invalid: %s', self.status_detail)
+        self.api_key_cache.delete(self._api_key_cache_key())
+        self._api_key_cached = False
+        self.api_key = None
+        return True
 
     def cmd_xml(self, cmd):
         def _cmd_xml(args, obj):
@@ -585,9 +1041,10 @@ class PanXapi:
 
         return xml
 
-    def keygen(self, extra_qs=None):
-        self.__clear_response()
+    # Query construction and response processing is kept separate
+    # from the request so the methods can be shared with AsyncPanXapi.
 
+    def _keygen_query(self, extra_qs=None):
         if (self.api_username is None or
                 self.api_password is None):
             raise PanXapiError('api_username and api_password ' +
@@ -603,16 +1060,9 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        try:
-            response = self.__api_request(query)
-        finally:
-            query.pop('password', None)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
+    def _keygen_result(self):
         if self.element_result is None:
             raise PanXapiError('keygen(): result element not found')
         element = self.element_result.find('key')
@@ -623,6 +1073,17 @@ class PanXapi:
 
         return self.api_key
 
+    def keygen(self, extra_qs=None):
+        self._clear_response()
+
+        query = self._keygen_query(extra_qs)
+        try:
+            self._request(query)
+        finally:
+            query.pop('password', None)
+
+        return self._keygen_result()
+
     @staticmethod
     def __qs_to_dict(qs):
         if isinstance(qs, dict):
@@ -657,10 +1118,7 @@ class PanXapi:
 
         return x
 
-    def ad_hoc(self, qs=None, xpath=None, modify_qs=False):
-        self.__set_api_key()
-        self.__clear_response()
-
+    def _ad_hoc_query(self, qs=None, xpath=None, modify_qs=False):
         query = {}
         if qs is not None:
             query = self.__qs_to_dict(qs)
@@ -681,96 +1139,58 @@ class PanXapi:
 
         self._log(DEBUG1, '%s', query)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def ad_hoc(self, qs=None, xpath=None, modify_qs=False):
+        self._set_api_key()
+        self._clear_response()
+
+        query = self._ad_hoc_query(qs, xpath, modify_qs)
+        self._request(query)
 
     def show(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        self.__type_config('show', query, extra_qs)
+        query = _config_args(xpath=xpath)
+        self._type_config('show', query, extra_qs)
 
     def get(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        self.__type_config('get', query, extra_qs)
+        query = _config_args(xpath=xpath)
+        self._type_config('get', query, extra_qs)
 
     def delete(self, xpath=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        self.__type_config('delete', query, extra_qs)
+        query = _config_args(xpath=xpath)
+        self._type_config('delete', query, extra_qs)
 
     def set(self, xpath=None, element=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if element is not None:
-            query['element'] = element
-        self.__type_config('set', query, extra_qs)
+        query = _config_args(xpath=xpath, element=element)
+        self._type_config('set', query, extra_qs)
 
     def edit(self, xpath=None, element=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if element is not None:
-            query['element'] = element
-        self.__type_config('edit', query, extra_qs)
+        query = _config_args(xpath=xpath, element=element)
+        self._type_config('edit', query, extra_qs)
 
     def move(self, xpath=None, where=None, dst=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if where is not None:
-            query['where'] = where
-        if dst is not None:
-            query['dst'] = dst
-        self.__type_config('move', query, extra_qs)
+        query = _config_args(xpath=xpath, where=where, dst=dst)
+        self._type_config('move', query, extra_qs)
 
     def rename(self, xpath=None, newname=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if newname is not None:
-            query['newname'] = newname
-        self.__type_config('rename', query, extra_qs)
+        query = _config_args(xpath=xpath, newname=newname)
+        self._type_config('rename', query, extra_qs)
 
     def clone(self, xpath=None, xpath_from=None, newname=None,
               extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if xpath_from is not None:
-            query['from'] = xpath_from
-        if newname is not None:
-            query['newname'] = newname
-        self.__type_config('clone', query, extra_qs)
+        query = _config_args(xpath=xpath, xpath_from=xpath_from,
+                             newname=newname)
+        self._type_config('clone', query, extra_qs)
 
     def override(self, xpath=None, element=None, extra_qs=None):
-        query = {}
-        if xpath is not None:
-            query['xpath'] = xpath
-        if element is not None:
-            query['element'] = element
-        self.__type_config('override', query, extra_qs)
+        query = _config_args(xpath=xpath, element=element)
+        self._type_config('override', query, extra_qs)
 
     def multi_config(self, element=None, strict=None, extra_qs=None):
-        query = {}
-        if element is not None:
-            query['element'] = element
-        if strict is not None:
-            query['strict-transactional'] = 'yes' if strict else 'no'
-        self.__type_config('multi-config', query, extra_qs)
-
-    def __type_config(self, action, query, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
+        query = _config_args(element=element, strict=strict)
+        self._type_config('multi-config', query, extra_qs)
 
+    def _config_query(self, action, query, extra_qs=None):
         query['type'] = 'config'
         query['action'] = action
         query['key'] = self.api_key
@@ -779,17 +1199,16 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def _type_config(self, action, query, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
 
-    def user_id(self, cmd=None, vsys=None, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
+        query = self._config_query(action, query, extra_qs)
+        self._request(query)
 
+    def _user_id_query(self, cmd=None, vsys=None, extra_qs=None):
         query = {}
         query['type'] = 'user-id'
         query['key'] = self.api_key
@@ -802,12 +1221,101 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def user_id(self, cmd=None, vsys=None, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
+
+        query = self._user_id_query(cmd, vsys, extra_qs)
+        self._request(query)
+
+    @staticmethod
+    def _job_interval(interval):
+        if interval is None:
+            interval = _job_query_interval
+
+        try:
+            interval = float(interval)
+            if interval < 0:
+                raise ValueError
+        except ValueError:
+            raise PanXapiError('Invalid interval: %s' % interval)
+
+        return interval
+
+    @staticmethod
+    def _job_timeout(timeout):
+        if timeout is not None:
+            try:
+                timeout = int(timeout)
+                if timeout < 0:
+                    raise ValueError
+            except ValueError:
+                raise PanXapiError('Invalid timeout: %s' % timeout)
+
+        return timeout
+
+    def _job_poller_start(self, interval, timeout):
+        self.job_poll = self.job_poller(interval=interval, timeout=timeout)
+        return self.job_poll
+
+    def _job_status(self, request):
+        status = self.element_root.find('./result/job/status')
+        if status is None:
+            raise PanXapiError('no status element in ' +
+                               '%s response' % request)
+
+        return status.text
+
+    def _job_progress(self):
+        progress = self.element_root.findtext('./result/job/progress')
+        if progress is None:
+            # type=log&action=get
+            logs = self.element_root.find('./result/log/logs')
+            if logs is not None:
+                progress = logs.get('progress')
+
+        try:
+            return int(progress)
+        except (TypeError, ValueError):
+            return None
+
+    def _job_sleep_time(self):
+        interval = self.job_poll.next_interval()
+        self._log(DEBUG2, 'sleep %.2f seconds', interval)
+        return interval
+
+    def _job_polled(self, job, status):
+        poller = self.job_poll
+        poller.polled(self._job_progress())
+
+        if status == 'FIN':
+            self._log(DEBUG1, 'job %s: %d polls %.2f seconds wait',
+                      job, poller.polls, poller.wait)
+            return True
+
+        self._log(DEBUG2, 'job %s status %s', job, status)
+
+        if poller.expired():
+            raise PanXapiError('timeout waiting for ' +
+                               'job %s completion' % job)
+
+        return False
+
+    def __job_wait(self, job, request, poll, sleep_first=False):
+        if sleep_first:
+            # don't poll immediately after the job is scheduled
+            time.sleep(self._job_sleep_time())
+
+        while True:
+            poll()
+
+            status = self._job_status(request)
+            if self._job_polled(job, status):
+                return
+
+            time.sleep(self._job_sleep_time())
 
     def __legacy_commit_poll(self, query, interval=None, timeout=None):
         """On PAN-OS < 4.1.0, keep polling until the commit is finished.
@@ -817,51 +1325,32 @@ class PanXapi:
         there is nothing to commit.
         """
 
-        start_time = time.time()
+        poller = self._job_poller_start(interval, timeout)
         while True:
             # sleep at the top of the loop so we don't poll
             # immediately after commit
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
+            time.sleep(self._job_sleep_time())
 
-            response = self.__api_request(query)
+            metrics = self._metrics_begin(query)
+            response = self.__api_request(query, metrics)
             if not response:
+                metrics.error = self.status_detail
+                self._metrics_end(metrics)
                 raise PanXapiError(self.status_detail)
-            self.__set_response(response)
+            self._set_response(response)
+            self._metrics_end(metrics)
+            poller.polled()
             if self.status_detail == "There are no changes to commit.":
                 self._log(DEBUG2, 'commit finished')
                 return
             else:
                 self._log(DEBUG2, 'commit pending...')
 
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
+            if poller.expired():
                 raise PanXapiError('timeout waiting for legacy commit ' +
                                    'completion')
 
-    def commit(self, cmd=None, action=None, sync=False,
-               interval=None, timeout=None, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
-
-        if interval is not None:
-            try:
-                interval = float(interval)
-                if interval < 0:
-                    raise ValueError
-            except ValueError:
-                raise PanXapiError('Invalid interval: %s' % interval)
-        else:
-            interval = _job_query_interval
-
-        if timeout is not None:
-            try:
-                timeout = int(timeout)
-                if timeout < 0:
-                    raise ValueError
-            except ValueError:
-                raise PanXapiError('Invalid timeout: %s' % timeout)
-
+    def _commit_query(self, cmd=None, action=None, extra_qs=None):
         query = {}
         query['type'] = 'commit'
         query['key'] = self.api_key
@@ -876,12 +1365,19 @@ class PanXapi:
         if self._legacy_api:
             query['type'] = 'config'
             query['action'] = 'commit'
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
+
+    def commit(self, cmd=None, action=None, sync=False,
+               interval=None, timeout=None, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+
+        query = self._commit_query(cmd, action, extra_qs)
+        self._request(query)
 
         if sync is not True:
             return
@@ -898,44 +1394,23 @@ class PanXapi:
         self._log(DEBUG2, 'commit job: %s', job.text)
 
         cmd = 'show jobs id "%s"' % job.text
-        start_time = time.time()
-
-        while True:
-            # sleep at the top of the loop so we don't poll
-            # immediately after commit
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
 
+        def poll():
             try:
                 self.op(cmd=cmd, cmd_xml=True)
             except PanXapiError as msg:
                 raise PanXapiError('commit %s: %s' % (cmd, msg))
 
-            path = './result/job/status'
-            status = self.element_root.find(path)
-            if status is None:
-                raise PanXapiError('no status element in ' +
-                                   "'%s' response" % cmd)
-            if status.text == 'FIN':
-                # XXX commit vs. commit-all job status
-                return
-
-            self._log(DEBUG2, 'job %s status %s', job.text, status.text)
-
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
-                raise PanXapiError('timeout waiting for ' +
-                                   'job %s completion' % job.text)
+        # XXX commit vs. commit-all job status
+        self._job_poller_start(interval, timeout)
+        self.__job_wait(job.text, "'%s'" % cmd, poll, sleep_first=True)
 
     def op(self, cmd=None, vsys=None, cmd_xml=False, extra_qs=None):
         if cmd is not None and cmd_xml:
             cmd = self.cmd_xml(cmd)
-        self.__type_op(cmd, vsys, extra_qs)
-
-    def __type_op(self, cmd, vsys, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
+        self._type_op(cmd, vsys, extra_qs)
 
+    def _op_query(self, cmd=None, vsys=None, extra_qs=None):
         query = {}
         query['type'] = 'op'
         if cmd is not None:
@@ -948,12 +1423,14 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def _type_op(self, cmd, vsys, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
+
+        query = self._op_query(cmd, vsys, extra_qs)
+        self._request(query)
 
     @staticmethod
     def pcapid_time(pcapid):
@@ -971,12 +1448,9 @@ class PanXapi:
 
         return s
 
-    def export(self, category=None, from_name=None, to_name=None,
-               pcapid=None, search_time=None, serialno=None,
-               extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
-
+    def _export_query(self, category=None, from_name=None, to_name=None,
+                      pcapid=None, search_time=None, serialno=None,
+                      extra_qs=None):
         query = {}
         query['type'] = 'export'
         query['key'] = self.api_key
@@ -1008,49 +1482,57 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
+        return query
 
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+    def export(self, category=None, from_name=None, to_name=None,
+               pcapid=None, search_time=None, serialno=None,
+               extra_qs=None, file=None, sha256=False):
+        self._set_api_key()
+        self._clear_response()
+
+        query = self._export_query(category, from_name, to_name,
+                                   pcapid, search_time, serialno,
+                                   extra_qs)
+        if file is None:
+            self._request(query)
+            if self.export_result and sha256:
+                self.export_result['sha256'] = _sha256(
+                    self.export_result['content'])
+        else:
+            self.__export_file(query, file, sha256)
 
         if self.export_result:
             self.export_result['category'] = category
 
-    def _read_file(self, path):
-        try:
-            f = open(path, 'rb')
-        except IOError as e:
-            msg = 'open: %s: %s' % (path, e)
-            self._msg = msg
-            return
-
-        buf = f.read()
-        f.close()
-
-        self._log(DEBUG2, 'path: %s %d', type(path), len(path))
-        self._log(DEBUG2, 'path: %s size: %d', path, len(buf))
-        if logging.getLogger(__name__).getEffectiveLevel() == DEBUG3:
-            import hashlib
-            md5 = hashlib.md5()
-            md5.update(buf)
-            sha256 = hashlib.sha256()
-            sha256.update(buf)
-            self._log(DEBUG3, 'MD5: %s', md5.hexdigest())
-            self._log(DEBUG3, 'SHA256: %s', sha256.hexdigest())
-
-        return buf
-
-    def import_file(self,
-                    category=None,
-                    file=None,
-                    filename=None,
-                    vsys=None,
-                    extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
+    def __export_file(self, query, file, sha256):
+        response = self._stream_request(query)
+        with self._metrics_stream(response) as metrics, response:
+            writer = self._export_writer(response, file, sha256)
+            if writer is None:
+                response.pan_body = response.read()
+                metrics.bytes_received = len(response.pan_body)
+                if not self._set_response(response):
+                    raise PanXapiError(self.status_detail)
+                return
 
+            error = None
+            try:
+                while True:
+                    data = response.read(_stream_read_size)
+                    if not data:
+                        break
+                    metrics.bytes_received += len(data)
+                    writer.write(data)
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+            self._export_done(writer, error)
+
+    def _import_file_request(self,
+                             category=None,
+                             file=None,
+                             filename=None,
+                             vsys=None,
+                             extra_qs=None):
         query = {}
         query['type'] = 'import'
         query['key'] = self.api_key
@@ -1065,50 +1547,39 @@ class PanXapi:
 
         if file is not None:
             if isinstance(file, bytes):
-                buf = file
                 if filename is None:
                     filename = 'pan'  # XXX dummy string, required arg
+                form.add_file(filename, file)
             else:
-                buf = self._read_file(file)
-                if buf is None:
-                    raise PanXapiError(self._msg)
                 if filename is None:
                     filename = os.path.basename(file)
-            form.add_file(filename, buf)
+                # file is read in chunks as the request is sent
+                try:
+                    form.add_file(filename, path=file)
+                except OSError as e:
+                    raise PanXapiError('open: %s: %s' % (file, e))
 
         headers = form.http_headers()
         body = form.http_body()
 
-        response = self.__api_request(query, body=body, headers=headers)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
-
-    def log(self, log_type=None, nlogs=None, skip=None, filter=None,
-            interval=None, timeout=None, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
-
-        if interval is None:
-            interval = _job_query_interval
+        return query, body, headers
 
-        try:
-            interval = float(interval)
-            if interval < 0:
-                raise ValueError
-        except ValueError:
-            raise PanXapiError('Invalid interval: %s' % interval)
+    def import_file(self,
+                    category=None,
+                    file=None,
+                    filename=None,
+                    vsys=None,
+                    extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
 
-        if timeout is not None:
-            try:
-                timeout = int(timeout)
-                if timeout < 0:
-                    raise ValueError
-            except ValueError:
-                raise PanXapiError('Invalid timeout: %s' % timeout)
+        query, body, headers = self._import_file_request(category, file,
+                                                         filename, vsys,
+                                                         extra_qs)
+        self._request(query, body=body, headers=headers)
 
+    def _log_query(self, log_type=None, nlogs=None, skip=None, filter=None,
+                   extra_qs=None):
         query = {}
         query['type'] = 'log'
         query['key'] = self.api_key
@@ -1123,13 +1594,9 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
+    def _log_get_query(self):
         job = self.element_root.find('./result/job')
         if job is None:
             raise PanXapiError('no job element in type=log response')
@@ -1141,56 +1608,129 @@ class PanXapi:
         query['job-id'] = job.text
         self._log(DEBUG2, 'log job: %s', job.text)
 
-        start_time = time.time()
-
-        while True:
-            response = self.__api_request(query)
-            if not response:
-                raise PanXapiError(self.status_detail)
+        return query
 
-            if not self.__set_response(response):
-                raise PanXapiError(self.status_detail)
+    def __log_job_wait(self, query, interval, timeout):
+        self._job_poller_start(interval, timeout)
+        self.__job_wait(query['job-id'], 'type=log&action=get',
+                        lambda: self._request(query))
 
-            status = self.element_root.find('./result/job/status')
-            if status is None:
-                raise PanXapiError('no status element in ' +
-                                   'type=log&action=get response')
-            if status.text == 'FIN':
-                return
+    def log(self, log_type=None, nlogs=None, skip=None, filter=None,
+            interval=None, timeout=None, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
 
-            self._log(DEBUG2, 'job %s status %s', job.text, status.text)
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
 
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
-                raise PanXapiError('timeout waiting for ' +
-                                   'job %s completion' % job.text)
+        query = self._log_query(log_type, nlogs, skip, filter, extra_qs)
+        self._request(query)
 
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
+        query = self._log_get_query()
+        self.__log_job_wait(query, interval, timeout)
 
-    def report(self, reporttype=None, reportname=None, vsys=None,
-               interval=None, timeout=None, extra_qs=None):
-        self.__set_api_key()
-        self.__clear_response()
+    @staticmethod
+    def _iter_logs_args(nlogs, skip, page_size):
+        if nlogs is not None:
+            try:
+                nlogs = int(nlogs)
+                if nlogs < 0:
+                    raise ValueError
+            except ValueError:
+                raise PanXapiError('Invalid nlogs: %s' % nlogs)
 
-        if interval is None:
-            interval = _job_query_interval
+        if skip is None:
+            skip = 0
+        try:
+            skip = int(skip)
+            if skip < 0:
+                raise ValueError
+        except ValueError:
+            raise PanXapiError('Invalid skip: %s' % skip)
 
+        if page_size is None:
+            page_size = _log_page_size
         try:
-            interval = float(interval)
-            if interval < 0:
+            page_size = int(page_size)
+            if page_size < 1 or page_size > _log_page_size:
                 raise ValueError
         except ValueError:
-            raise PanXapiError('Invalid interval: %s' % interval)
+            raise PanXapiError('Invalid page_size: %s' % page_size)
 
-        if timeout is not None:
-            try:
-                timeout = int(timeout)
-                if timeout < 0:
-                    raise ValueError
-            except ValueError:
-                raise PanXapiError('Invalid timeout: %s' % timeout)
+        return nlogs, skip, page_size
+
+    def _log_page(self):
+        logs = self.element_root.find('./result/log/logs')
+        entries = [] if logs is None else logs.findall('entry')
+
+        # don't hold the response document while entries are consumed
+        self.xml_document = None
+        self.element_root = None
+        self.element_result = None
+
+        # reversed so entries can be released with pop() as consumed
+        entries.reverse()
+        return entries
+
+    def iter_logs(self, log_type=None, filter=None, nlogs=None, skip=None,
+                  page_size=None, prefetch=False,
+                  interval=None, timeout=None, extra_qs=None):
+        """Generator which yields log entry elements.
+
+        Logs are retrieved in pages of page_size entries using skip;
+        when prefetch is True the job for the next page is scheduled
+        before the entries for the current page are consumed.
+        """
+
+        self._set_api_key()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+        nlogs, skip, page_size = self._iter_logs_args(nlogs, skip,
+                                                      page_size)
+
+        def job(skip, remaining):
+            n = page_size if remaining is None else min(page_size,
+                                                        remaining)
+            self._clear_response()
+            query = self._log_query(log_type, n, skip, filter, extra_qs)
+            self._request(query)
+            return n, self._log_get_query()
+
+        if nlogs == 0:
+            return
+
+        remaining = nlogs
+        n, query = job(skip, remaining)
+
+        while True:
+            self.__log_job_wait(query, interval, timeout)
+            entries = self._log_page()
+            count = len(entries)
+            self._log(DEBUG1, 'log page skip %d nlogs %d: %d entries',
+                      skip, n, count)
+
+            skip += count
+            if remaining is not None:
+                remaining -= count
+            more = count == n and (remaining is None or remaining > 0)
+
+            next_job = None
+            if more and prefetch:
+                next_job = job(skip, remaining)
+
+            while entries:
+                yield entries.pop()
+
+            if not more:
+                return
+
+            if next_job is None:
+                next_job = job(skip, remaining)
+            n, query = next_job
 
+    def _report_query(self, reporttype=None, reportname=None, vsys=None,
+                      extra_qs=None):
         query = {}
         query['type'] = 'report'
         query['key'] = self.api_key
@@ -1205,13 +1745,9 @@ class PanXapi:
         if extra_qs is not None:
             query = self.__merge_extra_qs(query, extra_qs)
 
-        response = self.__api_request(query)
-        if not response:
-            raise PanXapiError(self.status_detail)
-
-        if not self.__set_response(response):
-            raise PanXapiError(self.status_detail)
+        return query
 
+    def _report_get_query(self):
         # XXX 7.1 returns last job status in response; check for
         # report first.
         # response can be:
@@ -1239,32 +1775,803 @@ class PanXapi:
             query['target'] = self.serial
         self._log(DEBUG2, 'report job: %s', job.text)
 
-        start_time = time.time()
+        return query
 
-        while True:
-            response = self.__api_request(query)
+    def report(self, reporttype=None, reportname=None, vsys=None,
+               interval=None, timeout=None, extra_qs=None):
+        self._set_api_key()
+        self._clear_response()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+
+        query = self._report_query(reporttype, reportname, vsys, extra_qs)
+        self._request(query)
+
+        query = self._report_get_query()
+        if query is None:
+            return
+
+        self._job_poller_start(interval, timeout)
+        self.__job_wait(query['job-id'], 'type=report&action=get',
+                        lambda: self._request(query))
+
+
+def _retry_idempotent(query):
+    # True: the request can be repeated; False: retry only when it
+    # was not performed; None: never retry
+    api_type = query.get('type')
+    action = query.get('action')
+
+    if api_type == 'commit':
+        return None
+    if api_type == 'config':
+        return action in ['show', 'get', 'set', 'edit', 'delete',
+                          'override']
+    if api_type == 'op':
+        return query.get('cmd', '').lstrip().startswith('<show>')
+    if api_type in ['log', 'report']:
+        # a query without action=get starts a new job
+        return action == 'get'
+    if api_type == 'import':
+        return False
+
+    return True
+
+
+class PanApiKeyCache:
+    """On-disk API key cache.
+
+    API keys are stored in a JSON file which is only readable by the
+    owner, keyed by hostname, port, username and serial number.
+    """
+
+    def __init__(self, path=None):
+        self._log = logging.getLogger(__name__).log
+        if path is None:
+            path = _api_key_cache_path
+        self.path = os.path.expanduser(path)
+
+    @staticmethod
+    def key(hostname, port=None, api_username=None, serial=None):
+        x = '%s@%s' % (api_username, hostname)
+        if port is not None:
+            x += ':%s' % port
+        if serial is not None:
+            x += '/%s' % serial
+        return x
+
+    def __load(self):
+        try:
+            with open(self.path, 'r') as f:
+                st = os.fstat(f.fileno())
+                if (hasattr(os, 'getuid') and
+                    (st.st_uid != os.getuid() or
+                     st.st_mode & 0o077)):
+                    self._log(DEBUG1, '%s: ignored: owner or mode %o',
+                              self.path, st.st_mode & 0o777)
+                    return {}
+                keys = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self._log(DEBUG1, '%s: %s', self.path, e)
+            return {}
+
+        return keys if isinstance(keys, dict) else {}
+
+    def __save(self, keys):
+        tmp = '%s.%d' % (self.path, os.getpid())
+        try:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(keys, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            # the cache is an optimisation; keygen next time
+            self._log(DEBUG1, '%s: %s', self.path, e)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def get(self, key):
+        return self.__load().get(key)
+
+    def set(self, key, api_key):
+        keys = self.__load()
+        if keys.get(key) == api_key:
+            return
+        keys[key] = api_key
+        self.__save(keys)
+        self._log(DEBUG1, '%s: set %s', self.path, key)
+
+    def delete(self, key):
+        keys = self.__load()
+        if keys.pop(key, None) is not None:
+            self.__save(keys)
+            self._log(DEBUG1, '%s: delete %s', self.path, key)
+
+
+class PanJobPoller:
+    """Job status polling intervals.
+
+    The first poll is after interval seconds.  While the job does
+    not make progress, the interval is increased by factor with
+    random jitter, up to max_interval; when job progress increases by
+    progress_step percent, the interval is reset.  Intervals are
+    limited to the time remaining before timeout.
+    """
+
+    factor = 1.5
+    max_interval = 10.0
+    jitter = 0.1
+    progress_step = 10
+
+    def __init__(self, interval=None, timeout=None):
+        self.interval = _job_query_interval if interval is None else interval
+        self.timeout = timeout if timeout else None
+        self.polls = 0
+        self.wait = 0.0
+        self._next = self.interval
+        self._progress = None
+        self._start = time.monotonic()
+
+    def next_interval(self):
+        interval = self._next
+        self._next = min(self._next * self.factor,
+                         max(self.max_interval, self.interval))
+        if self.jitter:
+            interval *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        if self.timeout is not None:
+            remaining = self._start + self.timeout - time.monotonic()
+            interval = max(0.0, min(interval, remaining))
+        self.wait += interval
+
+        return interval
+
+    def polled(self, progress=None):
+        self.polls += 1
+        if progress is not None:
+            if (self._progress is not None and
+                    progress - self._progress >= self.progress_step):
+                self._next = self.interval
+            self._progress = progress
+
+    def expired(self):
+        return (self.timeout is not None and
+                time.monotonic() > self._start + self.timeout)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self._start
+
+
+class AsyncPanXapi(PanXapi):
+    """asyncio interface to the PAN-OS XML API.
+
+    The API request methods are coroutines with the same arguments
+    as the PanXapi methods.  Response data attributes are set on the
+    object, so use one object for each concurrent task.
+    """
+
+    def __init__(self, *args, **kwargs):
+        keepalive = kwargs.pop('keepalive', False)
+        super().__init__(*args, **kwargs)
+
+        if self._close_pool:
+            if keepalive:
+                self.connection_pool = pan.pool.AsyncPanConnectionPool()
+            else:
+                self.connection_pool = \
+                    pan.pool.AsyncPanConnectionPool(maxsize=0)
+        elif not isinstance(self.connection_pool,
+                            pan.pool.AsyncPanConnectionPool):
+            raise PanXapiError('connection_pool must be ' +
+                               'pan.pool.AsyncPanConnectionPool')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    async def _api_request(self, query, metrics, body=None, headers={}):
+        request = self._http_request(query, body, headers)
+        self._http_code = None
+        self._http_error = None
+        self._metrics_request(metrics, request)
+
+        try:
+            start = time.monotonic()
+            response = await self.connection_pool.urlopen(
+                request,
+                timeout=self.timeout,
+                context=self._ssl_context)
+            self._metrics_response(metrics, response, start)
+            if not self._stream:
+                async with response:
+                    start = time.monotonic()
+                    response.pan_body = await response.read()
+                    self._metrics_body(metrics, response, start)
+
+        except ssl.CertificateError as e:
+            self.status_detail = 'ssl.CertificateError: %s' % e
+            return False
+        except URLError as error:
+            self._http_code = getattr(error, 'code', None)
+            self._http_error = error
+            self.status_detail = self._url_error(error)
+            return False
+
+        self._log(DEBUG2, 'HTTP response headers:')
+        self._log(DEBUG2, '%s', response.info())
+        self._log(DEBUG2, 'stream closed %s', response.closed)
+
+        return response
+
+    async def __request(self, query, body=None, headers={}):
+        metrics = self._metrics_begin(query)
+        try:
+            response = await self._api_request(query, metrics, body=body,
+                                               headers=headers)
             if not response:
                 raise PanXapiError(self.status_detail)
 
-            if not self.__set_response(response):
+            if self._stream_set(response):
+                response.pan_metrics = metrics
+                metrics = None
+                return
+
+            start = time.monotonic()
+            ok = self._set_response(response)
+            metrics.timing['parse'] = time.monotonic() - start
+            if not ok:
                 raise PanXapiError(self.status_detail)
+        except PanXapiError as e:
+            metrics.error = str(e)
+            raise
+        finally:
+            if metrics is not None:
+                self._metrics_end(metrics)
+
+    async def __retry_request(self, query, body=None, headers={}):
+        attempt = 0
+        while True:
+            self._retry_allow()
+            if self.rate_limit is not None:
+                await self.rate_limit.acquire_async(self._host_key,
+                                                    self.api_key)
+            try:
+                await self.__request(query, body=body, headers=headers)
+            except PanXapiError:
+                interval = self._retry_interval(query, attempt)
+                if interval is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(interval)
+                continue
+            if self.retry is not None:
+                self.retry.success(self._host_key)
+            return
+
+    async def _request(self, query, body=None, headers={}):
+        try:
+            await self.__retry_request(query, body=body, headers=headers)
+        except PanXapiError:
+            if not self._api_key_invalid(query):
+                raise
+            stream, self._stream = self._stream, False
+            try:
+                await self._set_api_key()
+            finally:
+                self._stream = stream
+            query['key'] = self.api_key
+            await self.__retry_request(query, body=body, headers=headers)
+
+    async def _stream_begin(self, method, args, kwargs):
+        if method not in _stream_methods:
+            raise PanXapiError('Invalid streaming response method: %s' %
+                               method)
+
+        self._stream = True
+        self._stream_response = None
+        try:
+            f = getattr(self, method)
+            return await f(*args, **kwargs)
+        finally:
+            self._stream = False
+
+    async def iter_result(self, method, *args, path=None,
+                          keep_document=False, **kwargs):
+        await self._set_api_key()
+        await self._stream_begin(method, args, kwargs)
+
+        response = self._stream_response
+        self._stream_response = None
+        with self._metrics_stream(response) as metrics:
+            async with response:
+                if not self._stream_xml(response):
+                    response.pan_body = await response.read()
+                    metrics.bytes_received = len(response.pan_body)
+                    if not self._set_response(response):
+                        raise PanXapiError(self.status_detail)
+                    return
+
+                parser = _XmlStreamParser(self._etree, path,
+                                          keep_document)
+                try:
+                    while True:
+                        try:
+                            data = await response.read(_stream_read_size)
+                        except URLError as error:
+                            self.status_detail = self._url_error(error)
+                            raise PanXapiError(self.status_detail)
+                        if not data:
+                            break
+                        metrics.bytes_received += len(data)
+                        for elem in parser.feed(data):
+                            yield elem
+                except self._etree.ParseError as msg:
+                    self.status_detail = \
+                        '%s.XMLPullParser ParseError: %s' % \
+                        (self._etree.module, msg)
+                    raise PanXapiError(self.status_detail)
+
+            self._stream_end(parser)
+
+    async def _set_api_key(self):
+        if self.api_key is None:
+            if self._api_key_from_cache():
+                return
+            await self.keygen()
+            self._log(DEBUG1, 'autoset api_key')
+            self._api_key_to_cache()
+
+    async def keygen(self, extra_qs=None):
+        self._clear_response()
 
-            status = self.element_root.find('./result/job/status')
-            if status is None:
-                raise PanXapiError('no status element in ' +
-                                   'type=report&action=get response')
-            if status.text == 'FIN':
+        query = self._keygen_query(extra_qs)
+        try:
+            await self._request(query)
+        finally:
+            query.pop('password', None)
+
+        return self._keygen_result()
+
+    async def ad_hoc(self, qs=None, xpath=None, modify_qs=False):
+        await self._set_api_key()
+        self._clear_response()
+
+        query = self._ad_hoc_query(qs, xpath, modify_qs)
+        await self._request(query)
+
+    async def show(self, xpath=None, extra_qs=None):
+        query = _config_args(xpath=xpath)
+        await self._type_config('show', query, extra_qs)
+
+    async def get(self, xpath=None, extra_qs=None):
+        query = _config_args(xpath=xpath)
+        await self._type_config('get', query, extra_qs)
+
+    async def delete(self, xpath=None, extra_qs=None):
+        query = _config_args(xpath=xpath)
+        await self._type_config('delete', query, extra_qs)
+
+    async def set(self, xpath=None, element=None, extra_qs=None):
+        query = _config_args(xpath=xpath, element=element)
+        await self._type_config('set', query, extra_qs)
+
+    async def edit(self, xpath=None, element=None, extra_qs=None):
+        query = _config_args(xpath=xpath, element=element)
+        await self._type_config('edit', query, extra_qs)
+
+    async def move(self, xpath=None, where=None, dst=None, extra_qs=None):
+        query = _config_args(xpath=xpath, where=where, dst=dst)
+        await self._type_config('move', query, extra_qs)
+
+    async def rename(self, xpath=None, newname=None, extra_qs=None):
+        query = _config_args(xpath=xpath, newname=newname)
+        await self._type_config('rename', query, extra_qs)
+
+    async def clone(self, xpath=None, xpath_from=None, newname=None,
+                    extra_qs=None):
+        query = _config_args(xpath=xpath, xpath_from=xpath_from,
+                             newname=newname)
+        await self._type_config('clone', query, extra_qs)
+
+    async def override(self, xpath=None, element=None, extra_qs=None):
+        query = _config_args(xpath=xpath, element=element)
+        await self._type_config('override', query, extra_qs)
+
+    async def multi_config(self, element=None, strict=None, extra_qs=None):
+        query = _config_args(element=element, strict=strict)
+        await self._type_config('multi-config', query, extra_qs)
+
+    async def _type_config(self, action, query, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        query = self._config_query(action, query, extra_qs)
+        await self._request(query)
+
+    async def user_id(self, cmd=None, vsys=None, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        query = self._user_id_query(cmd, vsys, extra_qs)
+        await self._request(query)
+
+    async def _job_wait(self, job, request, poll, sleep_first=False):
+        if sleep_first:
+            await asyncio.sleep(self._job_sleep_time())
+
+        while True:
+            await poll()
+
+            status = self._job_status(request)
+            if self._job_polled(job, status):
+                return
+
+            await asyncio.sleep(self._job_sleep_time())
+
+    async def _legacy_commit_poll(self, query, interval=None, timeout=None):
+        poller = self._job_poller_start(interval, timeout)
+        while True:
+            await asyncio.sleep(self._job_sleep_time())
+
+            metrics = self._metrics_begin(query)
+            response = await self._api_request(query, metrics)
+            if not response:
+                metrics.error = self.status_detail
+                self._metrics_end(metrics)
+                raise PanXapiError(self.status_detail)
+            self._set_response(response)
+            self._metrics_end(metrics)
+            poller.polled()
+            if self.status_detail == "There are no changes to commit.":
+                self._log(DEBUG2, 'commit finished')
                 return
+            else:
+                self._log(DEBUG2, 'commit pending...')
 
-            self._log(DEBUG2, 'job %s status %s', job.text, status.text)
+            if poller.expired():
+                raise PanXapiError('timeout waiting for legacy commit ' +
+                                   'completion')
 
-            if (timeout is not None and timeout != 0 and
-                    time.time() > start_time + timeout):
-                raise PanXapiError('timeout waiting for ' +
-                                   'job %s completion' % job.text)
+    async def commit(self, cmd=None, action=None, sync=False,
+                     interval=None, timeout=None, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
 
-            self._log(DEBUG2, 'sleep %.2f seconds', interval)
-            time.sleep(interval)
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+
+        query = self._commit_query(cmd, action, extra_qs)
+        await self._request(query)
+
+        if sync is not True:
+            return
+
+        if self._legacy_api:
+            return await self._legacy_commit_poll(query,
+                                                  interval=interval,
+                                                  timeout=timeout)
+
+        job = self.element_root.find('./result/job')
+        if job is None:
+            return
+
+        self._log(DEBUG2, 'commit job: %s', job.text)
+
+        cmd = 'show jobs id "%s"' % job.text
+
+        async def poll():
+            try:
+                await self.op(cmd=cmd, cmd_xml=True)
+            except PanXapiError as msg:
+                raise PanXapiError('commit %s: %s' % (cmd, msg))
+
+        self._job_poller_start(interval, timeout)
+        await self._job_wait(job.text, "'%s'" % cmd, poll, sleep_first=True)
+
+    async def op(self, cmd=None, vsys=None, cmd_xml=False, extra_qs=None):
+        if cmd is not None and cmd_xml:
+            cmd = self.cmd_xml(cmd)
+        await self._type_op(cmd, vsys, extra_qs)
+
+    async def _type_op(self, cmd, vsys, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        query = self._op_query(cmd, vsys, extra_qs)
+        await self._request(query)
+
+    async def export(self, category=None, from_name=None, to_name=None,
+                     pcapid=None, search_time=None, serialno=None,
+                     extra_qs=None, file=None, sha256=False):
+        await self._set_api_key()
+        self._clear_response()
+
+        query = self._export_query(category, from_name, to_name,
+                                   pcapid, search_time, serialno,
+                                   extra_qs)
+        if file is None:
+            await self._request(query)
+            if self.export_result and sha256:
+                self.export_result['sha256'] = _sha256(
+                    self.export_result['content'])
+        else:
+            await self._export_file(query, file, sha256)
+
+        if self.export_result:
+            self.export_result['category'] = category
+
+    async def _stream_request(self, query):
+        self._stream = True
+        self._stream_response = None
+        try:
+            await self._request(query)
+        finally:
+            self._stream = False
+
+        response = self._stream_response
+        self._stream_response = None
+        return response
+
+    async def _export_file(self, query, file, sha256):
+        response = await self._stream_request(query)
+        with self._metrics_stream(response) as metrics:
+            async with response:
+                writer = self._export_writer(response, file, sha256)
+                if writer is None:
+                    response.pan_body = await response.read()
+                    metrics.bytes_received = len(response.pan_body)
+                    if not self._set_response(response):
+                        raise PanXapiError(self.status_detail)
+                    return
+
+                error = None
+                try:
+                    while True:
+                        data = await response.read(_stream_read_size)
+                        if not data:
+                            break
+                        metrics.bytes_received += len(data)
+                        writer.write(data)
+                except (OSError, URLError) as e:
+                    error = e
+                self._export_done(writer, error)
+
+    async def import_file(self,
+                          category=None,
+                          file=None,
+                          filename=None,
+                          vsys=None,
+                          extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        query, body, headers = self._import_file_request(category, file,
+                                                         filename, vsys,
+                                                         extra_qs)
+        await self._request(query, body=body, headers=headers)
+
+    async def _log_job_wait(self, query, interval, timeout):
+        self._job_poller_start(interval, timeout)
+        await self._job_wait(query['job-id'], 'type=log&action=get',
+                             lambda: self._request(query))
+
+    async def log(self, log_type=None, nlogs=None, skip=None, filter=None,
+                  interval=None, timeout=None, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+
+        query = self._log_query(log_type, nlogs, skip, filter, extra_qs)
+        await self._request(query)
+
+        query = self._log_get_query()
+        await self._log_job_wait(query, interval, timeout)
+
+    async def iter_logs(self, log_type=None, filter=None, nlogs=None,
+                        skip=None, page_size=None, prefetch=False,
+                        interval=None, timeout=None, extra_qs=None):
+        await self._set_api_key()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+        nlogs, skip, page_size = self._iter_logs_args(nlogs, skip,
+                                                      page_size)
+
+        async def job(skip, remaining):
+            n = page_size if remaining is None else min(page_size,
+                                                        remaining)
+            self._clear_response()
+            query = self._log_query(log_type, n, skip, filter, extra_qs)
+            await self._request(query)
+            return n, self._log_get_query()
+
+        if nlogs == 0:
+            return
+
+        remaining = nlogs
+        n, query = await job(skip, remaining)
+
+        while True:
+            await self._log_job_wait(query, interval, timeout)
+            entries = self._log_page()
+            count = len(entries)
+            self._log(DEBUG1, 'log page skip %d nlogs %d: %d entries',
+                      skip, n, count)
+
+            skip += count
+            if remaining is not None:
+                remaining -= count
+            more = count == n and (remaining is None or remaining > 0)
+
+            next_job = None
+            if more and prefetch:
+                next_job = await job(skip, remaining)
+
+            while entries:
+                yield entries.pop()
+
+            if not more:
+                return
+
+            if next_job is None:
+                next_job = await job(skip, remaining)
+            n, query = next_job
+
+    async def report(self, reporttype=None, reportname=None, vsys=None,
+                     interval=None, timeout=None, extra_qs=None):
+        await self._set_api_key()
+        self._clear_response()
+
+        interval = self._job_interval(interval)
+        timeout = self._job_timeout(timeout)
+
+        query = self._report_query(reporttype, reportname, vsys, extra_qs)
+        await self._request(query)
+
+        query = self._report_get_query()
+        if query is None:
+            return
+
+        self._job_poller_start(interval, timeout)
+        await self._job_wait(query['job-id'], 'type=report&action=get',
+                             lambda: self._request(query))
+
+
+def _config_args(xpath=None, element=None, where=None, dst=None,
+                 newname=None, xpath_from=None, strict=None):
+    # type=config action arguments, shared by PanXapi and AsyncPanXapi
+    query = {}
+    if xpath is not None:
+        query['xpath'] = xpath
+    if xpath_from is not None:
+        query['from'] = xpath_from
+    if element is not None:
+        query['element'] = element
+    if where is not None:
+        query['where'] = where
+    if dst is not None:
+        query['dst'] = dst
+    if newname is not None:
+        query['newname'] = newname
+    if strict is not None:
+        query['strict-transactional'] = 'yes' if strict else 'no'
+
+    return query
+
+
+def _sha256(data):
+    import hashlib
+    return hashlib.sha256(data).hexdigest()
+
+
+class _ExportWriter:
+    # Write an export attachment to a path or file object as it is
+    # read, keeping the export_result statistics.
+
+    def __init__(self, export_result, file, sha256=False):
+        self.export_result = export_result
+        self.export_result['content'] = None
+        self.export_result['path'] = None
+        self.export_result['bytes'] = 0
+        self._start = time.monotonic()
+        self._hash = None
+        if sha256:
+            import hashlib
+            self._hash = hashlib.sha256()
+
+        if callable(file):
+            file = file(export_result['file'])
+        if hasattr(file, 'write'):
+            self._file = file
+            self._close = False
+        else:
+            self._file = open(file, 'wb')
+            self._close = True
+            self.export_result['path'] = file
+
+    def write(self, data):
+        self._file.write(data)
+        self.export_result['bytes'] += len(data)
+        if self._hash is not None:
+            self._hash.update(data)
+
+    def close(self):
+        elapsed = time.monotonic() - self._start
+        self.export_result['elapsed'] = elapsed
+        self.export_result['throughput'] = \
+            self.export_result['bytes'] / elapsed if elapsed > 0 else 0.0
+        self.export_result['sha256'] = \
+            self._hash.hexdigest() if self._hash is not None else None
+        if self._close:
+            self._file.close()
+        else:
+            self._file.flush()
+
+
+class _XmlStreamParser:
+    # Incremental response parser which returns elements matching
+    # path, relative to the root element, as they complete.
+
+    def __init__(self, backend, path=None, keep_document=False):
+        if path is None:
+            path = 'result/*'
+        self.path = path.strip('/').split('/')
+        self.document = None
+        self._parser = backend.pull_parser(events=('start', 'end'))
+        self._stack = []
+        self._root = None
+        self._match = True
+        self._chunks = [] if keep_document else None
+
+    def __match(self):
+        if len(self._stack) != len(self.path) + 1:
+            return False
+        for x, elem in zip(self.path, self._stack[1:]):
+            if x != '*' and x != elem.tag:
+                return False
+        return True
+
+    def feed(self, data):
+        if self._chunks is not None:
+            self._chunks.append(data)
+        self._parser.feed(data)
+
+        elems = []
+        for event, elem in self._parser.read_events():
+            if event == 'start':
+                if self._root is None:
+                    self._root = elem
+                    # keep the complete document for error responses
+                    if elem.get('status', 'success') != 'success':
+                        self._match = False
+                self._stack.append(elem)
+            else:
+                match = self._match and self.__match()
+                self._stack.pop()
+                if match:
+                    self._stack[-1].remove(elem)
+                    elems.append(elem)
+
+        return elems
+
+    def close(self):
+        self._parser.close()
+        if self._chunks is not None:
+            self.document = b''.join(self._chunks).decode(_encoding)
+            self._chunks = None
+        if self._root is None:
+            raise etree.ParseError('no element found')
+
+        return self._root
 
 
 # Minimal RFC 2388 implementation
@@ -1292,13 +2599,16 @@ class _MultiPartFormData:
                              body=value)
         self.parts.append(part)
 
-    def add_file(self, filename=None, body=None):
+    def add_file(self, filename=None, body=None, path=None):
         part = _FormDataPart(name='file')
         if filename is not None:
             part.append_header('filename', filename)
         if body is not None:
             part.add_header(b'Content-Type: application/octet-stream')
             part.add_body(body)
+        elif path is not None:
+            part.add_header(b'Content-Type: application/octet-stream')
+            part.add_path(path)
         self.parts.append(part)
 
     def _boundary(self):
@@ -1329,23 +2639,44 @@ class _MultiPartFormData:
         headers = {
             'Content-Type':
                 'multipart/form-data; boundary=' + boundary,
+            'Content-Length': str(self.content_length()),
         }
 
         return headers
 
     def http_body(self):
-        bio = BytesIO()
+        if [part for part in self.parts if part.path is not None]:
+            # iterable body, files are read as the request is sent
+            return _MultiPartBody(self)
 
+        return b''.join(self.chunks())
+
+    def chunks(self):
         boundary = b'--' + self.boundary
         for part in self.parts:
-            bio.write(boundary)
-            bio.write(b'\r\n')
-            bio.write(part.serialize())
-            bio.write(b'\r\n')
-        bio.write(boundary)
-        bio.write(b'--')
+            yield boundary + b'\r\n'
+            yield from part.chunks()
+            yield b'\r\n'
+        yield boundary + b'--'
+
+    def content_length(self):
+        boundary = len(self.boundary) + 2
+        length = sum(boundary + 2 + len(part) + 2 for part in self.parts)
+        return length + boundary + 2
 
-        return bio.getvalue()
+
+class _MultiPartBody:
+    # Re-iterable so the request can be sent again on a new connection.
+
+    def __init__(self, form):
+        self.form = form
+        self.length = form.content_length()
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return self.form.chunks()
 
 
 class _FormDataPart:
@@ -1355,6 +2686,8 @@ class _FormDataPart:
         self.add_header(b'Content-Disposition: form-data')
         self.append_header('name', name)
         self.body = None
+        self.path = None
+        self.size = 0
         if body is not None:
             self.add_body(body)
 
@@ -1393,17 +2726,52 @@ class _FormDataPart:
         if isinstance(body, str):
             body = body.encode('latin-1')
         self.body = body
+        self.size = len(body)
         self._log(DEBUG1, '_FormDataPart.add_body: %s %d',
                   type(self.body), len(self.body))
 
-    def serialize(self):
-        bio = BytesIO()
-        bio.write(b'\r\n'.join(self.headers))
-        bio.write(b'\r\n\r\n')
+    def add_path(self, path):
+        self.size = os.path.getsize(path)
+        self.path = path
+        self._log(DEBUG1, '_FormDataPart.add_path: %s size: %d',
+                  self.path, self.size)
+
+    def __len__(self):
+        return len(self.__headers()) + self.size
+
+    def __headers(self):
+        return b'\r\n'.join(self.headers) + b'\r\n\r\n'
+
+    def chunks(self):
+        yield self.__headers()
         if self.body is not None:
-            bio.write(self.body)
+            yield self.body
+        elif self.path is not None:
+            md5 = sha256 = None
+            if logging.getLogger(__name__).getEffectiveLevel() == DEBUG3:
+                import hashlib
+                md5 = hashlib.md5()
+                sha256 = hashlib.sha256()
+            with open(self.path, 'rb') as f:
+                size = 0
+                while True:
+                    data = f.read(_upload_read_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    if md5 is not None:
+                        md5.update(data)
+                        sha256.update(data)
+                    yield data
+            if size != self.size:
+                raise OSError('%s: file size changed: %d != %d' %
+                              (self.path, self.size, size))
+            if md5 is not None:
+                self._log(DEBUG3, 'MD5: %s', md5.hexdigest())
+                self._log(DEBUG3, 'SHA256: %s', sha256.hexdigest())
 
-        return bio.getvalue()
+    def serialize(self):
+        return b''.join(self.chunks())
 
 
 if __name__ == '__main__':
@@ -31,3 +31,58 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
         self.assertIsNotNone(x)
         for entry in x:
             self.assertEqual(entry.find('./cmd').text, 'delete')
+
+    def test_03(self):
+        nlogs = 25
+        entries = list(self.api.iter_logs(log_type='config', nlogs=nlogs,
+                                          page_size=10))
+        self.assertLessEqual(len(entries), nlogs)
+        seqno = set()
+        for entry in entries:
+            self.assertEqual(entry.tag, 'entry')
+            self.assertEqual(entry.find('./type').text, 'CONFIG')
+            seqno.add(entry.find('./seqno').text)
+        self.assertEqual(len(seqno), len(entries))
+
+    def test_04(self):
+        a = list(self.api.iter_logs(log_type='system', nlogs=12,
+                                    page_size=5))
+        b = list(self.api.iter_logs(log_type='system', nlogs=12,
+                                    page_size=5, prefetch=True))
+        self.assertEqual(len(a), len(b))
+
+    def test_05(self):
+        with self.assertRaises(pan.xapi.PanXapiError):
+            list(self.api.iter_logs(log_type='config', page_size=5001))
+
+    def test_06(self):
+        self.api.log(log_type='system', nlogs=1)
+        self.assertEqual(self.api.status, 'success')
+        self.assertIsInstance(self.api.job_poll, pan.xapi.PanJobPoller)
+        self.assertGreaterEqual(self.api.job_poll.polls, 1)
+
+        class FixedPoller(pan.xapi.PanJobPoller):
+            factor = 1
+            jitter = 0
+
+        api = self.xapi(job_poller=FixedPoller)
+        api.log(log_type='system', nlogs=1, interval=0.25)
+        self.assertEqual(api.status, 'success')
+        self.assertIsInstance(api.job_poll, FixedPoller)
+        polls = api.job_poll.polls
+        self.assertEqual(api.job_poll.wait, (polls - 1) * 0.25)
+
+    def test_07(self):
+        poller = pan.xapi.PanJobPoller(interval=1, timeout=0)
+        intervals = [poller.next_interval() for x in range(20)]
+        self.assertLessEqual(intervals[0], 1.1)
+        self.assertLessEqual(max(intervals),
+                             poller.max_interval * (1 + poller.jitter))
+        self.assertFalse(poller.expired())
+
+        for progress in [0, 5]:
+            poller.polled(progress)
+        self.assertGreater(poller.next_interval(), 1.1)
+        poller.polled(50)
+        self.assertLessEqual(poller.next_interval(), 1.1)
+        self.assertEqual(poller.polls, 3)
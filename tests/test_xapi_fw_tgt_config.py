@@ -6,6 +6,7 @@ from . import xapi_mixin
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.config
 import pan.xapi
 
 BASE_XPATH = ("/config/devices/entry[@name='localhost.localdomain']"
@@ -83,3 +84,173 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
             x = self.api.element_root.find('./result')
             self.assertIsNotNone(x)
             self.assertEqual(len(x), 0)
+
+    def test_02(self):
+        address = self.name('address', 16)
+        xpath = XPATH_ADDR % address
+
+        self.api.set(element=ELEMENT, xpath=xpath)
+        self.assertEqual(self.api.status, 'success')
+
+        entries = list(self.api.iter_result('get', xpath=BASE_XPATH,
+                                            path='result/address/entry'))
+        self.assertEqual(self.api.status, 'success')
+        self.assertEqual(self.api.status_code, '19')
+        self.assertIsNone(self.api.xml_document)
+        names = [x.get('name') for x in entries]
+        self.assertIn(address, names)
+        x = entries[names.index(address)]
+        self.assertEqual(x.findtext('ip-netmask'), IP_ADDRESS)
+        x = self.api.element_root.find('./result/address')
+        self.assertIsNotNone(x)
+        self.assertEqual(len(x), 0)
+
+        entries = list(self.api.iter_result('get', xpath=xpath,
+                                            keep_document=True))
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0].tag, 'entry')
+        self.assertIn(IP_ADDRESS, self.api.xml_document)
+
+        with self.assertRaises(pan.xapi.PanXapiError):
+            list(self.api.iter_result('commit'))
+
+        self.api.delete(xpath=xpath)
+        self.assertEqual(self.api.status, 'success')
+
+    def test_03(self):
+        xpath = "/config/devices/entry[@name='localhost.localdomain']"
+        results = []
+        for xml_backend in ['etree', 'lxml']:
+            try:
+                api = self.xapi(xml_backend=xml_backend)
+            except pan.xapi.PanXapiError as e:
+                if xml_backend == 'lxml':
+                    self.skipTest(str(e))
+                raise
+            self.assertEqual(api.xml_backend, xml_backend)
+            api.get(xpath=xpath)
+            self.assertEqual(api.status, 'success')
+            self.assertEqual(api.status_code, '19')
+            self.assertIsNotNone(api.element_root.find('./result/entry'))
+            results.append(api.xml_result())
+
+        self.assertEqual(results[0], results[1])
+
+    def test_04(self):
+        address = self.name('address', 16)
+        group = self.name('group', 16)
+        xpath = XPATH_ADDR % address
+        xpath_group = BASE_XPATH + "-group/entry[@name='%s']" % group
+
+        self.api.set(element=ELEMENT, xpath=xpath)
+        self.assertEqual(self.api.status, 'success')
+        self.api.set(element='<static><member>%s</member></static>' %
+                     address, xpath=xpath_group)
+        self.assertEqual(self.api.status, 'success')
+
+        self.api.get(xpath='/config')
+        self.assertEqual(self.api.status, 'success')
+        conf = pan.config.PanConfig(
+            config=self.api.element_root.find('./result/config'))
+        index = conf.index()
+        self.assertIs(conf.index(), index)
+
+        x = index.resolve('address', address, 'vsys1')
+        self.assertIsNotNone(x)
+        self.assertEqual(x.scope, 'vsys1')
+        self.assertEqual(x.elem.findtext('ip-netmask'), IP_ADDRESS)
+        self.assertEqual(conf.xpath(x.xpath), [x.elem])
+        self.assertEqual(index.lookup(address), [x])
+
+        refs = index.references(address)
+        self.assertEqual([(x.type, x.name) for x in refs],
+                         [('address-group', group)])
+
+        for path in [xpath_group, xpath]:
+            self.api.delete(xpath=path)
+            self.assertEqual(self.api.status, 'success')
+
+    def test_05(self):
+        address = self.name('address', 16)
+        xpath = XPATH_ADDR % address
+
+        configs = []
+        for x in range(2):
+            self.api.get(xpath='/config')
+            self.assertEqual(self.api.status, 'success')
+            configs.append(pan.config.PanConfig(
+                config=self.api.element_root.find('./result/config')))
+            if x == 0:
+                self.api.set(element=ELEMENT, xpath=xpath)
+                self.assertEqual(self.api.status, 'success')
+
+        self.assertEqual(configs[0].diff(configs[0]), [])
+        changes = configs[0].diff(configs[1])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(changes[0].op, 'set')
+        self.assertEqual(changes[0].xpath, BASE_XPATH)
+        self.assertEqual(changes[0].elem.get('name'), address)
+
+        changes = configs[1].diff(configs[0])
+        self.assertEqual([(x.op, x.xpath) for x in changes],
+                         [('delete', xpath)])
+
+        self.api.delete(xpath=xpath)
+        self.assertEqual(self.api.status, 'success')
+
+    def test_06(self):
+        # address 2 deleted and removed from the group which
+        # references it: the reference is removed first
+        addresses = [self.name('address%d' % x, 16) for x in range(2)]
+        group = self.name('group', 16)
+        xpath_group = BASE_XPATH + "-group/entry[@name='%s']" % group
+
+        for address in addresses:
+            self.api.set(element=ELEMENT, xpath=XPATH_ADDR % address)
+            self.assertEqual(self.api.status, 'success')
+        self.api.set(element='<static>%s</static>' %
+                     ''.join('<member>%s</member>' % x for x in addresses),
+                     xpath=xpath_group)
+        self.assertEqual(self.api.status, 'success')
+
+        def config(remove):
+            # remove the entry or member elements named x from the
+            # elements at xpath
+            self.api.get(xpath='/config')
+            self.assertEqual(self.api.status, 'success')
+            root = self.api.element_root.find('./result/config')
+            for xpath, x in remove:
+                parent = root.find('.' + xpath[len('/config'):])
+                self.assertIsNotNone(parent, msg=xpath)
+                for elem in list(parent):
+                    if x in [elem.get('name'), elem.text]:
+                        parent.remove(elem)
+            return pan.config.PanConfig(config=root)
+
+        xpath_member = xpath_group + "/static/member[text()='%s']" % \
+            addresses[1]
+        conf = config([])
+        other = config([(xpath_group + '/static', addresses[1]),
+                        (BASE_XPATH, addresses[1])])
+
+        changes = conf.diff(other)
+        self.assertEqual([(x.op, x.xpath) for x in changes],
+                         [('delete', xpath_member),
+                          ('delete', XPATH_ADDR % addresses[1])])
+        cli = list(conf.diff_set_cli(other))
+        self.assertEqual(cli, ['delete address-group %s static %s' %
+                               (group, addresses[1]),
+                               'delete address %s' % addresses[1]])
+
+        # group deleted before its addresses
+        other = config([(BASE_XPATH, x) for x in addresses] +
+                       [(BASE_XPATH + '-group', group)])
+        xpaths = [x.xpath for x in conf.diff(other)]
+        self.assertLess(xpaths.index(xpath_group),
+                        xpaths.index(XPATH_ADDR % addresses[0]))
+        self.assertLess(xpaths.index(xpath_group),
+                        xpaths.index(XPATH_ADDR % addresses[1]))
+
+        for path in [xpath_group] + [XPATH_ADDR % x for x in addresses]:
+            self.api.delete(xpath=path)
+            self.assertEqual(self.api.status, 'success')
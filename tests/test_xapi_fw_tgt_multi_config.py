@@ -7,6 +7,8 @@ from . import xapi_mixin
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.config
+import pan.multiconfig
 import pan.xapi
 
 BASE_XPATH = ("/config/devices/entry[@name='localhost.localdomain']"
@@ -124,3 +126,97 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
             x = self.api.element_root.find('./result')
             self.assertIsNotNone(x)
             self.assertEqual(len(x), 0)
+
+    def test_03(self):
+        addresses = [self.name('address%d' % x, 16) for x in range(5)]
+        xpaths = [XPATH_ADDR % x for x in addresses]
+
+        mc = pan.multiconfig.PanMultiConfig(max_actions=2)
+        for xpath in xpaths:
+            element = etree.Element('ip-netmask')
+            element.text = IP_ADDRESS1
+            mc.set(xpath, element)
+        self.assertEqual(len(mc), 5)
+        self.assertEqual(len(mc.documents()), 3)
+
+        mc.run(self.api)
+        self.assertEqual(self.api.status, 'success')
+        self.assertEqual(mc.requests, 3)
+        self.assertEqual(mc.applied, 5)
+
+        for xpath in xpaths:
+            self.api.get(xpath=xpath)
+            self.assertEqual(self.api.status, 'success')
+            self.assertEqual(self.api.status_code, '19')
+            x = self.api.element_root.find(ELEMENT_PATH)
+            self.assertIsNotNone(x)
+            self.assertEqual(x.text, IP_ADDRESS1)
+
+        mc = pan.multiconfig.PanMultiConfig()
+        for xpath in xpaths:
+            mc.delete(xpath)
+        mc.run(self.api)
+        self.assertEqual(self.api.status, 'success')
+        self.assertEqual(mc.requests, 1)
+
+    def test_04(self):
+        # delete an address which is referenced by a group; the group
+        # member is removed first in the same transaction
+        addresses = [self.name('address%d' % x, 16) for x in range(2)]
+        group = self.name('group', 16)
+        xpath_group = BASE_XPATH + "-group/entry[@name='%s']" % group
+
+        mc = pan.multiconfig.PanMultiConfig()
+        for address in addresses:
+            element = etree.Element('ip-netmask')
+            element.text = IP_ADDRESS1
+            mc.set(XPATH_ADDR % address, element)
+        mc.set(xpath_group, '<static>%s</static>' %
+               ''.join('<member>%s</member>' % x for x in addresses))
+        mc.run(self.api)
+        self.assertEqual(self.api.status, 'success')
+
+        self.api.get(xpath='/config')
+        self.assertEqual(self.api.status, 'success')
+        conf = pan.config.PanConfig(
+            config=self.api.element_root.find('./result/config'))
+        self.api.get(xpath='/config')
+        self.assertEqual(self.api.status, 'success')
+        root = self.api.element_root.find('./result/config')
+        for xpath in [BASE_XPATH, xpath_group + '/static']:
+            parent = root.find('.' + xpath[len('/config'):])
+            self.assertIsNotNone(parent, msg=xpath)
+            for elem in list(parent):
+                if addresses[1] in [elem.get('name'), elem.text]:
+                    parent.remove(elem)
+        other = pan.config.PanConfig(config=root)
+
+        changes = conf.diff(other)
+        mc = pan.multiconfig.PanMultiConfig()
+        # reversed: an address delete before the member delete
+        mc.add_changes(reversed(changes))
+        self.assertEqual(len(mc), 2)
+        document = mc.documents()[0]
+        self.assertLess(document.index('/member'),
+                        document.index("address/entry[@name="))
+
+        mc.run(self.api, strict=True)
+        self.assertEqual(self.api.status, 'success', msg=document)
+        self.assertEqual(mc.applied, 2)
+
+        self.api.get(xpath=XPATH_ADDR % addresses[1])
+        self.assertEqual(self.api.status_code, '7')
+        self.api.get(xpath=xpath_group + '/static')
+        self.assertEqual(self.api.status, 'success')
+        members = [x.text for x in
+                   self.api.element_root.findall('./result/static/member')]
+        self.assertEqual(members, [addresses[0]])
+
+        with self.assertRaises(pan.multiconfig.PanMultiConfigError):
+            mc.move(xpath_group, 'middle')
+
+        mc = pan.multiconfig.PanMultiConfig()
+        mc.delete(xpath_group)
+        mc.delete(XPATH_ADDR % addresses[0])
+        mc.run(self.api)
+        self.assertEqual(self.api.status, 'success')
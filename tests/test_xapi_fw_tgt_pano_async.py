@@ -0,0 +1,47 @@
+import asyncio
+import os
+import sys
+import unittest
+
+from . import xapi_mixin
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.pool
+import pan.xapi
+
+
+class PanXapiTest(xapi_mixin.AsyncMixin, unittest.IsolatedAsyncioTestCase):
+    async def test_01(self):
+        await self.api.op(cmd='show system info', cmd_xml=True)
+        self.assertEqual(self.api.status, 'success')
+        x = self.api.element_root.find('./result/system/serial')
+        self.assertIsNotNone(x)
+        self.assertTrue(x.text)
+
+    async def test_02(self):
+        with self.assertRaises(pan.xapi.PanXapiError) as e:
+            await self.api.op(cmd_xml=True, cmd='show jobs id "4294967295"')
+        self.assertEqual(self.api.status, 'error')
+        msgs = ['job -1 not found', 'job 4294967295 not found']
+        self.assertIn(str(e.exception), msgs)
+
+    async def test_03(self):
+        await self.api.get(xpath='/config/mgt-config')
+        self.assertEqual(self.api.status, 'success')
+        x = self.api.element_root.find('./result/mgt-config')
+        self.assertIsNotNone(x)
+
+    async def test_04(self):
+        pool = pan.pool.AsyncPanConnectionPool()
+        apis = [self.xapi(pan.xapi.AsyncPanXapi, connection_pool=pool)
+                for _ in range(4)]
+        try:
+            await asyncio.gather(*[x.op(cmd='show clock', cmd_xml=True)
+                                   for x in apis])
+            for x in apis:
+                self.assertEqual(x.status, 'success')
+                self.assertTrue(x.xml_result())
+            self.assertGreater(len(pool), 0)
+        finally:
+            pool.close()
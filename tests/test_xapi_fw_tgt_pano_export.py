@@ -1,5 +1,7 @@
+import io
 import os
 import sys
+import tempfile
 import unittest
 
 from . import xapi_mixin
@@ -34,3 +36,47 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
         self.assertIsNotNone(self.api.export_result['content'])
         x = name.lower() + '.pem'
         self.assertEqual(self.api.export_result['file'], x)
+
+    def test_03(self):
+        name = '0041_Entrust.net_Certification_Authority_(2048)'
+        kwargs = {
+            'category': 'certificate',
+            'extra_qs': {
+                'certificate-name': name,
+                'format': 'pem',
+                'include-key': 'no',
+            },
+        }
+
+        self.api.export(sha256=True, **kwargs)
+        self.assertEqual(self.api.status, 'success')
+        content = self.api.export_result['content']
+        digest = self.api.export_result['sha256']
+        self.assertEqual(self.api.export_result['bytes'], len(content))
+
+        f = io.BytesIO()
+        self.api.export(file=f, sha256=True, **kwargs)
+        self.assertEqual(self.api.status, 'success')
+        self.assertIsNone(self.api.export_result['content'])
+        self.assertIsNone(self.api.export_result['path'])
+        self.assertEqual(f.getvalue(), content)
+        self.assertEqual(self.api.export_result['bytes'], len(content))
+        self.assertEqual(self.api.export_result['sha256'], digest)
+
+        with tempfile.TemporaryDirectory() as d:
+            self.api.export(file=lambda x: os.path.join(d, x), **kwargs)
+            self.assertEqual(self.api.status, 'success')
+            path = os.path.join(d, name.lower() + '.pem')
+            self.assertEqual(self.api.export_result['path'], path)
+            self.assertIsNone(self.api.export_result['sha256'])
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), content)
+
+        # not an attachment
+        f = io.BytesIO()
+        self.api.export(category='configuration', file=f)
+        self.assertEqual(self.api.status, 'success')
+        self.assertIsNone(self.api.export_result)
+        self.assertEqual(len(f.getvalue()), 0)
+        x = self.api.element_root.find('./mgt-config')
+        self.assertIsNotNone(x)
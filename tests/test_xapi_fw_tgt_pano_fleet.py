@@ -0,0 +1,67 @@
+import asyncio
+import os
+import sys
+import unittest
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.fleet
+import pan.xapi
+
+
+class PanFleetTest(unittest.TestCase):
+    def setUp(self):
+        tag = os.getenv('XAPI_TAG')
+        if tag is None:
+            raise RuntimeError('no XAPI_TAG in environment')
+        self.tags = [tag] * 3
+
+    def test_01(self):
+        fleet = pan.fleet.PanFleet(tags=self.tags, parallel=2)
+        results = list(fleet.run('op', cmd='show system info',
+                                 cmd_xml=True))
+        self.assertEqual(len(results), len(self.tags))
+        for r in results:
+            self.assertTrue(r.ok)
+            self.assertGreater(r.latency, 0)
+            self.assertEqual(r.xapi.status, 'success')
+            x = r.xapi.element_root.find('./result/system/serial')
+            self.assertIsNotNone(x)
+
+    def test_02(self):
+        fleet = pan.fleet.PanFleet(tags=self.tags + ['no-such-tag'])
+        results = list(fleet.run('op', cmd='show jobs id "4294967295"',
+                                 cmd_xml=True))
+        self.assertEqual(len(results), len(self.tags) + 1)
+        for r in results:
+            self.assertFalse(r.ok)
+            self.assertTrue(r.error)
+
+    def test_03(self):
+        fleet = pan.fleet.PanFleet(tags=self.tags)
+
+        def status(xapi):
+            xapi.get(xpath='/config/mgt-config')
+            return xapi.status
+
+        for r in fleet.run(status):
+            self.assertEqual(r.value, 'success')
+
+    def test_04(self):
+        fleet = pan.fleet.PanFleet(tags=self.tags, timeout=30)
+
+        async def run():
+            return [r async for r in fleet.run_async('op', cmd='show clock',
+                                                     cmd_xml=True)]
+
+        results = asyncio.run(run())
+        self.assertEqual(len(results), len(self.tags))
+        for r in results:
+            self.assertTrue(r.ok)
+            self.assertIsInstance(r.xapi, pan.xapi.AsyncPanXapi)
+
+    def test_05(self):
+        with self.assertRaises(pan.fleet.PanFleetError):
+            pan.fleet.PanFleet()
+        with self.assertRaises(pan.fleet.PanFleetError):
+            pan.fleet.PanFleet(tags=self.tags, parallel=0)
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+from . import xapi_mixin
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.jobs
+import pan.xapi
+
+
+class PanJobWatcherTest(xapi_mixin.Mixin, unittest.TestCase):
+    def jobs(self):
+        self.api.op(cmd='show jobs all', cmd_xml=True)
+        self.assertEqual(self.api.status, 'success')
+        jobs = [x.findtext('id') for x in
+                self.api.element_root.findall('./result/job')
+                if x.findtext('status') == 'FIN']
+        if not jobs:
+            self.skipTest('no finished jobs')
+        return jobs[:3]
+
+    def test_01(self):
+        jobs = self.jobs()
+        watcher = pan.jobs.PanJobWatcher(self.api, interval=0.1)
+        done = []
+        futures = [watcher.add(x, callback=done.append) for x in jobs]
+        self.assertEqual(len(watcher), len(jobs))
+        watcher.run()
+        self.assertEqual(len(done), len(jobs))
+        for job, future in zip(jobs, futures):
+            self.assertEqual(future.result().findtext('id'), job)
+            self.assertEqual(future.result().findtext('status'), 'FIN')
+        self.assertEqual(watcher.requests, 1)
+        self.assertEqual(watcher.job_poll.polls, 1)
+
+    def test_02(self):
+        with self.assertRaises(pan.xapi.PanXapiError):
+            pan.jobs.PanJobWatcher(self.api).add('x')
+
+        watcher = pan.jobs.PanJobWatcher(self.api, interval=0.1)
+        future = watcher.add(2 ** 31 - 1)
+        watcher.run()
+        self.assertIsInstance(future.exception(), pan.xapi.PanXapiError)
+
+
+class PanJobWatcherAsyncTest(xapi_mixin.AsyncMixin,
+                             unittest.IsolatedAsyncioTestCase):
+    async def test_01(self):
+        await self.api.op(cmd='show jobs all', cmd_xml=True)
+        jobs = [x.findtext('id') for x in
+                self.api.element_root.findall('./result/job')
+                if x.findtext('status') == 'FIN'][:3]
+        if not jobs:
+            self.skipTest('no finished jobs')
+
+        watcher = pan.jobs.PanJobWatcher(self.api, interval=0.1)
+        futures = [watcher.add(x) for x in jobs]
+        await watcher.run_async()
+        for future in futures:
+            self.assertEqual(future.result().findtext('status'), 'FIN')
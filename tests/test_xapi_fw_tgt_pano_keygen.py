@@ -0,0 +1,65 @@
+import os
+import sys
+import tempfile
+import unittest
+
+from . import xapi_mixin
+
+libpath = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.xapi
+
+
+class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        if (self.api.api_username is None or
+                self.api.api_password is None):
+            self.skipTest('api_username and api_password required')
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'keys')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def xapi_cache(self):
+        api = self.xapi(api_username=self.api.api_username,
+                        api_password=self.api.api_password,
+                        api_key_cache=self.path)
+        self.assertIsNone(api.api_key)
+        return api
+
+    def test_01(self):
+        api = self.xapi_cache()
+        api.op(cmd='show system info', cmd_xml=True)
+        self.assertEqual(api.status, 'success')
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        cache = pan.xapi.PanApiKeyCache(self.path)
+        key = cache.key(api.hostname, api.port, api.api_username,
+                        api.serial)
+        self.assertEqual(cache.get(key), api.api_key)
+
+        api = self.xapi_cache()
+        api.op(cmd='show system info', cmd_xml=True)
+        self.assertEqual(api.status, 'success')
+        self.assertEqual(cache.get(key), api.api_key)
+
+    def test_02(self):
+        api = self.xapi_cache()
+        api.op(cmd='show system info', cmd_xml=True)
+        cache = pan.xapi.PanApiKeyCache(self.path)
+        key = cache.key(api.hostname, api.port, api.api_username,
+                        api.serial)
+        api_key = cache.get(key)
+
+        # invalid cached key is replaced using keygen
+        cache.set(key, 'invalid')
+        api = self.xapi_cache()
+        api.op(cmd='show system info', cmd_xml=True)
+        self.assertEqual(api.status, 'success')
+        self.assertNotEqual(api.api_key, 'invalid')
+        self.assertNotEqual(cache.get(key), 'invalid')
+        self.assertIsNotNone(api_key)
+
+        cache.delete(key)
+        self.assertIsNone(cache.get(key))
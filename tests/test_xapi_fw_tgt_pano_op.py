@@ -1,11 +1,17 @@
+import json
 import os
 import sys
+import tempfile
+import time
 import unittest
 
 from . import xapi_mixin
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.metrics
+import pan.ratelimit
+import pan.retry
 import pan.xapi
 
 
@@ -62,3 +68,89 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
         x = self.api.element_root.find('./msg/line')
         self.assertIsNotNone(x)
         self.assertIn(x.text, msgs)
+
+    def test_03(self):
+        metrics = pan.metrics.PanMetrics()
+        requests = []
+
+        class Hook(pan.metrics.PanHook):
+            def post_request(self, x):
+                requests.append(x)
+
+        api = self.xapi(keepalive=True, hooks=[metrics, Hook()])
+        for _ in range(3):
+            api.op(cmd_xml=True, cmd='show system info')
+        with self.assertRaises(pan.xapi.PanXapiError):
+            api.op(cmd_xml=True, cmd='show jobs id "4294967295"')
+        api.close()
+
+        self.assertEqual(len(metrics), 4)
+        self.assertEqual(metrics.errors, 1)
+        self.assertEqual(len(requests), 4)
+        self.assertIs(api.request_metrics, requests[-1])
+
+        x = requests[0]
+        self.assertEqual(x.api_type, 'op')
+        self.assertEqual(x.http_code, 200)
+        self.assertEqual(x.status, 'success')
+        self.assertFalse(x.reused)
+        self.assertIsNotNone(x.timing['connect'])
+        self.assertTrue(x.bytes_received > 0)
+        self.assertTrue(requests[1].reused)
+        self.assertIsNone(requests[1].timing['connect'])
+        self.assertEqual(requests[-1].status, 'error')
+        self.assertFalse(requests[-1].ok)
+
+        d = json.loads(metrics.json())
+        self.assertEqual(d['connections'], {'new': 1, 'reused': 3})
+        self.assertEqual(d['latency']['op']['count'], 4)
+        x = metrics.prometheus()
+        self.assertIn('pan_xapi_requests_total{type="op",action="",'
+                      'status="success"} 3\n', x)
+        self.assertIn('pan_xapi_request_duration_seconds_bucket'
+                      '{type="op",le="+Inf"} 4\n', x)
+
+    def test_04(self):
+        breaker = pan.retry.PanCircuitBreaker(threshold=2)
+        retry = pan.retry.PanRetry(retries=2, interval=0.01,
+                                   breaker=breaker)
+
+        # an API error response is not retried
+        api = self.xapi(retry=retry)
+        with self.assertRaises(pan.xapi.PanXapiError):
+            api.op(cmd_xml=True, cmd='show jobs id "4294967295"')
+        self.assertEqual(retry.retried, 0)
+
+        # connection refused is retried until the circuit opens
+        dead = self.xapi(hostname='127.0.0.1', port=1, retry=retry)
+        with self.assertRaises(pan.xapi.PanXapiError) as e:
+            dead.op(cmd_xml=True, cmd='show system info')
+        self.assertIn('Connection refused', str(e.exception))
+        self.assertEqual(retry.retried, 1)
+        self.assertEqual(breaker.state('127.0.0.1:1'), 'open')
+
+        with self.assertRaises(pan.xapi.PanXapiError) as e:
+            dead.op(cmd_xml=True, cmd='show system info')
+        self.assertEqual(str(e.exception), 'circuit open: 127.0.0.1:1')
+        self.assertEqual(retry.retried, 1)
+
+        api.op(cmd_xml=True, cmd='show system info')
+        self.assertEqual(api.status, 'success')
+
+    def test_05(self):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, 'ratelimit')
+            rate_limit = pan.ratelimit.PanRateLimiter(rate=4, burst=1,
+                                                      path=path)
+            api = self.xapi(rate_limit=rate_limit)
+            start = time.monotonic()
+            for _ in range(3):
+                api.op(cmd_xml=True, cmd='show system info')
+            elapsed = time.monotonic() - start
+
+            self.assertEqual(rate_limit.requests, 3)
+            self.assertEqual(rate_limit.waits, 2)
+            self.assertGreaterEqual(elapsed, 0.45)
+            with open(path) as f:
+                x = f.read()
+            self.assertNotIn(api.api_key, x)
@@ -7,6 +7,7 @@ from . import xapi_mixin
 
 libpath = os.path.dirname(os.path.abspath(__file__))
 sys.path[:0] = [os.path.join(libpath, os.pardir, 'lib')]
+import pan.userid
 import pan.xapi
 
 
@@ -100,3 +101,73 @@ class PanXapiTest(xapi_mixin.Mixin, unittest.TestCase):
         self.assertEqual(self.api.status, 'success')
         x = self.api.element_root.find('./result/entry')
         self.assertIsNone(x)
+
+    def test_03(self):
+        ips = ['192.0.2.%d' % x for x in range(1, 5)]
+        tag = self.name('tag03', 8)
+
+        batch = pan.userid.PanUserIdBatch(max_entries=2, parallel=2)
+        for ip in ips:
+            batch.register(ip, [tag])
+            batch.register(ip, [tag])
+        self.assertEqual(batch.events, 8)
+        self.assertEqual(len(batch), 4)
+        self.assertEqual(len(batch.messages()), 2)
+
+        results = list(batch.run(tag=self.api.tag))
+        self.assertEqual(len(results), 2)
+        for x in results:
+            self.assertTrue(x.ok, msg=x.error)
+            self.assertEqual(x.errors, [])
+
+        for ip in ips:
+            self.api.op(cmd_xml=True,
+                        cmd='show object registered-ip ip "%s"' % ip)
+            self.assertEqual(self.api.status, 'success')
+            x = self.api.element_root.find('./result/entry/tag')
+            self.assertIsNotNone(x)
+            self.assertIn(tag, [m.text for m in x])
+
+        batch = pan.userid.PanUserIdBatch()
+        for ip in ips:
+            batch.register(ip, [tag])
+            batch.unregister(ip, [tag])
+        results = list(batch.run(tag=self.api.tag))
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].ok, msg=results[0].error)
+        self.assertEqual(results[0].entries, 4)
+
+    def test_04(self):
+        ips = ['192.0.2.%d' % x for x in range(11, 15)]
+        tags = [self.name('tag04a', 8), self.name('tag04b', 8)]
+
+        dag = pan.userid.PanDagSync(tags=tags, parallel=2)
+        desired = dict((ip, tags) for ip in ips)
+        results = list(dag.sync(desired, tag=self.api.tag))
+        for x in results:
+            self.assertTrue(x.ok, msg=x.error)
+        self.assertEqual(len(dag.batch), len(ips) * len(tags))
+
+        # no change
+        results = list(dag.sync(desired, tag=self.api.tag))
+        self.assertEqual(results, [])
+        self.assertEqual(len(dag.batch), 0)
+
+        del desired[ips[0]]
+        desired[ips[1]] = tags[:1]
+        results = list(dag.sync(desired, refresh=False, tag=self.api.tag))
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].ok, msg=results[0].error)
+        self.assertEqual(len(dag.batch), 3)
+
+        current = dag.current
+        dag.fetch(self.api)
+        for ip in ips:
+            self.assertEqual(dag.current.get(ip, set()) & set(tags),
+                             current.get(ip, set()) & set(tags))
+
+        results = list(dag.sync({}, tag=self.api.tag))
+        for x in results:
+            self.assertTrue(x.ok, msg=x.error)
+        for ip in ips:
+            self.assertFalse(dag.current.get(ip, set()) & set(tags))
@@ -15,11 +15,11 @@ class _MixinShared:
                     digest_size=length)
         return h.hexdigest()
 
-    def xapi(self):
+    def xapi(self, cls=pan.xapi.PanXapi, **kwargs):
         tag = os.getenv('XAPI_TAG')
         if tag is None:
             raise RuntimeError('no XAPI_TAG in environment')
-        kwargs = {'tag': tag}
+        kwargs['tag'] = tag
 
         x = os.getenv('XAPI_DEBUG')
         if x is not None:
@@ -42,7 +42,7 @@ class _MixinShared:
             handler.setFormatter(formatter)
             logger.addHandler(handler)
 
-        return pan.xapi.PanXapi(**kwargs)
+        return cls(**kwargs)
 
 
 class Mixin(_MixinShared):
@@ -51,3 +51,11 @@ class Mixin(_MixinShared):
 
     def tearDown(self):
         pass
+
+
+class AsyncMixin(_MixinShared):
+    async def asyncSetUp(self):
+        self.api = self.xapi(pan.xapi.AsyncPanXapi)
+
+    async def asyncTearDown(self):
+        self.api.close()